@@ -0,0 +1,105 @@
+import boto3
+import numpy as np
+import pandas as pd
+
+try:
+    from src.common.manifest import load_state, save_state
+except ImportError:
+    from common.manifest import load_state, save_state
+
+DATE_SET_NAME = "dim_date_days.bin"
+
+
+def to_days(values) -> np.ndarray:
+    """Converts dates or timestamps to days since the unix epoch
+
+    Args:
+        values: dates, timestamps or ISO8601 strings
+
+    Returns:
+        np.ndarray: int32 day numbers
+    """
+    return pd.to_datetime(pd.Series(values), format="ISO8601").values.astype("datetime64[D]").astype(np.int32)
+
+
+def load_date_set(client: boto3.client, bucket: str) -> np.ndarray | None:
+    """Reads the sorted day numbers of every date the warehouse dim_date holds
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+
+    Returns:
+        np.ndarray | None: sorted int32 day numbers, or None if the set has not been written yet
+    """
+    body = load_state(client, bucket, DATE_SET_NAME)
+    if body is None:
+        return None
+    return np.frombuffer(body, dtype="<i4")
+
+
+def save_date_set(client: boto3.client, bucket: str, days: np.ndarray) -> str:
+    """Writes the date set as a packed array of little-endian int32 day numbers
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+        days (np.ndarray): sorted day numbers
+
+    Returns:
+        str: the object key
+    """
+    return save_state(client, bucket, DATE_SET_NAME, days.astype("<i4").tobytes())
+
+
+def new_dates(dim_date: pd.DataFrame, days: np.ndarray | None) -> pd.DataFrame:
+    """Keeps only the dim_date rows whose dates are not in the date set
+
+    Args:
+        dim_date (pd.DataFrame): transformed dim_date rows
+        days (np.ndarray | None): sorted day numbers the warehouse holds, None if there is no set yet
+
+    Returns:
+        pd.DataFrame: the new rows
+    """
+    if days is None:
+        return dim_date
+    return dim_date[~np.isin(to_days(dim_date["date_id"]), days)]
+
+
+def add_dates(client: boto3.client, bucket: str, days: np.ndarray, dates) -> np.ndarray:
+    """Adds dates the warehouse has committed to the date set, saving it if any are new
+
+    Overlapping loads can each save the set without the other's dates, which
+    only means those dates are emitted and merged into dim_date once more.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+        days (np.ndarray): the date set, from load_date_set
+        dates: committed dim_date dates
+
+    Returns:
+        np.ndarray: the updated date set
+    """
+    updated = np.union1d(days, to_days(dates)).astype(np.int32)
+    if len(updated) != len(days):
+        save_date_set(client, bucket, updated)
+    return updated
+
+
+def seed_date_set(conn, client: boto3.client, bucket: str) -> np.ndarray:
+    """Builds the date set from the dates already in the warehouse and saves it
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+
+    Returns:
+        np.ndarray: sorted day numbers
+    """
+    rows = conn.run("SELECT date_id FROM dim_date")
+    days = np.unique(to_days([row[0] for row in rows])) if rows else np.array([], dtype=np.int32)
+    save_date_set(client, bucket, days)
+    return days
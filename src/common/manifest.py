@@ -0,0 +1,163 @@
+import json
+import os
+import uuid
+import boto3
+import hashlib
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+try:
+    from src.common.object_store import get_body, get_bodies, put_body, list_objects
+except ImportError:
+    from common.object_store import get_body, get_bodies, put_body, list_objects
+
+
+STATE_PREFIX = "_state/"
+MANIFEST_HISTORY = int(os.getenv("MANIFEST_HISTORY", "1000"))
+
+
+def is_internal_key(key: str) -> bool:
+    """Checks whether an object key holds pipeline state rather than table data
+
+    Keys starting with an underscore (manifests, indexes, dead letters) are
+    written by the pipeline itself and are skipped by every event handler.
+
+    Args:
+        key (str): s3 object key
+
+    Returns:
+        bool: True for internal keys
+    """
+    return key.startswith("_")
+
+
+def content_hash(body: bytes) -> str:
+    """Returns the sha256 hex digest of some bytes
+
+    Args:
+        body (bytes): content to hash
+
+    Returns:
+        str: hex digest
+    """
+    return hashlib.sha256(body).hexdigest()
+
+
+def load_state(client: boto3.client, bucket: str, name: str) -> bytes | None:
+    """Reads a state object written by save_state
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket holding the state
+        name (str): state object name, relative to STATE_PREFIX
+
+    Returns:
+        bytes | None: the object contents, or None if it has not been written yet
+    """
+    try:
+        return get_body(client, bucket, f"{STATE_PREFIX}{name}")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+
+
+def save_state(client: boto3.client, bucket: str, name: str, body: bytes) -> str:
+    """Writes a state object under STATE_PREFIX
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket holding the state
+        name (str): state object name, relative to STATE_PREFIX
+        body (bytes): object contents
+
+    Returns:
+        str: the object key
+    """
+    return put_body(client, bucket, f"{STATE_PREFIX}{name}", body)
+
+
+class Manifest(dict):
+    """Hashes keyed by table, remembering the state objects it was read from
+
+    Attributes:
+        objects (list[str]): keys of the run objects summed into the manifest
+        run_key (str | None): key of the object this run saves to, set by the first save_manifest
+    """
+
+    def __init__(self, hashes: dict[str, list[str]] = None, objects: list[str] = None):
+        super().__init__(hashes or {})
+        self.objects = list(objects or [])
+        self.run_key = None
+
+
+def load_manifest(client: boto3.client, bucket: str, name: str) -> Manifest:
+    """Reads a hash manifest, mapping each table to the content hashes already processed
+
+    The manifest is the union of the run objects under _state/{name}/, oldest
+    first, and of the single object earlier versions wrote to _state/{name}.json.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket holding the manifest
+        name (str): manifest name
+
+    Returns:
+        Manifest: hashes keyed by table, empty if there is no manifest yet
+    """
+    prefix = f"{STATE_PREFIX}{name}"
+    keys = [
+        item["Key"] for item in list_objects(client, bucket, prefix)
+        if item["Key"] == f"{prefix}.json" or item["Key"].startswith(f"{prefix}/")
+    ]
+    manifest = Manifest(objects=keys)
+    for body in get_bodies(client, bucket, keys):
+        for table, hashes in json.loads(body).items():
+            record_hashes(manifest, table, hashes)
+    return manifest
+
+
+def save_manifest(client: boto3.client, bucket: str, name: str, manifest: dict[str, list[str]]) -> str:
+    """Writes a hash manifest
+
+    Runs of a function can overlap, so a run never rewrites an object another
+    run may be writing. It saves the whole manifest to an object of its own,
+    overwritten by its later saves, then deletes the objects the manifest was
+    read from, which the new object holds. Objects saved by a concurrent run
+    since the manifest was read are left for the next load_manifest to sum.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket holding the manifest
+        name (str): manifest name
+        manifest (dict[str, list[str]]): hashes keyed by table, a Manifest from load_manifest
+
+    Returns:
+        str: the object key
+    """
+    if not isinstance(manifest, Manifest):
+        manifest = Manifest(manifest)
+    if manifest.run_key is None:
+        started = datetime.now().strftime("%Y/%m/%d/%H_%M_%S")
+        manifest.run_key = f"{name}/{started}-{uuid.uuid4().hex}.json"
+    key = save_state(client, bucket, manifest.run_key, json.dumps(manifest).encode("utf-8"))
+    superseded = [object_key for object_key in manifest.objects if object_key != key]
+    for i in range(0, len(superseded), 1000):
+        client.delete_objects(
+            Bucket=bucket, Delete={"Objects": [{"Key": old} for old in superseded[i:i + 1000]], "Quiet": True}
+        )
+    manifest.objects = [key]
+    return key
+
+
+def record_hashes(manifest: dict[str, list[str]], table: str, hashes: list[str]) -> None:
+    """Adds hashes to a table's manifest entry, keeping only the most recent MANIFEST_HISTORY
+
+    Args:
+        manifest (dict[str, list[str]]): hashes keyed by table
+        table (str): table name
+        hashes (list[str]): hashes to add
+    """
+    seen = manifest.setdefault(table, [])
+    seen.extend(h for h in hashes if h not in seen)
+    del seen[:-MANIFEST_HISTORY]
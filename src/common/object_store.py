@@ -0,0 +1,204 @@
+import io
+import os
+import boto3
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+
+MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+MAX_RETRY_ATTEMPTS = int(os.getenv("S3_MAX_RETRY_ATTEMPTS", "8"))
+MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+BATCH_WORKERS = int(os.getenv("S3_BATCH_WORKERS", "16"))
+
+CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    retries={"max_attempts": MAX_RETRY_ATTEMPTS, "mode": "adaptive"},
+)
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+    max_concurrency=min(MAX_POOL_CONNECTIONS, 10),
+)
+
+
+@functools.cache
+def get_s3_client() -> boto3.client:
+    """Returns the s3 client shared by every handler in the container
+
+    The client is created once with a connection pool sized for the batch
+    helpers below and adaptive retries, so warm invocations reuse it.
+
+    Returns:
+        boto3.client: s3 client
+    """
+    return boto3.client("s3", config=CLIENT_CONFIG)
+
+
+def put_body(client: boto3.client, bucket: str, key: str, body: bytes) -> str:
+    """Puts bytes in s3 bucket, using a multipart upload for large bodies
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): name of bucket
+        key (str): object key
+        body (bytes): object contents
+
+    Returns:
+        str: the object key
+    """
+    if len(body) >= MULTIPART_THRESHOLD:
+        client.upload_fileobj(io.BytesIO(body), bucket, key, Config=TRANSFER_CONFIG)
+    else:
+        client.put_object(Bucket=bucket, Key=key, Body=body)
+    return key
+
+
+def put_file(client: boto3.client, bucket: str, key: str, file_path: str) -> str:
+    """Uploads a local file to s3, using a multipart upload for large files
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): name of bucket
+        key (str): object key
+        file_path (str): path of the local file
+
+    Returns:
+        str: the object key
+    """
+    client.upload_file(file_path, bucket, key, Config=TRANSFER_CONFIG)
+    return key
+
+
+def get_body(client: boto3.client, bucket: str, key: str, byte_range: tuple[int, int] = None) -> bytes:
+    """Gets the contents of an s3 object, optionally only a byte range of it
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): name of bucket
+        key (str): object key
+        byte_range (tuple[int, int], optional): inclusive (start, end) offsets to read
+
+    Returns:
+        bytes: object contents
+    """
+    if byte_range is None:
+        response = client.get_object(Bucket=bucket, Key=key)
+    else:
+        start, end = byte_range
+        response = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+    return response["Body"].read()
+
+
+def get_bodies(client: boto3.client, bucket: str, keys: list[str], max_workers: int = None) -> list[bytes]:
+    """Gets the contents of many s3 objects concurrently
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): name of bucket
+        keys (list[str]): object keys
+        max_workers (int, optional): number of concurrent requests
+
+    Returns:
+        list[bytes]: object contents in the same order as keys
+    """
+    if len(keys) <= 1:
+        return [get_body(client, bucket, key) for key in keys]
+    workers = min(max_workers or BATCH_WORKERS, len(keys))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda key: get_body(client, bucket, key), keys))
+
+
+def put_bodies(
+    client: boto3.client, bucket: str, items: dict[str, bytes], max_workers: int = None
+) -> list[str]:
+    """Puts many objects in s3 bucket concurrently
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): name of bucket
+        items (dict[str, bytes]): object contents keyed by object key
+        max_workers (int, optional): number of concurrent requests
+
+    Returns:
+        list[str]: the object keys
+    """
+    if len(items) <= 1:
+        return [put_body(client, bucket, key, body) for key, body in items.items()]
+    workers = min(max_workers or BATCH_WORKERS, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda item: put_body(client, bucket, *item), items.items()))
+
+
+def list_objects(client: boto3.client, bucket: str, prefix: str) -> list[dict]:
+    """Lists every object under a prefix, following continuation tokens
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): name of bucket
+        prefix (str): key prefix
+
+    Returns:
+        list[dict]: object summaries with Key, LastModified and Size
+    """
+    paginator = client.get_paginator("list_objects_v2")
+    objects = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        objects.extend(page.get("Contents", []))
+    return objects
+
+
+class RangedObject(io.RawIOBase):
+    """Seekable read-only view of an s3 object that fetches only the byte ranges read
+
+    Parquet readers seek to the footer and then to the row groups they need,
+    so wrapping an object in this reads just those parts of it.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): name of bucket
+        key (str): object key
+        size (int, optional): object size in bytes, fetched with a HEAD request by default
+    """
+
+    def __init__(self, client: boto3.client, bucket: str, key: str, size: int = None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size if size is not None else client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.position = 0
+        self.requests = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        end = self.size if size is None or size < 0 else min(self.size, self.position + size)
+        if end <= self.position:
+            return b""
+        data = get_body(self.client, self.bucket, self.key, (self.position, end - 1))
+        self.position += len(data)
+        self.requests += 1
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
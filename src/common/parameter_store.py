@@ -0,0 +1,119 @@
+import os
+import time
+import boto3
+import functools
+from botocore.exceptions import ClientError
+
+
+PARAMETER_CACHE_TTL = float(os.getenv("PARAMETER_CACHE_TTL", "300"))
+GET_PARAMETERS_LIMIT = 10
+# Watermarks move with every run, possibly in another container, so they are always fetched.
+# Only values that rarely change, such as bucket names and credentials, are cached
+UNCACHED_PARAMETERS = {"lambda_last_run", "load_last_run"}
+
+_cache: dict[str, tuple[str, float]] = {}
+
+
+@functools.cache
+def get_ssm_client() -> boto3.client:
+    """Returns the ssm client shared by every handler in the container
+
+    Returns:
+        boto3.client: ssm client
+    """
+    return boto3.client("ssm")
+
+
+def _cached(parameter_name: str, ttl: float) -> str | None:
+    entry = _cache.get(parameter_name)
+    if entry is None:
+        return None
+    value, fetched_at = entry
+    if time.monotonic() - fetched_at > ttl:
+        del _cache[parameter_name]
+        return None
+    return value
+
+
+def get_parameter(client: boto3.client, parameter_name: str, ttl: float = None) -> str:
+    """gets parameter from parameter store, using the container's cache when fresh
+
+    Args:
+        client (boto3.client): ssm_client
+        parameter_name (str): parameter name
+        ttl (float, optional): seconds a cached value stays valid, defaults to PARAMETER_CACHE_TTL
+
+    Raises:
+        ClientError: raised when the parameter does not exist
+
+    Returns:
+        str: parameter value
+    """
+    return get_parameters(client, [parameter_name], ttl)[parameter_name]
+
+
+def get_parameters(client: boto3.client, parameter_names: list[str], ttl: float = None) -> dict[str, str]:
+    """gets several parameters from parameter store in as few calls as possible
+
+    Values still in the cache are returned without a call, the rest are
+    fetched with batched get_parameters requests and cached. Parameters in
+    UNCACHED_PARAMETERS are fetched every time and never cached.
+
+    Args:
+        client (boto3.client): ssm_client
+        parameter_names (list[str]): parameter names
+        ttl (float, optional): seconds a cached value stays valid, defaults to PARAMETER_CACHE_TTL
+
+    Raises:
+        ClientError: raised when any of the parameters do not exist
+
+    Returns:
+        dict[str, str]: parameter values keyed by name
+    """
+    ttl = PARAMETER_CACHE_TTL if ttl is None else ttl
+    values = {}
+    missing = []
+    for name in dict.fromkeys(parameter_names):
+        value = None if name in UNCACHED_PARAMETERS else _cached(name, ttl)
+        if value is None:
+            missing.append(name)
+        else:
+            values[name] = value
+
+    for i in range(0, len(missing), GET_PARAMETERS_LIMIT):
+        batch = missing[i:i + GET_PARAMETERS_LIMIT]
+        result = client.get_parameters(Names=batch)
+        if result["InvalidParameters"]:
+            raise ClientError(
+                {
+                    "Error": {
+                        "Code": "ParameterNotFound",
+                        "Message": f"Parameters not found: {', '.join(result['InvalidParameters'])}",
+                    }
+                },
+                "GetParameters",
+            )
+        fetched_at = time.monotonic()
+        for parameter in result["Parameters"]:
+            values[parameter["Name"]] = parameter["Value"]
+            if parameter["Name"] not in UNCACHED_PARAMETERS:
+                _cache[parameter["Name"]] = (parameter["Value"], fetched_at)
+
+    return values
+
+
+def set_parameter(client: boto3.client, parameter_name: str, value: str) -> None:
+    """puts parameter in parameter store and invalidates its cached value
+
+    Args:
+        client (boto3.client): ssm_client
+        parameter_name (str): parameter name
+        value (str): parameter value
+    """
+    client.put_parameter(Name=parameter_name, Value=value, Overwrite=True, Type="String")
+    _cache.pop(parameter_name, None)
+
+
+def clear_parameter_cache() -> None:
+    """Removes every cached parameter value"""
+    _cache.clear()
@@ -0,0 +1,176 @@
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import random
+import logging
+import cProfile
+import functools
+import tracemalloc
+import contextlib
+from datetime import datetime
+
+try:
+    from src.common.object_store import get_s3_client, put_body
+except ImportError:
+    from common.object_store import get_s3_client, put_body
+
+logger = logging.getLogger(__name__)
+
+# "on" profiles a PROFILE_SAMPLE_RATE share of invocations, an event with "profile": true is always profiled
+PROFILE_HANDLERS = os.getenv("PROFILE_HANDLERS", "off")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "20"))
+# A local directory or an s3://bucket/prefix location
+PROFILE_LOCATION = os.getenv("PROFILE_LOCATION", "/tmp/profiles")  # nosec
+
+_sections = None
+
+
+def should_profile(event) -> bool:
+    """Decides whether an invocation is profiled, from its event flag or the sample rate
+
+    Args:
+        event: the handler event
+
+    Returns:
+        bool: True if the invocation should be profiled
+    """
+    if isinstance(event, dict) and event.get("profile"):
+        return True
+    return PROFILE_HANDLERS == "on" and random.random() < PROFILE_SAMPLE_RATE  # nosec
+
+
+@contextlib.contextmanager
+def profile_section(name: str):
+    """Records the wall time and allocations of a block, usually one table, in the running profile
+
+    Does nothing when the invocation is not being profiled.
+
+    Args:
+        name (str): section name, the table being processed
+    """
+    if _sections is None:
+        yield
+        return
+    start = time.perf_counter()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    try:
+        yield
+    finally:
+        section = _sections.setdefault(name, {"calls": 0, "seconds": 0.0, "allocated_bytes": 0})
+        section["calls"] += 1
+        section["seconds"] += time.perf_counter() - start
+        section["allocated_bytes"] += tracemalloc.get_traced_memory()[0] - memory_before
+
+
+def build_report(
+    name: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot, peak: int, seconds: float
+) -> dict:
+    """Summarises a profiled invocation as its top functions, top allocation sites and sections
+
+    Args:
+        name (str): handler name
+        profiler (cProfile.Profile): the stopped profiler
+        snapshot (tracemalloc.Snapshot): allocations at the end of the invocation
+        peak (int): peak traced memory in bytes
+        seconds (float): wall time
+
+    Returns:
+        dict: the report
+    """
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_N]
+    return {
+        "handler": name,
+        "seconds": round(seconds, 4),
+        "peak_bytes": peak,
+        "functions": [
+            {
+                "function": f"{path}:{line}({function})",
+                "calls": calls,
+                "own_seconds": round(own, 4),
+                "cumulative_seconds": round(cumulative, 4),
+            }
+            for (path, line, function), (_, calls, own, cumulative, _) in functions
+        ],
+        "allocations": [
+            {"site": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP_N]
+        ],
+        "sections": {
+            section: {**values, "seconds": round(values["seconds"], 4)}
+            for section, values in _sections.items()
+        },
+    }
+
+
+def write_report(report: dict, name: str, request_id: str) -> str:
+    """Writes a report as compact json to PROFILE_LOCATION
+
+    Args:
+        report (dict): the report
+        name (str): handler name
+        request_id (str): invocation id, part of the file name
+
+    Returns:
+        str: the path or s3 uri written
+    """
+    file_name = f"{name}/{datetime.now().strftime('%Y/%m/%d/%H_%M_%S')}-{request_id}.json"
+    body = json.dumps(report, separators=(",", ":")).encode("utf-8")
+    if PROFILE_LOCATION.startswith("s3://"):
+        bucket, _, prefix = PROFILE_LOCATION[len("s3://"):].partition("/")
+        key = f"{prefix.rstrip('/')}/{file_name}" if prefix else file_name
+        put_body(get_s3_client(), bucket, key, body)
+        return f"s3://{bucket}/{key}"
+    path = os.path.join(PROFILE_LOCATION, file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(body)
+    return path
+
+
+def profiled(handler):
+    """Wraps a Lambda handler so sampled or flagged invocations run under cProfile and tracemalloc
+
+    The report is written once the handler returns or raises. Profiling never
+    changes the handler's result, and a report that cannot be written is only
+    logged. Invocations are not profiled while another profiler is active.
+    """
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _sections
+        if not should_profile(event) or sys.getprofile() is not None or _sections is not None:
+            return handler(event, context)
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        _sections = {}
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return handler(event, context)
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            try:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                report = build_report(name, profiler, snapshot, peak, seconds)
+                request_id = getattr(context, "aws_request_id", None) or f"{os.getpid()}"
+                logger.info(f"Wrote profile of {name} to {write_report(report, name, request_id)}")
+            except Exception as e:
+                logger.warning(f"Could not write profile of {name}: {e}")
+            finally:
+                _sections = None
+                if started_tracing:
+                    tracemalloc.stop()
+
+    return wrapper
@@ -0,0 +1,243 @@
+import json
+import uuid
+import boto3
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+try:
+    from src.common.manifest import STATE_PREFIX, load_state, save_state
+    from src.common.object_store import get_bodies, list_objects
+except ImportError:
+    from common.manifest import STATE_PREFIX, load_state, save_state
+    from common.object_store import get_bodies, list_objects
+
+# Fact tables reconciled against their source table, by natural key and an amount column
+RECONCILED_TABLES = {
+    "fact_sales_order": {"source": "sales_order", "key": "sales_order_id", "amount": "units_sold"},
+    "fact_payment": {"source": "payment", "key": "payment_id", "amount": "payment_amount"},
+    "fact_purchase_order": {
+        "source": "purchase_order", "key": "purchase_order_id", "amount": "item_quantity"
+    },
+}
+SOURCE_TABLES = {spec["source"]: table for table, spec in RECONCILED_TABLES.items()}
+STAGES = ["source", "processed", "warehouse"]
+# Ledgers are kept under _state/reconciliation/. Runs add to the source and processed ledgers, while the
+# warehouse ledger is a snapshot of the warehouse tables that replaces the last one
+LEDGER_PREFIX = "reconciliation/"
+SNAPSHOT_STAGES = ["warehouse"]
+
+# Keys are mixed as ((key * A + B) mod P)^2 mod P, which numpy and Postgres both compute exactly in int64
+KEY_HASH_MULTIPLIER = 2654435761
+KEY_HASH_OFFSET = 40503
+KEY_HASH_MODULUS = 2147483647
+
+_ledger_lock = threading.Lock()
+
+
+def key_hashes(keys: pd.Series) -> np.ndarray:
+    """Hashes integer keys so their sum is an order-independent fingerprint of the key set
+
+    Args:
+        keys (pd.Series): natural keys
+
+    Returns:
+        np.ndarray: one int64 hash below KEY_HASH_MODULUS per key
+    """
+    mixed = (keys.to_numpy(dtype="int64") * KEY_HASH_MULTIPLIER + KEY_HASH_OFFSET) % KEY_HASH_MODULUS
+    return mixed * mixed % KEY_HASH_MODULUS
+
+
+def aggregate(df: pd.DataFrame, table: str, date_column: str = "created_date") -> dict[str, list]:
+    """Computes the row count, amount sum and key hash of each day of a table's rows
+
+    Amounts are rounded to cents per row, as the transform rounds them.
+
+    Args:
+        df (pd.DataFrame): source rows or fact rows
+        table (str): fact table name, a key of RECONCILED_TABLES
+        date_column (str, optional): column the day is taken from, created_at for source rows
+
+    Returns:
+        dict[str, list]: [rows, amount, key hash] by YYYY-MM-DD day
+    """
+    spec = RECONCILED_TABLES[table]
+    if df.empty:
+        return {}
+    # Rows are grouped by their distinct dates, datetimes or ISO strings, and only those are formatted as days
+    codes, values = pd.factorize(df[date_column], use_na_sentinel=False)
+    frame = pd.DataFrame({
+        "code": codes,
+        "amount": pd.to_numeric(df[spec["amount"]]).astype("float64").round(2).to_numpy(),
+        "key_hash": key_hashes(df[spec["key"]]),
+    })
+    grouped = frame.groupby("code").agg(
+        rows=("amount", "size"), amount=("amount", "sum"), key_hash=("key_hash", "sum")
+    )
+    grouped = grouped.groupby([str(values[code])[:10] for code in grouped.index]).sum()
+    columns = zip(grouped.index, grouped["rows"], grouped["amount"], grouped["key_hash"])
+    return {
+        day: [int(rows), round(float(amount), 2), int(key_hash)]
+        for day, rows, amount, key_hash in columns
+    }
+
+
+def add_aggregates(ledger: dict, table: str, aggregates: dict[str, list]) -> None:
+    """Adds aggregates to a stage ledger, which sums them per day
+
+    Counts, amounts and key hashes are all additive, so runs and files can be
+    added in any order. Safe to call from several threads.
+
+    Args:
+        ledger (dict): stage ledger, updated in place
+        table (str): fact table name
+        aggregates (dict[str, list]): [rows, amount, key hash] by day
+    """
+    with _ledger_lock:
+        days = ledger.setdefault(table, {})
+        for day, (rows, amount, key_hash) in aggregates.items():
+            total = days.get(day, [0, 0.0, 0])
+            days[day] = [total[0] + rows, round(total[1] + amount, 2), total[2] + key_hash]
+
+
+def add_frame(ledger: dict, table: str, df: pd.DataFrame) -> None:
+    """Adds the aggregates of transformed fact rows to a ledger, for reconciled tables only
+
+    Args:
+        ledger (dict): stage ledger, updated in place
+        table (str): output table name
+        df (pd.DataFrame): rows of the table
+    """
+    if table in RECONCILED_TABLES:
+        add_aggregates(ledger, table, aggregate(df, table))
+
+
+def reconciled_columns(table: str) -> list[str]:
+    """Returns the columns a fact table's aggregates are computed from"""
+    spec = RECONCILED_TABLES[table]
+    return ["created_date", spec["key"], spec["amount"]]
+
+
+def add_source_rows(ledger: dict, source_table: str, rows: list[dict]) -> None:
+    """Adds the aggregates of extracted rows to the source ledger, for reconciled tables only
+
+    Args:
+        ledger (dict): source ledger, updated in place
+        source_table (str): source table name
+        rows (list[dict]): rows from get_data
+    """
+    table = SOURCE_TABLES.get(source_table)
+    if table is None or not rows:
+        return
+    spec = RECONCILED_TABLES[table]
+    df = pd.DataFrame(rows, columns=["created_at", spec["key"], spec["amount"]])
+    add_aggregates(ledger, table, aggregate(df, table, "created_at"))
+
+
+def load_ledger(client: boto3.client, bucket: str, stage: str) -> dict:
+    """Reads a stage ledger, summing the additions of every run
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket holding the ledger
+        stage (str): one of STAGES
+
+    Returns:
+        dict: [rows, amount, key hash] by table and day
+    """
+    if stage in SNAPSHOT_STAGES:
+        body = load_state(client, bucket, f"{LEDGER_PREFIX}{stage}.json")
+        return json.loads(body) if body else {}
+    keys = [item["Key"] for item in list_objects(client, bucket, f"{STATE_PREFIX}{LEDGER_PREFIX}{stage}/")]
+    ledger = {}
+    for body in get_bodies(client, bucket, keys):
+        for table, days in json.loads(body).items():
+            add_aggregates(ledger, table, days)
+    return ledger
+
+
+def save_ledger(client: boto3.client, bucket: str, stage: str, ledger: dict) -> str | None:
+    """Writes a run's additions to a stage ledger as compact json
+
+    Runs of a function can overlap, so each run writes its additions to an
+    object of its own rather than rewriting a shared ledger that a
+    concurrent run would overwrite, and load_ledger sums them. A snapshot
+    stage is written whole to one object.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket holding the ledger
+        stage (str): one of STAGES
+        ledger (dict): [rows, amount, key hash] by table and day, added by this run
+
+    Returns:
+        str | None: the object key, None when a run had nothing to add
+    """
+    if stage in SNAPSHOT_STAGES:
+        name = f"{LEDGER_PREFIX}{stage}.json"
+    elif not ledger:
+        return None
+    else:
+        started = datetime.now().strftime("%Y/%m/%d/%H_%M_%S")
+        name = f"{LEDGER_PREFIX}{stage}/{started}-{uuid.uuid4().hex}.json"
+    body = json.dumps(ledger, separators=(",", ":")).encode("utf-8")
+    return save_state(client, bucket, name, body)
+
+
+def warehouse_aggregates(conn, table: str) -> dict[str, list]:
+    """Computes the daily aggregates of a fact table in the warehouse, in one query
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        table (str): fact table name
+
+    Returns:
+        dict[str, list]: [rows, amount, key hash] by day
+    """
+    spec = RECONCILED_TABLES[table]
+    mixed = (
+        f"(({spec['key']}::bigint * {KEY_HASH_MULTIPLIER} + {KEY_HASH_OFFSET}) % {KEY_HASH_MODULUS})"
+    )
+    rows = conn.run(
+        f"SELECT created_date::text, count(*), sum(round({spec['amount']}::numeric, 2)), "  # nosec
+        f"sum({mixed} * {mixed} % {KEY_HASH_MODULUS}) FROM {table} GROUP BY created_date"
+    )
+    return {
+        day: [int(count), round(float(amount or 0), 2), int(key_hash)]
+        for day, count, amount, key_hash in rows
+    }
+
+
+def matches(expected: list, actual: list) -> bool:
+    """Checks whether two [rows, amount, key hash] aggregates agree, amounts to the cent"""
+    return expected[0] == actual[0] and expected[2] == actual[2] and abs(expected[1] - actual[1]) < 0.01
+
+
+def reconcile(ledgers: dict[str, dict], tables: list[str]) -> list[dict]:
+    """Compares the stage ledgers of each table day by day
+
+    Each stage is compared with the stage before it, so a mismatch is reported
+    at the stage where the rows went missing or changed.
+
+    Args:
+        ledgers (dict[str, dict]): ledgers by stage, in STAGES order
+        tables (list[str]): fact tables to reconcile
+
+    Returns:
+        list[dict]: one entry per table, day and stage that does not match the stage before it
+    """
+    stages = [stage for stage in STAGES if stage in ledgers]
+    mismatches = []
+    for table in tables:
+        days = sorted(set().union(*(ledgers[stage].get(table, {}) for stage in stages)))
+        for day in days:
+            for previous, stage in zip(stages, stages[1:]):
+                expected = ledgers[previous].get(table, {}).get(day, [0, 0.0, 0])
+                actual = ledgers[stage].get(table, {}).get(day, [0, 0.0, 0])
+                if not matches(expected, actual):
+                    mismatches.append(
+                        {"table": table, "day": day, "stage": stage, "expected": expected, "actual": actual}
+                    )
+                    break
+    return mismatches
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import uuid
+import logging
+import resource
+import functools
+from datetime import datetime
+
+try:
+    from src.common.object_store import get_s3_client, get_bodies, list_objects, put_body
+except ImportError:
+    from common.object_store import get_s3_client, get_bodies, list_objects, put_body
+
+logger = logging.getLogger(__name__)
+
+# A local directory or an s3://bucket/prefix location, runs are not recorded when unset
+RUN_HISTORY_LOCATION = os.getenv("RUN_HISTORY_LOCATION", "")
+
+_volumes = None
+# Invocations recorded by this process, Lambda reuses it for warm starts
+_invocations = 0
+
+
+def record_volume(table: str, rows: int = 0, size: int = 0) -> None:
+    """Adds rows and bytes handled for a table to the running invocation's record
+
+    Does nothing outside a recorded invocation.
+
+    Args:
+        table (str): table name
+        rows (int, optional): number of rows
+        size (int, optional): number of bytes
+    """
+    if _volumes is None:
+        return
+    volume = _volumes.setdefault(table, {"rows": 0, "bytes": 0})
+    volume["rows"] += int(rows)
+    volume["bytes"] += int(size)
+
+
+def peak_memory_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Returns the peak resident memory in MB, from resource.getrusage
+
+    The peak is over the life of the process, not one invocation. For
+    RUSAGE_CHILDREN it is the peak of the largest worker process waited for.
+
+    Args:
+        who (int, optional): resource.RUSAGE_SELF, or resource.RUSAGE_CHILDREN for worker processes
+    """
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def cpu_seconds() -> float:
+    """Returns the user and system CPU time used by the process and its finished workers so far"""
+    usage = [resource.getrusage(who) for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]]
+    return sum(part.ru_utime + part.ru_stime for part in usage)
+
+
+def split_location(location: str) -> tuple[str | None, str]:
+    """Splits a history location into its bucket, None for a local directory, and its path"""
+    if location.startswith("s3://"):
+        bucket, _, prefix = location[len("s3://"):].partition("/")
+        return bucket, prefix.rstrip("/")
+    return None, location
+
+
+def save_run(run: dict, location: str = None) -> str:
+    """Writes one run as a compact json object named by its function and start time
+
+    Args:
+        run (dict): the run, as built by recorded
+        location (str, optional): history location, defaults to RUN_HISTORY_LOCATION
+
+    Returns:
+        str: the path or s3 uri written
+    """
+    bucket, path = split_location(location or RUN_HISTORY_LOCATION)
+    started = datetime.fromisoformat(run["started_at"]).strftime("%Y/%m/%d/%H_%M_%S")
+    name = f"{run['function']}/{started}-{uuid.uuid4().hex[:8]}.json"
+    body = json.dumps(run, separators=(",", ":")).encode("utf-8")
+    if bucket is not None:
+        key = f"{path}/{name}" if path else name
+        put_body(get_s3_client(), bucket, key, body)
+        return f"s3://{bucket}/{key}"
+    file_path = os.path.join(path, name)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as file:
+        file.write(body)
+    return file_path
+
+
+def load_runs(location: str, function: str = None) -> list[dict]:
+    """Reads recorded runs, oldest first
+
+    Args:
+        location (str): a local directory or an s3://bucket/prefix location
+        function (str, optional): only read the runs of this function
+
+    Returns:
+        list[dict]: the runs
+    """
+    bucket, path = split_location(location)
+    if function:
+        path = f"{path}/{function}" if path else function
+    if bucket is not None:
+        client = get_s3_client()
+        keys = [item["Key"] for item in list_objects(client, bucket, f"{path}/" if path else "")]
+        bodies = get_bodies(client, bucket, keys)
+    else:
+        bodies = []
+        for root, _, files in os.walk(path):
+            for name in files:
+                if name.endswith(".json"):
+                    with open(os.path.join(root, name), "rb") as file:
+                        bodies.append(file.read())
+    return sorted((json.loads(body) for body in bodies), key=lambda run: run["started_at"])
+
+
+def recorded(function: str):
+    """Records each invocation of a Lambda handler to the run history
+
+    A run holds the rows and bytes handled per table, the duration, CPU time
+    and peak memory of the invocation and its worker processes, and the memory
+    and timeout it was given. Peak memory is kept over the life of the process,
+    so warm starts are marked, as their peak may belong to an earlier invocation.
+    Runs are only recorded when RUN_HISTORY_LOCATION is set, and a run that
+    cannot be written is only logged.
+
+    Args:
+        function (str): name the runs are recorded under
+    """
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _volumes, _invocations
+            if not RUN_HISTORY_LOCATION or _volumes is not None:
+                return handler(event, context)
+
+            _volumes = {}
+            warm_start = _invocations > 0
+            _invocations += 1
+            started_at = datetime.now()
+            start = time.perf_counter()
+            cpu_start = cpu_seconds()
+            remaining = getattr(context, "get_remaining_time_in_millis", None)
+            timeout = round(remaining() / 1000) if callable(remaining) else None
+            try:
+                return handler(event, context)
+            finally:
+                run = {
+                    "function": function,
+                    "started_at": started_at.isoformat(),
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "cpu_seconds": round(cpu_seconds() - cpu_start, 3),
+                    "peak_memory_mb": peak_memory_mb(),
+                    "child_peak_memory_mb": peak_memory_mb(resource.RUSAGE_CHILDREN),
+                    "warm_start": warm_start,
+                    "memory_limit_mb": int(getattr(context, "memory_limit_in_mb", 0) or 0) or None,
+                    "timeout_seconds": timeout,
+                    "tables": _volumes,
+                }
+                _volumes = None
+                try:
+                    save_run(run)
+                except Exception as e:
+                    logger.warning(f"Could not record run of {function}: {e}")
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,219 @@
+"""
+Recommends memory and timeout settings for each Lambda function from its recorded runs.
+
+    python -m src.common.sizing s3://processing-bucket/_run_history --horizon-days 90
+
+Duration and peak memory are fitted against the bytes a run handles, each
+table's bytes per run are fitted against time, and the fits are evaluated at
+the volumes projected for the end of the horizon. Peak memory is only fitted
+on cold starts, whose peak is their own, when the history has any.
+"""
+import sys
+import math
+import argparse
+from datetime import datetime, timedelta
+
+try:
+    from src.common.run_history import load_runs
+except ImportError:
+    from common.run_history import load_runs
+
+MEMORY_HEADROOM = 1.5
+TIMEOUT_HEADROOM = 2.0
+MIN_MEMORY_MB = 128
+MAX_MEMORY_MB = 10240
+MAX_TIMEOUT_SECONDS = 900
+# Lambda gives a function one full vCPU at this memory size, and CPU in proportion below it
+FULL_VCPU_MEMORY_MB = 1769
+
+
+def fit_line(xs: list[float], ys: list[float]) -> tuple[float, float]:
+    """Fits y = intercept + slope * x by least squares
+
+    With too few distinct x values the line is fitted through the origin
+    instead. Negative slopes and intercepts are clipped to zero, so noisy
+    history never predicts that more data costs less.
+
+    Returns:
+        tuple[float, float]: intercept and slope
+    """
+    n = len(xs)
+    if n == 0:
+        return 0.0, 0.0
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    if n < 2 or spread == 0:
+        return (0.0, mean_y / mean_x) if mean_x else (mean_y, 0.0)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+    slope = max(slope, 0.0)
+    return max(mean_y - slope * mean_x, 0.0), slope
+
+
+def project_tables(runs: list[dict], at: datetime) -> dict[str, dict]:
+    """Projects the bytes per run of each table to a date from its trend
+
+    Args:
+        runs (list[dict]): recorded runs of one function
+        at (datetime): date to project to
+
+    Returns:
+        dict[str, dict]: per table, the bytes now, the projected bytes and the growth in bytes per day
+    """
+    origin = datetime.fromisoformat(runs[0]["started_at"])
+    series = {}
+    for run in runs:
+        days = (datetime.fromisoformat(run["started_at"]) - origin).total_seconds() / 86400
+        for table, volume in run["tables"].items():
+            series.setdefault(table, ([], []))
+            series[table][0].append(days)
+            series[table][1].append(volume["bytes"])
+
+    projections = {}
+    for table, (days, sizes) in series.items():
+        intercept, slope = fit_line(days, sizes) if len(set(days)) > 1 else (max(sizes), 0.0)
+        now = max(intercept + slope * days[-1], sizes[-1])
+        horizon = (at - origin).total_seconds() / 86400
+        projections[table] = {
+            "bytes": now,
+            "projected_bytes": max(intercept + slope * horizon, max(sizes)),
+            "bytes_per_day": slope,
+        }
+    return projections
+
+
+def cpu_scale(recorded_memory: int | None, memory: int) -> float:
+    """Returns how much longer CPU work takes at one memory size than at the recorded one"""
+    if not recorded_memory:
+        return 1.0
+    return min(recorded_memory, FULL_VCPU_MEMORY_MB) / min(memory, FULL_VCPU_MEMORY_MB)
+
+
+def run_memory_mb(run: dict) -> float:
+    """Returns the memory a run used, its own peak plus that of its largest worker process"""
+    return run["peak_memory_mb"] + (run.get("child_peak_memory_mb") or 0)
+
+
+def size_function(runs: list[dict], horizon_days: int, now: datetime = None) -> dict:
+    """Recommends memory and timeout for one function and flags tables that will outgrow Lambda
+
+    The CPU share of a run's duration scales with the memory it is given, so
+    the timeout is computed for the recommended memory. A table is flagged
+    when its growth alone would take the function past the Lambda maximum
+    timeout or memory within the horizon.
+
+    Args:
+        runs (list[dict]): recorded runs of the function, oldest first
+        horizon_days (int): number of days to project ahead
+        now (datetime, optional): current time, defaults to now
+
+    Returns:
+        dict: the recommendation
+    """
+    now = now or datetime.now()
+    sizes = [sum(volume["bytes"] for volume in run["tables"].values()) for run in runs]
+    duration = fit_line(sizes, [run["seconds"] for run in runs])
+    # A warm start reports the peak of the whole process, which may be an earlier run's
+    cold = [i for i, run in enumerate(runs) if not run.get("warm_start")] or range(len(runs))
+    memory = fit_line([sizes[i] for i in cold], [run_memory_mb(runs[i]) for i in cold])
+    cpu_share = min(sum(run["cpu_seconds"] for run in runs) / (sum(run["seconds"] for run in runs) or 1), 1.0)
+    recorded_memory = runs[-1].get("memory_limit_mb")
+
+    def seconds_at(size: float, memory_mb: int) -> float:
+        seconds = duration[0] + duration[1] * size
+        return seconds * (1 - cpu_share) + seconds * cpu_share * cpu_scale(recorded_memory, memory_mb)
+
+    tables = project_tables(runs, now + timedelta(days=horizon_days))
+    projected = sum(table["projected_bytes"] for table in tables.values())
+    peak = memory[0] + memory[1] * projected
+    memory_mb = min(max(math.ceil(peak * MEMORY_HEADROOM / 64) * 64, MIN_MEMORY_MB), MAX_MEMORY_MB)
+    timeout = min(max(math.ceil(seconds_at(projected, memory_mb) * TIMEOUT_HEADROOM), 3), MAX_TIMEOUT_SECONDS)
+
+    # Largest run the function can handle at the Lambda maximums
+    limits = []
+    if duration[1]:
+        fixed = seconds_at(0, MAX_MEMORY_MB)
+        per_byte = seconds_at(1, MAX_MEMORY_MB) - fixed
+        limits.append(((MAX_TIMEOUT_SECONDS - fixed) / per_byte, "timeout"))
+    if memory[1]:
+        limits.append(((MAX_MEMORY_MB - memory[0]) / memory[1], "memory"))
+
+    flagged = []
+    current = sum(table["bytes"] for table in tables.values())
+    for name, table in sorted(tables.items()):
+        if not table["bytes_per_day"] or not limits:
+            continue
+        budget, limit = min(limits)
+        days = (budget - current) / table["bytes_per_day"]
+        if days <= horizon_days:
+            flagged.append({
+                "table": name,
+                "limit": limit,
+                "breach_date": (now + timedelta(days=max(days, 0))).date().isoformat(),
+            })
+
+    return {
+        "function": runs[-1]["function"],
+        "runs": len(runs),
+        "recorded_memory_mb": recorded_memory,
+        "recorded_timeout_seconds": runs[-1].get("timeout_seconds"),
+        "max_peak_memory_mb": max(run_memory_mb(run) for run in runs),
+        "max_seconds": max(run["seconds"] for run in runs),
+        "projected_bytes": round(projected),
+        "memory_mb": memory_mb,
+        "timeout_seconds": timeout,
+        "flagged_tables": flagged,
+    }
+
+
+def recommend(location: str, horizon_days: int, now: datetime = None) -> list[dict]:
+    """Sizes every function with recorded runs at a history location
+
+    Args:
+        location (str): a local directory or an s3://bucket/prefix location
+        horizon_days (int): number of days to project ahead
+        now (datetime, optional): current time, defaults to now
+
+    Returns:
+        list[dict]: one recommendation per function
+    """
+    by_function = {}
+    for run in load_runs(location):
+        by_function.setdefault(run["function"], []).append(run)
+    return [size_function(runs, horizon_days, now) for _, runs in sorted(by_function.items())]
+
+
+def format_recommendation(recommendation: dict) -> str:
+    """Formats a recommendation as a few lines of text"""
+    lines = [
+        f"{recommendation['function']}: memory {recommendation['memory_mb']} MB, "
+        f"timeout {recommendation['timeout_seconds']} s "
+        f"(recorded {recommendation['recorded_memory_mb']} MB"
+        f" / {recommendation['recorded_timeout_seconds']} s, "
+        f"{recommendation['runs']} runs, peak {recommendation['max_peak_memory_mb']} MB, "
+        f"longest {recommendation['max_seconds']} s)"
+    ]
+    for flag in recommendation["flagged_tables"]:
+        lines.append(
+            f"  {flag['table']} growth reaches the Lambda {flag['limit']} limit by {flag['breach_date']}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recommend Lambda memory and timeout from recorded runs")
+    parser.add_argument("location", help="run history directory or s3://bucket/prefix")
+    parser.add_argument("--horizon-days", type=int, default=90, help="days of growth to size for")
+    args = parser.parse_args(argv)
+
+    recommendations = recommend(args.location, args.horizon_days)
+    if not recommendations:
+        print(f"No runs recorded at {args.location}")
+        return 1
+    for recommendation in recommendations:
+        print(format_recommendation(recommendation))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
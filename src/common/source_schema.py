@@ -0,0 +1,68 @@
+SOURCE_COLUMNS = {
+    "address": [
+        "address_id",
+        "address_line_1",
+        "address_line_2",
+        "district",
+        "city",
+        "postal_code",
+        "country",
+        "phone",
+    ],
+    "design": ["design_id", "design_name", "file_location", "file_name"],
+    "counterparty": ["counterparty_id", "counterparty_legal_name", "legal_address_id"],
+    "sales_order": [
+        "sales_order_id",
+        "created_at",
+        "last_updated",
+        "design_id",
+        "staff_id",
+        "counterparty_id",
+        "units_sold",
+        "unit_price",
+        "currency_id",
+        "agreed_delivery_date",
+        "agreed_payment_date",
+        "agreed_delivery_location_id",
+    ],
+    "transaction": ["transaction_id", "transaction_type", "sales_order_id", "purchase_order_id"],
+    "payment": [
+        "payment_id",
+        "created_at",
+        "last_updated",
+        "transaction_id",
+        "counterparty_id",
+        "payment_amount",
+        "currency_id",
+        "payment_type_id",
+        "paid",
+        "payment_date",
+    ],
+    "purchase_order": [
+        "purchase_order_id",
+        "created_at",
+        "last_updated",
+        "staff_id",
+        "counterparty_id",
+        "item_code",
+        "item_quantity",
+        "item_unit_price",
+        "currency_id",
+        "agreed_delivery_date",
+        "agreed_payment_date",
+        "agreed_delivery_location_id",
+    ],
+    "payment_type": ["payment_type_id", "payment_type_name"],
+    "currency": ["currency_id", "currency_code"],
+    "department": ["department_id", "department_name", "location"],
+    "staff": ["staff_id", "first_name", "last_name", "department_id", "email_address"],
+}
+
+# The first column of every source table is its primary key
+SOURCE_PRIMARY_KEYS = {table: columns[0] for table, columns in SOURCE_COLUMNS.items()}
+
+# Id columns of every source table, namespaced per source by source_config.namespace_ids
+SOURCE_ID_COLUMNS = {
+    table: [column for column in columns if column.endswith("_id")]
+    for table, columns in SOURCE_COLUMNS.items()
+}
@@ -0,0 +1,44 @@
+import re
+
+# Objects of a named source database sit under {table}/source={name}/ in the ingestion bucket and under
+# {table}/transformed/source={name}/ in the processed bucket. The unnamed source keeps the original layout.
+SOURCE_PARTITION = "source="
+SOURCE_KEY = re.compile(r"^[^/]+/(?:transformed/)?source=(?P<source>[^/]+)/")
+
+
+def source_partition(source: str | None) -> str:
+    """Returns the key segment that partitions a source's objects
+
+    Args:
+        source (str | None): source name, None for the unnamed source
+
+    Returns:
+        str: "source={name}/", or "" for the unnamed source
+    """
+    return f"{SOURCE_PARTITION}{source}/" if source else ""
+
+
+def source_of(key: str) -> str | None:
+    """Returns the source an ingested or transformed object came from
+
+    Args:
+        key (str): s3 object key
+
+    Returns:
+        str | None: the source name, None for keys of the unnamed source
+    """
+    match = SOURCE_KEY.match(key or "")
+    return match["source"] if match else None
+
+
+def state_name(name: str, source: str | None) -> str:
+    """Names the state a source keeps apart from other sources, such as its manifest or schedule
+
+    Args:
+        name (str): state name of the unnamed source
+        source (str | None): source name
+
+    Returns:
+        str: name suffixed with the source, or name itself for the unnamed source
+    """
+    return f"{name}_{source}" if source else name
@@ -0,0 +1,154 @@
+PRIMARY_KEYS = {
+    "dim_date": "date_id",
+    "dim_staff": "staff_id",
+    "dim_location": "location_id",
+    "dim_currency": "currency_id",
+    "dim_design": "design_id",
+    "dim_counterparty": "counterparty_id",
+    "dim_transaction": "transaction_id",
+    "dim_payment_type": "payment_type_id",
+    "fact_sales_order": "sales_record_id",
+    "fact_payment": "payment_record_id",
+    "fact_purchase_order": "purchase_record_id",
+}
+
+DIMENSION_TABLES = [table for table in PRIMARY_KEYS if table.startswith("dim_")]
+
+FOREIGN_KEYS = {
+    "fact_sales_order": {
+        "created_date": ("dim_date", "date_id"),
+        "last_updated_date": ("dim_date", "date_id"),
+        "sales_staff_id": ("dim_staff", "staff_id"),
+        "counterparty_id": ("dim_counterparty", "counterparty_id"),
+        "currency_id": ("dim_currency", "currency_id"),
+        "design_id": ("dim_design", "design_id"),
+        "agreed_payment_date": ("dim_date", "date_id"),
+        "agreed_delivery_date": ("dim_date", "date_id"),
+        "agreed_delivery_location_id": ("dim_location", "location_id"),
+    },
+    "fact_payment": {
+        "created_date": ("dim_date", "date_id"),
+        "last_updated_date": ("dim_date", "date_id"),
+        "transaction_id": ("dim_transaction", "transaction_id"),
+        "counterparty_id": ("dim_counterparty", "counterparty_id"),
+        "currency_id": ("dim_currency", "currency_id"),
+        "payment_type_id": ("dim_payment_type", "payment_type_id"),
+        "payment_date": ("dim_date", "date_id"),
+    },
+    "fact_purchase_order": {
+        "created_date": ("dim_date", "date_id"),
+        "last_updated_date": ("dim_date", "date_id"),
+        "staff_id": ("dim_staff", "staff_id"),
+        "counterparty_id": ("dim_counterparty", "counterparty_id"),
+        "currency_id": ("dim_currency", "currency_id"),
+        "agreed_delivery_date": ("dim_date", "date_id"),
+        "agreed_payment_date": ("dim_date", "date_id"),
+        "agreed_delivery_location_id": ("dim_location", "location_id"),
+    },
+}
+
+# A fact row records one version of a source row. Its record id is a surrogate the warehouse assigns,
+# so rows are told apart by the source row's id and the time of the version
+NATURAL_KEYS = {
+    "fact_sales_order": ["sales_order_id", "last_updated_date", "last_updated_time"],
+    "fact_payment": ["payment_id", "last_updated_date", "last_updated_time"],
+    "fact_purchase_order": ["purchase_order_id", "last_updated_date", "last_updated_time"],
+}
+
+INDEXES = {
+    "fact_sales_order": {
+        "fact_sales_order_sales_order_id_idx": ["sales_order_id"],
+        **{f"fact_sales_order_{column}_idx": [column] for column in FOREIGN_KEYS["fact_sales_order"]},
+    },
+    "fact_payment": {
+        "fact_payment_payment_id_idx": ["payment_id"],
+        **{f"fact_payment_{column}_idx": [column] for column in FOREIGN_KEYS["fact_payment"]},
+    },
+    "fact_purchase_order": {
+        "fact_purchase_order_purchase_order_id_idx": ["purchase_order_id"],
+        **{f"fact_purchase_order_{column}_idx": [column] for column in FOREIGN_KEYS["fact_purchase_order"]},
+    },
+}
+
+
+def create_indexes(conn, table: str, concurrently: bool = False) -> None:
+    """Creates the declared non-unique indexes for a table if they do not exist
+
+    Built concurrently, an index does not block writes to the table, but
+    it must be built outside a transaction. An index left invalid by a
+    failed concurrent build is dropped and built again.
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        table (str): warehouse table name
+        concurrently (bool, optional): build with CREATE INDEX CONCURRENTLY. Defaults to False.
+    """
+    option = " CONCURRENTLY" if concurrently else ""
+    for index_name, columns in INDEXES.get(table, {}).items():
+        if concurrently and conn.run(
+            "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:index_name) AND NOT indisvalid",
+            index_name=index_name,
+        ):
+            conn.run(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")  # nosec
+        conn.run(
+            f"CREATE INDEX{option} IF NOT EXISTS {index_name} ON {table} ({', '.join(columns)})"  # nosec
+        )
+
+
+def drop_indexes(conn, table: str, concurrently: bool = False) -> None:
+    """Drops the declared non-unique indexes for a table, ahead of a bulk load
+
+    Dropped concurrently, an index does not take an ACCESS EXCLUSIVE lock
+    that would block readers of the table, but it must be dropped outside
+    a transaction.
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        table (str): warehouse table name
+        concurrently (bool, optional): drop with DROP INDEX CONCURRENTLY. Defaults to False.
+    """
+    option = " CONCURRENTLY" if concurrently else ""
+    for index_name in INDEXES.get(table, {}):
+        conn.run(f"DROP INDEX{option} IF EXISTS {index_name}")  # nosec
+
+
+def create_natural_key(conn, table: str) -> None:
+    """Creates the unique index on a fact table's natural key if it does not exist
+
+    Loads merge fact rows on this index, so it is kept through bulk loads.
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        table (str): fact table name
+    """
+    conn.run(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_natural_key_idx "  # nosec
+        f"ON {table} ({', '.join(NATURAL_KEYS[table])})"
+    )
+
+
+def create_foreign_keys(conn, table: str) -> None:
+    """Adds the declared foreign key constraints for a table
+
+    The constraints are added NOT VALID, so existing rows are not scanned
+    but every new row is checked against its dimension.
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        table (str): warehouse table name
+    """
+    for column, (dimension, key) in FOREIGN_KEYS.get(table, {}).items():
+        conn.run(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey "  # nosec
+            f"FOREIGN KEY ({column}) REFERENCES {dimension} ({key}) NOT VALID"
+        )
+
+
+def analyze(conn, table: str) -> None:
+    """Refreshes the planner statistics for a table after it has been loaded
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        table (str): warehouse table name
+    """
+    conn.run(f"ANALYZE {table}")  # nosec
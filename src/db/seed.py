@@ -1,7 +1,8 @@
 from src.db.connection import connect_to_test_db
+from src.common.warehouse_schema import create_indexes, create_natural_key, create_foreign_keys
 
 
-def seed_db():
+def seed_db(foreign_keys=False):
     db = connect_to_test_db()
     db.run("DROP TABLE if exists fact_sales_order")
     db.run("DROP TABLE if exists dim_date")
@@ -98,4 +99,9 @@ def seed_db():
         counterparty_legal_phone_number VARCHAR\
         )'
     )
+
+    create_indexes(db, "fact_sales_order")
+    create_natural_key(db, "fact_sales_order")
+    if foreign_keys:
+        create_foreign_keys(db, "fact_sales_order")
     db.close()
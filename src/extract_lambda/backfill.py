@@ -0,0 +1,257 @@
+import os
+import json
+import boto3
+import logging
+import datetime
+import contextvars
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from src.extract_lambda.connection import create_conn, close_db_connection
+    from src.extract_lambda.utils import get_data, put_object, remove_unchanged_rows
+    from src.common.manifest import STATE_PREFIX, load_state, save_state, save_manifest, record_hashes
+    from src.common.source_schema import SOURCE_COLUMNS
+    from src.common.reconciliation import add_source_rows
+    from src.common.sources import state_name
+except ImportError:
+    from connection import create_conn, close_db_connection
+    from utils import get_data, put_object, remove_unchanged_rows
+    from common.manifest import STATE_PREFIX, load_state, save_state, save_manifest, record_hashes
+    from common.source_schema import SOURCE_COLUMNS
+    from common.reconciliation import add_source_rows
+    from common.sources import state_name
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_BACKFILL = os.getenv("EXTRACT_BACKFILL", "single")
+EXTRACT_BACKFILL_WINDOW_DAYS = int(os.getenv("EXTRACT_BACKFILL_WINDOW_DAYS", "30"))
+EXTRACT_BACKFILL_WORKERS = int(os.getenv("EXTRACT_BACKFILL_WORKERS", "4"))
+# No new window is started with less time than this left, so running windows can finish and be checkpointed
+EXTRACT_BACKFILL_RESERVE_SECONDS = int(os.getenv("EXTRACT_BACKFILL_RESERVE_SECONDS", "120"))
+CHECKPOINT_NAME = "extract_backfill"
+MANIFEST_NAME = "extract_manifest"
+
+
+def windowed_backfill_enabled() -> bool:
+    """Checks whether a first extract is split into parallel time windows rather than one query per table
+
+    Returns:
+        bool: True when EXTRACT_BACKFILL is "windowed"
+    """
+    return EXTRACT_BACKFILL == "windowed"
+
+
+def first_updated(tables: list[str]) -> dict[str, datetime.datetime | None]:
+    """Finds the earliest last_updated of every table in a single UNION ALL query
+
+    Args:
+        tables (list[str]): names of tables to query
+
+    Returns:
+        dict[str, datetime.datetime | None]: earliest last_updated by table, None for empty tables
+    """
+    conn = None
+    try:
+        conn = create_conn()
+        selects = [f"SELECT '{table}', min(last_updated) FROM {table}" for table in tables]  # nosec
+        rows = conn.run(" UNION ALL ".join(selects) + ";")
+        return {table: first for table, first in rows}
+    finally:
+        if conn:
+            close_db_connection(conn)
+
+
+def plan_windows(
+    first: dict[str, datetime.datetime | None], upper: datetime.datetime, window_days: int
+) -> list[list]:
+    """Splits each table's last_updated range into windows of window_days
+
+    Windows start on the day of a table's earliest row and cover
+    (since, until], the first one having no lower bound and the last one
+    ending at upper.
+
+    Args:
+        first (dict[str, datetime.datetime | None]): earliest last_updated by table
+        upper (datetime.datetime): end of the backfill
+        window_days (int): window length in days
+
+    Returns:
+        list[list]: [table, since, until] windows, with ISO8601 bounds and None for no lower bound
+    """
+    windows = []
+    step = datetime.timedelta(days=window_days)
+    for table, earliest in first.items():
+        if earliest is None:
+            continue
+        since = None
+        until = datetime.datetime.combine(earliest.date(), datetime.time()) + step
+        while until < upper:
+            windows.append([table, since, until.isoformat()])
+            since = until.isoformat()
+            until += step
+        windows.append([table, since, upper.isoformat()])
+    return windows
+
+
+def load_checkpoint(client: boto3.client, bucket: str, source: str = None) -> dict | None:
+    """Reads the backfill checkpoint
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): ingestion bucket name
+        source (str, optional): name of the source database being backfilled
+
+    Returns:
+        dict | None: the checkpoint, or None if no backfill is in progress
+    """
+    body = load_state(client, bucket, f"{state_name(CHECKPOINT_NAME, source)}.json")
+    return json.loads(body) if body else None
+
+
+def save_checkpoint(client: boto3.client, bucket: str, checkpoint: dict, source: str = None) -> str:
+    """Writes the backfill checkpoint
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): ingestion bucket name
+        checkpoint (dict): backfill end, windows and the indexes of finished windows
+        source (str, optional): name of the source database being backfilled
+
+    Returns:
+        str: the object key
+    """
+    name = f"{state_name(CHECKPOINT_NAME, source)}.json"
+    return save_state(client, bucket, name, json.dumps(checkpoint).encode("utf-8"))
+
+
+def clear_checkpoint(client: boto3.client, bucket: str, source: str = None) -> None:
+    """Removes the backfill checkpoint once every window is extracted
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): ingestion bucket name
+        source (str, optional): name of the source database being backfilled
+    """
+    client.delete_object(Bucket=bucket, Key=f"{STATE_PREFIX}{state_name(CHECKPOINT_NAME, source)}.json")
+
+
+def extract_window(
+    client: boto3.client,
+    bucket: str,
+    window: list,
+    seen_hashes: set[str],
+    file_format: str,
+    ledger: dict = None,
+    source: str = None,
+) -> tuple[int, list[str]]:
+    """Extracts one window of a table into its own ingestion object
+
+    The object is dated by the end of its window, so every window of a table
+    gets its own key.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): ingestion bucket name
+        window (list): [table, since, until] with ISO8601 bounds
+        seen_hashes (set[str]): hashes recorded for the table in the extract manifest
+        file_format (str): "json", or "parquet" for typed rows
+        ledger (dict, optional): source reconciliation ledger, updated in place
+        source (str, optional): name of the source database, partitioning the key
+
+    Returns:
+        tuple[int, list[str]]: rows uploaded and the new hashes to record
+    """
+    table, since, until = window
+    since = datetime.datetime.fromisoformat(since) if since else None
+    until = datetime.datetime.fromisoformat(until)
+    columns = SOURCE_COLUMNS[table] if file_format == "parquet" else None
+    rows = get_data(table, since, columns, until)
+    if not rows:
+        return 0, []
+    rows, new_hashes = remove_unchanged_rows(rows, seen_hashes)
+    if rows:
+        put_object(client, rows, table, bucket, until, file_format, source)
+        if ledger is not None:
+            add_source_rows(ledger, table, rows)
+    return len(rows), new_hashes
+
+
+def run_backfill(
+    client: boto3.client,
+    bucket: str,
+    tables: list[str],
+    manifest: dict,
+    file_format: str,
+    now: datetime.datetime,
+    remaining_millis: Callable[[], int] = None,
+    ledger: dict = None,
+    source: str = None,
+) -> datetime.datetime | None:
+    """Extracts the full history of some tables as windows, in parallel and resumably
+
+    At most EXTRACT_BACKFILL_WORKERS windows run at once. Every finished window
+    is recorded in the checkpoint, so an invocation that runs short of time
+    stops starting windows and the next invocation carries on where it left off.
+    The manifest is saved with the hashes of a window before the window is
+    checkpointed, so a window is never done without its hashes, even when a
+    later window fails.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): ingestion bucket name
+        tables (list[str]): names of tables to backfill
+        manifest (dict): extract manifest, updated in place and saved after every window
+        file_format (str): "json", or "parquet" for typed rows
+        now (datetime.datetime): time of this run, the end of a new backfill
+        remaining_millis (Callable[[], int], optional): time left in the invocation, from the Lambda context
+        ledger (dict, optional): source reconciliation ledger, updated in place
+        source (str, optional): name of the source database, with its own checkpoint and keys
+
+    Returns:
+        datetime.datetime | None: the end of the backfill once every window is done, otherwise None
+    """
+    checkpoint = load_checkpoint(client, bucket, source)
+    if checkpoint is None:
+        upper = now.replace(second=0, microsecond=0)
+        windows = plan_windows(first_updated(tables), upper, EXTRACT_BACKFILL_WINDOW_DAYS)
+        checkpoint = {"upper": upper.isoformat(), "windows": windows, "done": []}
+        save_checkpoint(client, bucket, checkpoint, source)
+        logger.info(f"Planned a backfill of {len(windows)} windows up to {upper}")
+
+    windows = checkpoint["windows"]
+    pending = [i for i in range(len(windows)) if i not in set(checkpoint["done"])]
+    pending.reverse()
+
+    def time_left() -> bool:
+        return remaining_millis is None or remaining_millis() > EXTRACT_BACKFILL_RESERVE_SECONDS * 1000
+
+    with ThreadPoolExecutor(max_workers=EXTRACT_BACKFILL_WORKERS) as executor:
+        running = {}
+        while pending or running:
+            while pending and len(running) < EXTRACT_BACKFILL_WORKERS and time_left():
+                i = pending.pop()
+                table = windows[i][0]
+                seen_hashes = set(manifest.get(table, []))
+                # Windows run with a copy of the context, so they use the connection pool of the source
+                running[executor.submit(
+                    contextvars.copy_context().run,
+                    extract_window, client, bucket, windows[i], seen_hashes, file_format, ledger, source,
+                )] = i
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                count, new_hashes = future.result()
+                record_hashes(manifest, windows[i][0], new_hashes)
+                save_manifest(client, bucket, state_name(MANIFEST_NAME, source), manifest)
+                checkpoint["done"].append(i)
+                save_checkpoint(client, bucket, checkpoint, source)
+                logger.info(f"Backfilled {count} {windows[i][0]} rows up to {windows[i][2]}")
+
+    if pending:
+        logger.info(f"Backfill paused with {len(pending)} of {len(windows)} windows left")
+        return None
+    clear_checkpoint(client, bucket, source)
+    return datetime.datetime.fromisoformat(checkpoint["upper"])
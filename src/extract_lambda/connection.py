@@ -1,16 +1,120 @@
 import pg8000.native
 import os
+import threading
+import contextlib
+import contextvars
+
+# Most connections open to one source database at once
+EXTRACT_POOL_SIZE = int(os.getenv("EXTRACT_POOL_SIZE", "4"))
+
+_pool = contextvars.ContextVar("extract_connection_pool", default=None)
+
+
+def connection_settings(source: dict = None) -> dict:
+    """Returns the connection settings of a source, falling back to the USER, HOST... env vars
+
+    Args:
+        source (dict, optional): source from load_sources
+
+    Returns:
+        dict: keyword arguments for pg8000.native.Connection
+    """
+    source = source or {}
+    settings = {
+        setting: source.get(setting, os.getenv(setting.upper()))
+        for setting in ["user", "password", "database", "host", "port"]
+    }
+    settings["port"] = int(settings["port"])
+    return settings
+
+
+class ConnectionPool:
+    """Keeps connections to one source database open for reuse, up to a fixed number at once"""
+
+    def __init__(self, source: dict = None, size: int = None):
+        """
+        Args:
+            source (dict, optional): source from load_sources, the env var database by default
+            size (int, optional): most connections open at once, EXTRACT_POOL_SIZE by default
+        """
+        self.source = source
+        self._slots = threading.BoundedSemaphore(size or EXTRACT_POOL_SIZE)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._in_use = {}
+
+    def acquire(self) -> pg8000.native.Connection:
+        """Takes an idle connection, or opens one, waiting while the pool is at its size"""
+        self._slots.acquire()
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = pg8000.native.Connection(**connection_settings(self.source))
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use[id(conn)] = conn
+        return conn
+
+    def release(self, conn) -> bool:
+        """Returns a connection to the pool
+
+        Returns:
+            bool: False for a connection the pool did not open
+        """
+        with self._lock:
+            if self._in_use.pop(id(conn), None) is None:
+                return False
+            self._idle.append(conn)
+        self._slots.release()
+        return True
+
+    def close(self) -> None:
+        """Closes the idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            with contextlib.suppress(Exception):
+                conn.close()
+
+
+@contextlib.contextmanager
+def use_source(source: dict = None):
+    """Routes create_conn to a pool of connections to a source for the length of the block
+
+    The pool belongs to the current context, so threads extracting other
+    sources keep their own. Worker threads share it when they are started
+    with a copy of the context.
+
+    Args:
+        source (dict, optional): source from load_sources, the env var database by default
+    """
+    pool = ConnectionPool(source)
+    token = _pool.set(pool)
+    try:
+        yield pool
+    finally:
+        _pool.reset(token)
+        pool.close()
+
+
+def current_source() -> dict | None:
+    """Returns the source create_conn connects to in this context, None outside use_source"""
+    pool = _pool.get()
+    return pool.source if pool is not None else None
 
 
 def create_conn():
-    return pg8000.native.Connection(
-        user=os.getenv("USER"),
-        password=os.getenv("PASSWORD"),
-        database=os.getenv("DATABASE"),
-        host=os.getenv("HOST"),
-        port=int(os.getenv("PORT")),
-    )
+    pool = _pool.get()
+    if pool is not None:
+        return pool.acquire()
+    return pg8000.native.Connection(**connection_settings())
 
 
 def close_db_connection(conn):
+    pool = _pool.get()
+    if pool is not None and pool.release(conn):
+        return
     conn.close()
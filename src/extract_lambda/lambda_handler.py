@@ -1,64 +1,230 @@
-import boto3
 import logging
 from datetime import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from pg8000 import DatabaseError
 
 try:
-    from src.extract_lambda.utils import get_data, put_object, get_parameter, put_parameter
+    from src.extract_lambda.utils import (
+        EXTRACT_MODE,
+        get_data,
+        probe_changes,
+        serialize_object,
+        put_parameter,
+        remove_unchanged_rows,
+        load_last_run,
+        save_last_run,
+    )
+    from src.extract_lambda.pipeline import UploadPipeline
+    from src.extract_lambda.connection import use_source
+    from src.extract_lambda.source_config import EXTRACT_SOURCE_WORKERS, load_sources
+    from src.common.sources import state_name
+    from src.common.object_store import get_s3_client
+    from src.common.parameter_store import get_ssm_client, get_parameters
+    from src.common.manifest import load_manifest, save_manifest, record_hashes
+    from src.common.source_schema import SOURCE_COLUMNS
+    from src.extract_lambda.scheduler import (
+        adaptive_schedule_enabled,
+        load_schedule,
+        save_schedule,
+        is_due,
+        table_watermark,
+        reschedule,
+    )
+    from src.extract_lambda.backfill import MANIFEST_NAME, windowed_backfill_enabled, run_backfill
+    from src.common.profiling import profiled, profile_section
+    from src.common.run_history import recorded
+    from src.common.reconciliation import add_source_rows, save_ledger
 except ImportError:
-    from utils import get_data, put_object, get_parameter, put_parameter
+    from utils import (
+        EXTRACT_MODE,
+        get_data,
+        probe_changes,
+        serialize_object,
+        put_parameter,
+        remove_unchanged_rows,
+        load_last_run,
+        save_last_run,
+    )
+    from pipeline import UploadPipeline
+    from connection import use_source
+    from source_config import EXTRACT_SOURCE_WORKERS, load_sources
+    from common.sources import state_name
+    from common.object_store import get_s3_client
+    from common.parameter_store import get_ssm_client, get_parameters
+    from common.manifest import load_manifest, save_manifest, record_hashes
+    from common.source_schema import SOURCE_COLUMNS
+    from scheduler import (
+        adaptive_schedule_enabled,
+        load_schedule,
+        save_schedule,
+        is_due,
+        table_watermark,
+        reschedule,
+    )
+    from backfill import MANIFEST_NAME, windowed_backfill_enabled, run_backfill
+    from common.profiling import profiled, profile_section
+    from common.run_history import recorded
+    from common.reconciliation import add_source_rows, save_ledger
 
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+@recorded("extract")
+@profiled
 def lambda_handler(event, context):
-    s3_client = boto3.client("s3")
-    ssm_client = boto3.client("ssm")
-    try:
-        previous_time = get_parameter(ssm_client, "lambda_last_run")
-
-        if previous_time == "None":
-            previous_time = None
-        else:
-            previous_time = dt.strptime(previous_time, "%Y_%m_%d-%H_%M")
-
-        logger.info(f"previous time is {previous_time}")
-
-        bucket_name = get_parameter(ssm_client, "ingestion_bucket_name")
-
-        tables = [
-            "address",
-            "design",
-            "counterparty",
-            "sales_order",
-            "transaction",
-            "payment",
-            "purchase_order",
-            "payment_type",
-            "currency",
-            "department",
-            "staff",
-        ]
+    """Extracts the changed rows of every source database into the ingestion bucket
 
+    Sources from load_sources are extracted at the same time, each with its
+    own connections, watermark and state, so a failing source does not hold
+    back the others. The first error is returned once the rest have finished.
+    """
+    s3_client = get_s3_client()
+    ssm_client = get_ssm_client()
+    try:
+        parameters = get_parameters(ssm_client, ["lambda_last_run", "ingestion_bucket_name"])
+        bucket_name = parameters["ingestion_bucket_name"]
+        sources = load_sources()
         current_date = dt.now()
 
-        for table in tables:
-            table_data = get_data(table, previous_time)
-            if table_data:
-                response = put_object(s3_client, table_data, table, bucket_name, current_date)
+        def run(source):
+            with use_source(source):
+                return extract_source(
+                    s3_client, ssm_client, bucket_name, source, parameters["lambda_last_run"],
+                    current_date, context,
+                )
 
-                logger.info(f"Successfully put {len(table_data)} objects into {response}")
-            else:
-                logger.info(f"No new data for {table}")
+        if len(sources) == 1:
+            return run(sources[0])
 
-        put_parameter(ssm_client, current_date)
-        logger.info(f"Updated lambda last run to {current_date}")
-        return "Successfully ran"
+        with ThreadPoolExecutor(max_workers=min(EXTRACT_SOURCE_WORKERS, len(sources))) as executor:
+            futures = [executor.submit(run, source) for source in sources]
+        results, errors = [], []
+        for source, future in zip(sources, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Extract of source {source['name']} failed: {e!r}")
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return "Backfill in progress" if "Backfill in progress" in results else "Successfully ran"
     except DatabaseError as e:
         logger.exception(f"Database Error: {e}")
         return f"Database Error: {e}"
     except Exception as e:
         logger.exception(f"Unexpected Error: {e}")
         return f"Unexpected Error: {e}"
+
+
+def extract_source(
+    s3_client, ssm_client, bucket_name, source, last_run, current_date, context
+) -> str:
+    """Extracts the changed rows of one source database, within its use_source block
+
+    Args:
+        s3_client (boto3.client): s3 client
+        ssm_client (boto3.client): ssm client
+        bucket_name (str): ingestion bucket name
+        source (dict): source from load_sources
+        last_run (str): the lambda_last_run parameter, the watermark of the unnamed source
+        current_date (datetime): time of this run
+        context: Lambda context
+
+    Returns:
+        str: "Successfully ran", or "Backfill in progress" while a windowed backfill is unfinished
+    """
+    name = source["name"]
+    tables = source["tables"]
+    if name is not None:
+        last_run = load_last_run(s3_client, bucket_name, name)
+    previous_time = None if last_run == "None" else dt.strptime(last_run, "%Y_%m_%d-%H_%M")
+    logger.info(f"previous time is {previous_time}" + (f" for source {name}" if name else ""))
+
+    typed = EXTRACT_MODE == "typed"
+    manifest_name = state_name(MANIFEST_NAME, name)
+    manifest = load_manifest(s3_client, bucket_name, manifest_name)
+    source_ledger = {}
+
+    if previous_time is None and windowed_backfill_enabled():
+        backfilled_to = run_backfill(
+            s3_client,
+            bucket_name,
+            tables,
+            manifest,
+            "parquet" if typed else "json",
+            current_date,
+            getattr(context, "get_remaining_time_in_millis", None),
+            source_ledger,
+            name,
+        )
+        save_manifest(s3_client, bucket_name, manifest_name, manifest)
+        save_ledger(s3_client, bucket_name, "source", source_ledger)
+        if backfilled_to is None:
+            return "Backfill in progress"
+        set_last_run(s3_client, ssm_client, bucket_name, name, backfilled_to)
+        logger.info(f"Backfill complete, updated lambda last run to {backfilled_to}")
+        return "Successfully ran"
+
+    schedule = load_schedule(s3_client, bucket_name, name) if adaptive_schedule_enabled() else None
+
+    due = {}
+    for table in tables:
+        if schedule is None:
+            due[table] = previous_time
+        elif is_due(schedule, table, current_date):
+            due[table] = table_watermark(schedule, table, previous_time)
+        else:
+            logger.info(f"Skipping {table}, it is not due until {schedule[table]['next_run']}")
+
+    changes = probe_changes(list(due), due)
+    # Each table is uploaded in the background while the next one is queried
+    with UploadPipeline(s3_client, bucket_name) as uploads:
+        for table, since in due.items():
+            with profile_section(table if name is None else f"{name}/{table}"):
+                changed_rows, last_updated = changes[table]
+                logger.info(
+                    f"Change probe: table={table} changed_rows={changed_rows} "
+                    f"max_last_updated={last_updated}" + (f" source={name}" if name else "")
+                )
+                if schedule is not None:
+                    reschedule(schedule, table, changed_rows, current_date)
+
+                if not changed_rows:
+                    table_data = []
+                elif typed:
+                    table_data = get_data(table, since, SOURCE_COLUMNS[table])
+                else:
+                    table_data = get_data(table, since)
+                if table_data:
+                    table_data, new_hashes = remove_unchanged_rows(table_data, set(manifest.get(table, [])))
+                    if not table_data:
+                        logger.info(f"Data for {table} is unchanged since the last upload")
+                        continue
+                    key, body = serialize_object(
+                        table_data, table, current_date, "parquet" if typed else "json", name
+                    )
+                    uploads.submit(key, body, len(table_data))
+                    # Nothing is saved unless every upload succeeds, so these can be recorded now
+                    record_hashes(manifest, table, new_hashes)
+                    add_source_rows(source_ledger, table, table_data)
+                else:
+                    logger.info(f"No new data for {table}")
+
+    save_manifest(s3_client, bucket_name, manifest_name, manifest)
+    # Only saved once the source's objects are uploaded, so a failed source adds nothing
+    save_ledger(s3_client, bucket_name, "source", source_ledger)
+    if schedule is not None:
+        save_schedule(s3_client, bucket_name, schedule, name)
+    set_last_run(s3_client, ssm_client, bucket_name, name, current_date)
+    logger.info(f"Updated lambda last run to {current_date}")
+    return "Successfully ran"
+
+
+def set_last_run(s3_client, ssm_client, bucket_name: str, source: str | None, current_date) -> None:
+    """Moves a source's watermark on, the lambda_last_run parameter for the unnamed source"""
+    if source is None:
+        put_parameter(ssm_client, current_date)
+    else:
+        save_last_run(s3_client, bucket_name, source, current_date)
@@ -0,0 +1,106 @@
+import os
+import boto3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from src.common.object_store import put_body
+except ImportError:
+    from common.object_store import put_body
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_UPLOAD_WORKERS = int(os.getenv("EXTRACT_UPLOAD_WORKERS", "4"))
+# Bodies queued or uploading are capped at this many bytes, so queries pause while uploads catch up
+EXTRACT_UPLOAD_MAX_BYTES = int(os.getenv("EXTRACT_UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class UploadPipeline:
+    """Uploads serialised tables on background threads while the caller goes on querying the database
+
+    submit blocks while the bytes queued or uploading would exceed max_bytes,
+    so a slow bucket holds back the queries rather than filling memory. A body
+    larger than max_bytes is still accepted once nothing else is pending.
+
+    Used as a context manager, leaving the block waits for every upload and
+    raises the first upload error. If the block itself raises, queued uploads
+    are cancelled instead.
+    """
+
+    def __init__(self, client: boto3.client, bucket: str, workers: int = None, max_bytes: int = None):
+        """
+        Args:
+            client (boto3.client): s3 client
+            bucket (str): name of bucket
+            workers (int, optional): concurrent uploads, EXTRACT_UPLOAD_WORKERS by default
+            max_bytes (int, optional): byte limit of pending uploads, EXTRACT_UPLOAD_MAX_BYTES by default
+        """
+        self.client = client
+        self.bucket = bucket
+        self.max_bytes = max_bytes or EXTRACT_UPLOAD_MAX_BYTES
+        self.pending_bytes = 0
+        self.peak_bytes = 0
+        self.error = None
+        self._futures = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers or EXTRACT_UPLOAD_WORKERS)
+
+    def submit(self, key: str, body: bytes, rows: int = 0) -> None:
+        """Queues an object for upload, waiting while the pending bytes are at the limit
+
+        Args:
+            key (str): object key
+            body (bytes): object contents
+            rows (int, optional): rows in the object, for logging
+
+        Raises:
+            Exception: the error of an earlier upload, so no more queries are made after a failure
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.error is not None
+                or not self.pending_bytes
+                or self.pending_bytes + len(body) <= self.max_bytes
+            )
+            if self.error is not None:
+                raise self.error
+            self.pending_bytes += len(body)
+            self.peak_bytes = max(self.peak_bytes, self.pending_bytes)
+        self._futures.append(self._executor.submit(self._upload, key, body, rows))
+
+    def _upload(self, key: str, body: bytes, rows: int) -> str:
+        try:
+            put_body(self.client, self.bucket, key, body)
+            logger.info(f"Successfully put {rows} objects into {key}")
+            return key
+        except Exception as e:
+            with self._condition:
+                self.error = self.error or e
+            raise
+        finally:
+            with self._condition:
+                self.pending_bytes -= len(body)
+                self._condition.notify_all()
+
+    def close(self) -> list[str]:
+        """Waits for every upload
+
+        Raises:
+            Exception: the first upload error
+
+        Returns:
+            list[str]: the uploaded object keys, in submission order
+        """
+        self._executor.shutdown(wait=True)
+        return [future.result() for future in self._futures]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        return False
@@ -0,0 +1,139 @@
+import os
+import json
+import boto3
+import logging
+import datetime
+
+try:
+    from src.common.manifest import load_state, save_state
+    from src.common.sources import state_name
+except ImportError:
+    from common.manifest import load_state, save_state
+    from common.sources import state_name
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_SCHEDULE = os.getenv("EXTRACT_SCHEDULE", "fixed")
+EXTRACT_MIN_INTERVAL_MINUTES = int(os.getenv("EXTRACT_MIN_INTERVAL_MINUTES", "5"))
+EXTRACT_MAX_INTERVAL_MINUTES = int(os.getenv("EXTRACT_MAX_INTERVAL_MINUTES", "1440"))
+EXTRACT_TARGET_ROWS = float(os.getenv("EXTRACT_TARGET_ROWS", "10"))
+EXTRACT_RATE_SMOOTHING = float(os.getenv("EXTRACT_RATE_SMOOTHING", "0.5"))
+
+
+def adaptive_schedule_enabled() -> bool:
+    """Checks whether tables are polled on their own adaptive intervals rather than every run
+
+    Returns:
+        bool: True when EXTRACT_SCHEDULE is "adaptive"
+    """
+    return EXTRACT_SCHEDULE == "adaptive"
+
+
+def load_schedule(client: boto3.client, bucket: str, source: str = None) -> dict[str, dict]:
+    """Reads the per-table extraction schedule
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): ingestion bucket name
+        source (str, optional): name of the source database the schedule belongs to
+
+    Returns:
+        dict[str, dict]: schedule entries keyed by table, empty if there is no schedule yet
+    """
+    body = load_state(client, bucket, f"{state_name('extract_schedule', source)}.json")
+    return json.loads(body) if body else {}
+
+
+def save_schedule(client: boto3.client, bucket: str, schedule: dict[str, dict], source: str = None) -> str:
+    """Writes the per-table extraction schedule
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): ingestion bucket name
+        schedule (dict[str, dict]): schedule entries keyed by table
+        source (str, optional): name of the source database the schedule belongs to
+
+    Returns:
+        str: the object key
+    """
+    name = f"{state_name('extract_schedule', source)}.json"
+    return save_state(client, bucket, name, json.dumps(schedule).encode("utf-8"))
+
+
+def is_due(schedule: dict[str, dict], table: str, now: datetime.datetime) -> bool:
+    """Checks whether a table should be extracted on this run
+
+    A table is due if it has never been scheduled, or if its next run falls
+    before the midpoint to the following trigger, so scheduler jitter does not
+    push it back a whole interval.
+
+    Args:
+        schedule (dict[str, dict]): schedule entries keyed by table
+        table (str): source table name
+        now (datetime.datetime): time of this run
+
+    Returns:
+        bool: True if the table should be extracted
+    """
+    if table not in schedule:
+        return True
+    next_run = datetime.datetime.fromisoformat(schedule[table]["next_run"])
+    return now >= next_run - datetime.timedelta(minutes=EXTRACT_MIN_INTERVAL_MINUTES / 2)
+
+
+def table_watermark(
+    schedule: dict[str, dict], table: str, default: datetime.datetime | None
+) -> datetime.datetime | None:
+    """Returns the time a table was last extracted, so skipped runs do not lose its changes
+
+    Args:
+        schedule (dict[str, dict]): schedule entries keyed by table
+        table (str): source table name
+        default (datetime.datetime | None): watermark to use for tables with no schedule entry
+
+    Returns:
+        datetime.datetime | None: the table's watermark
+    """
+    if table not in schedule:
+        return default
+    return datetime.datetime.fromisoformat(schedule[table]["watermark"])
+
+
+def reschedule(schedule: dict[str, dict], table: str, changed_rows: int, now: datetime.datetime) -> int:
+    """Updates a table's change rate and picks its next polling interval
+
+    The change rate is a moving average of changed rows per minute. The
+    interval is the time the table takes to accumulate EXTRACT_TARGET_ROWS
+    changes, clamped between EXTRACT_MIN_INTERVAL_MINUTES and
+    EXTRACT_MAX_INTERVAL_MINUTES.
+
+    Args:
+        schedule (dict[str, dict]): schedule entries keyed by table
+        table (str): source table name
+        changed_rows (int): rows changed since the table's previous watermark
+        now (datetime.datetime): time of this run, which becomes the new watermark
+
+    Returns:
+        int: the new interval in minutes
+    """
+    entry = schedule.setdefault(table, {})
+    if "watermark" in entry:
+        elapsed = (now - datetime.datetime.fromisoformat(entry["watermark"])).total_seconds() / 60
+    else:
+        elapsed = EXTRACT_MIN_INTERVAL_MINUTES
+    sample = changed_rows / max(elapsed, 1)
+    if "rate" in entry:
+        rate = EXTRACT_RATE_SMOOTHING * sample + (1 - EXTRACT_RATE_SMOOTHING) * entry["rate"]
+    else:
+        rate = sample
+
+    interval = EXTRACT_TARGET_ROWS / rate if rate > 0 else EXTRACT_MAX_INTERVAL_MINUTES
+    interval = int(min(max(interval, EXTRACT_MIN_INTERVAL_MINUTES), EXTRACT_MAX_INTERVAL_MINUTES))
+    entry.update(
+        rate=rate,
+        interval=interval,
+        watermark=now.isoformat(),
+        next_run=(now + datetime.timedelta(minutes=interval)).isoformat(),
+    )
+    logger.info(f"{table} changes at {rate:.3f} rows/minute, next extract in {interval} minutes")
+    return interval
@@ -0,0 +1,133 @@
+import os
+import re
+import json
+
+try:
+    from src.common.source_schema import SOURCE_COLUMNS, SOURCE_ID_COLUMNS
+except ImportError:
+    from common.source_schema import SOURCE_COLUMNS, SOURCE_ID_COLUMNS
+
+# json list of source databases, see load_sources, empty for the single database of the USER, HOST... env vars
+EXTRACT_SOURCES = os.getenv("EXTRACT_SOURCES", "")
+# Sources extracted at once, each with its own connections
+EXTRACT_SOURCE_WORKERS = int(os.getenv("EXTRACT_SOURCE_WORKERS", "4"))
+
+EXTRACT_TABLES = [
+    "address",
+    "design",
+    "counterparty",
+    "sales_order",
+    "transaction",
+    "payment",
+    "purchase_order",
+    "payment_type",
+    "currency",
+    "department",
+    "staff",
+]
+CONNECTION_SETTINGS = ["user", "password", "database", "host", "port"]
+SOURCE_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+# Ids of a source with a key_offset must stay below the span, so each offset owns a block of warehouse ids
+SOURCE_KEY_SPAN = 100_000_000
+# Warehouse ids are postgres integers
+MAX_WAREHOUSE_ID = 2**31 - 1
+
+
+def load_sources(config: str = None) -> list[dict]:
+    """Reads the source databases to extract and the tables of each
+
+    The config is a json list of sources, each with a name, the connection
+    settings it does not share with the USER, PASSWORD, DATABASE, HOST and
+    PORT env vars, and optionally its tables, for example
+    [{"name": "north", "host": "north.example.com"}, {"name": "south", "tables": ["sales_order"]}].
+    Without a config there is one unnamed source, whose objects and state
+    keep their original keys. The warehouse keys rows by their source ids,
+    so sources extracting the same table need different key_offset values,
+    multiples of SOURCE_KEY_SPAN added to every id of the source (see
+    namespace_ids). Their rows then land side by side in the warehouse.
+
+    Args:
+        config (str, optional): json config, EXTRACT_SOURCES by default
+
+    Raises:
+        ValueError: raised for no sources, a missing, invalid or repeated name, an unknown setting or table,
+            an invalid key_offset, or a table extracted from sources with the same key_offset
+
+    Returns:
+        list[dict]: sources with their name (None for the unnamed source), tables and connection settings
+    """
+    config = EXTRACT_SOURCES if config is None else config
+    if not config.strip():
+        return [{"name": None, "tables": list(EXTRACT_TABLES)}]
+
+    sources = []
+    for source in json.loads(config):
+        name = source.get("name")
+        if not isinstance(name, str) or not SOURCE_NAME.match(name):
+            raise ValueError(f"Invalid extract source name {name!r}")
+        if name in [existing["name"] for existing in sources]:
+            raise ValueError(f"Extract source {name} is defined twice")
+        unknown = set(source) - {"name", "tables", "key_offset", *CONNECTION_SETTINGS}
+        if unknown:
+            raise ValueError(f"Unknown settings for extract source {name}: {', '.join(sorted(unknown))}")
+        tables = source.get("tables", EXTRACT_TABLES)
+        unknown = [table for table in tables if table not in SOURCE_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown tables for extract source {name}: {', '.join(unknown)}")
+        key_offset = source.get("key_offset", 0)
+        if (
+            not isinstance(key_offset, int)
+            or isinstance(key_offset, bool)
+            or key_offset < 0
+            or key_offset % SOURCE_KEY_SPAN
+            or key_offset + SOURCE_KEY_SPAN - 1 > MAX_WAREHOUSE_ID
+        ):
+            raise ValueError(
+                f"Invalid key_offset {key_offset!r} for extract source {name}, "
+                f"it must be a multiple of {SOURCE_KEY_SPAN} below {MAX_WAREHOUSE_ID - SOURCE_KEY_SPAN + 1}"
+            )
+        for existing in sources:
+            shared = [table for table in tables if table in existing["tables"]]
+            if shared and existing.get("key_offset", 0) == key_offset:
+                raise ValueError(
+                    f"Extract sources {existing['name']} and {name} both extract {', '.join(shared)}, "
+                    "give them different key_offset values so their ids do not collide in the warehouse"
+                )
+        sources.append({**source, "tables": list(tables)})
+    if not sources:
+        raise ValueError("EXTRACT_SOURCES defines no sources")
+    return sources
+
+
+def namespace_ids(rows: list[dict], table: str, source: dict = None) -> list[dict]:
+    """Adds the key_offset of a source to every id of its rows, in place
+
+    Ids keep their own value for sources without an offset, so the unnamed
+    source and single source configs are unchanged.
+
+    Args:
+        rows (list[dict]): rows extracted from table
+        table (str): name of the source table
+        source (dict, optional): source the rows came from, see load_sources
+
+    Raises:
+        ValueError: raised for an id of a source with an offset that does not fit below SOURCE_KEY_SPAN
+
+    Returns:
+        list[dict]: the rows
+    """
+    key_offset = (source or {}).get("key_offset", 0)
+    if not key_offset or not rows:
+        return rows
+    columns = [column for column in SOURCE_ID_COLUMNS.get(table, []) if column in rows[0]]
+    for row in rows:
+        for column in columns:
+            if row[column] is None:
+                continue
+            if row[column] >= SOURCE_KEY_SPAN:
+                raise ValueError(
+                    f"{table}.{column} {row[column]} of extract source {source['name']} "
+                    f"does not fit below its key_offset span of {SOURCE_KEY_SPAN}"
+                )
+            row[column] += key_offset
+    return rows
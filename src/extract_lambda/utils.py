@@ -1,19 +1,49 @@
+import os
+import io
 import boto3
 import json
 import datetime
 
 try:
-    from src.extract_lambda.connection import create_conn, close_db_connection
+    from src.extract_lambda.connection import create_conn, close_db_connection, current_source
+    from src.extract_lambda.source_config import namespace_ids
+    from src.common.object_store import put_body
+    from src.common.parameter_store import get_parameter, set_parameter  # noqa: F401
+    from src.common.manifest import content_hash, load_state, save_state
+    from src.common.run_history import record_volume
+    from src.common.sources import source_partition, state_name
+    from src.common.source_schema import SOURCE_PRIMARY_KEYS
 except ImportError:
-    from connection import create_conn, close_db_connection
+    from connection import create_conn, close_db_connection, current_source
+    from source_config import namespace_ids
+    from common.object_store import put_body
+    from common.parameter_store import get_parameter, set_parameter  # noqa: F401
+    from common.manifest import content_hash, load_state, save_state
+    from common.run_history import record_volume
+    from common.sources import source_partition, state_name
+    from common.source_schema import SOURCE_PRIMARY_KEYS
 
+ROW_BATCH_SIZE = 500
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "json")
 
-def get_data(table: str, previous_date: datetime.datetime):
+
+def get_data(
+    table: str, previous_date: datetime.datetime, columns: list[str] = None, until: datetime.datetime = None
+):
     """Queries the database and returns data from table
 
+    Without columns every row is serialised to json by Postgres. With columns
+    only those are selected, and their values are returned as native python
+    types (datetime, Decimal) rather than json text. Rows come back in
+    primary key order, so unchanged rows always fall in the same batches for
+    remove_unchanged_rows. Ids are namespaced with the key_offset of the
+    source create_conn connects to.
+
     Args:
         table (str): name of table to query
         previous_date (datetime.datetime): date to filter query with
+        columns (list[str], optional): columns to select as typed values
+        until (datetime.datetime, optional): latest last_updated to include, for bounded windows
 
     Raises:
         DatabaseError: raises error related to the database
@@ -27,67 +57,161 @@ def get_data(table: str, previous_date: datetime.datetime):
         # line 47 was giving false positive for bandit as table is only defined
         # inside handler function
         conn = create_conn()
-        query = f"SELECT row_to_json({table}) FROM {table}"  # nosec
+        if columns:
+            query = f"SELECT {', '.join(columns)} FROM {table}"  # nosec
+        else:
+            query = f"SELECT row_to_json({table}) FROM {table}"  # nosec
 
+        conditions = []
         if previous_date:
-            query += f" WHERE last_updated > '{previous_date}';"
+            conditions.append(f"last_updated > '{previous_date}'")
+        if until:
+            conditions.append(f"last_updated <= '{until}'")
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        if table in SOURCE_PRIMARY_KEYS:
+            query += f" ORDER BY {SOURCE_PRIMARY_KEYS[table]}"
 
         rows = conn.run(query)
-        data = [row[0] for row in rows]
+        if columns:
+            data = [dict(zip(columns, row)) for row in rows]
+        else:
+            data = [row[0] for row in rows]
 
-        return data
+        return namespace_ids(data, table, current_source())
     finally:
         if conn:
             close_db_connection(conn)
 
 
-def put_object(
-    client: boto3.client, data: list[dict], table: str, bucket: str, current_date: datetime.datetime
-):
-    """Puts data in s3 bucket
+def probe_changes(
+    tables: list[str], since: dict[str, datetime.datetime | None]
+) -> dict[str, tuple[int, datetime.datetime | None]]:
+    """Counts the changed rows of every table in a single UNION ALL query
+
+    Args:
+        tables (list[str]): names of tables to probe
+        since (dict[str, datetime.datetime | None]): per-table date to filter with, None for every row
+
+    Returns:
+        dict[str, tuple[int, datetime.datetime | None]]: changed-row count and max last_updated by table
+    """
+    if not tables:
+        return {}
+    conn = None
+    try:
+        conn = create_conn()
+        selects = []
+        for table in tables:
+            select = f"SELECT '{table}', count(*), max(last_updated) FROM {table}"  # nosec
+            if since.get(table):
+                select += f" WHERE last_updated > '{since[table]}'"
+            selects.append(select)
+        rows = conn.run(" UNION ALL ".join(selects) + ";")
+        return {table: (count, max_updated) for table, count, max_updated in rows}
+    finally:
+        if conn:
+            close_db_connection(conn)
+
+
+def serialize_object(
+    data: list[dict],
+    table: str,
+    current_date: datetime.datetime,
+    file_format: str = "json",
+    source: str = None,
+) -> tuple[str, bytes]:
+    """Serialises table data and names its object, without uploading it
 
     Args:
-        client (boto3.client): s3_client
         data (list[dict]): serialized data
         table (str): name of table
-        bucket (str): name of bucket
         current_date (datetime.datetime): current date for file name
-
-    Raises:
-        Exception: Catches all exceptions
+        file_format (str): "json", or "parquet" for typed rows from get_data
+        source (str, optional): name of the source database, partitioning the key
 
     Returns:
-        str: the file path in the s3 bucket
+        tuple[str, bytes]: the object key and contents
     """
+    if file_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
 
-    data_bytes = json.dumps(data).encode("utf-8")
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_pylist(data), buffer)
+        data_bytes = buffer.getvalue()
+    else:
+        data_bytes = json.dumps(data).encode("utf-8")
     year = current_date.strftime("%Y")
     month = current_date.strftime("%m")
     day = current_date.strftime("%d")
     hour = current_date.strftime("%H")
     minute = current_date.strftime("%M")
-    key = f"{table}/{year}/{month}/{day}/{hour}-{minute}-{table}.json"
+    key = f"{table}/{source_partition(source)}{year}/{month}/{day}/{hour}-{minute}-{table}.{file_format}"
 
-    client.put_object(Bucket=bucket, Body=data_bytes, Key=key)
-    return key
+    record_volume(table, len(data), len(data_bytes))
+    return key, data_bytes
 
 
-def get_parameter(client: boto3.client, parameter_name: str):
-    """gets parameter from parameter store
+def put_object(
+    client: boto3.client,
+    data: list[dict],
+    table: str,
+    bucket: str,
+    current_date: datetime.datetime,
+    file_format: str = "json",
+    source: str = None,
+):
+    """Puts data in s3 bucket
 
     Args:
-        client (boto3.client): ssm_client
-        parameter_name (str): parameter name
+        client (boto3.client): s3_client
+        data (list[dict]): serialized data
+        table (str): name of table
+        bucket (str): name of bucket
+        current_date (datetime.datetime): current date for file name
+        file_format (str): "json", or "parquet" for typed rows from get_data
+        source (str, optional): name of the source database, partitioning the key
 
     Raises:
         Exception: Catches all exceptions
 
     Returns:
-        str: parameter value
+        str: the file path in the s3 bucket
     """
+    key, data_bytes = serialize_object(data, table, current_date, file_format, source)
+    return put_body(client, bucket, key, data_bytes)
+
 
-    result = client.get_parameter(Name=parameter_name)
-    return result["Parameter"]["Value"]
+def remove_unchanged_rows(data: list[dict], seen_hashes: set[str]) -> tuple[list[dict], list[str]]:
+    """Drops rows that were already uploaded, using content hashes from the extract manifest
+
+    The whole payload is hashed first so an identical re-extract is skipped
+    outright, otherwise rows are hashed in batches of ROW_BATCH_SIZE and only
+    batches with unseen hashes are kept.
+
+    Args:
+        data (list[dict]): table data
+        seen_hashes (set[str]): hashes recorded for the table by previous runs
+
+    Returns:
+        tuple[list[dict], list[str]]: the rows to upload and the new hashes to record
+    """
+    payload_hash = content_hash(json.dumps(data, sort_keys=True, default=str).encode("utf-8"))
+    if payload_hash in seen_hashes:
+        return [], []
+
+    new_rows = []
+    new_hashes = [payload_hash]
+    for i in range(0, len(data), ROW_BATCH_SIZE):
+        batch = data[i:i + ROW_BATCH_SIZE]
+        batch_hash = content_hash(json.dumps(batch, sort_keys=True, default=str).encode("utf-8"))
+        if batch_hash not in seen_hashes:
+            new_rows.extend(batch)
+            new_hashes.append(batch_hash)
+    if not new_rows:
+        return [], []
+    return new_rows, new_hashes
 
 
 def put_parameter(client: boto3.client, current_date: datetime.datetime):
@@ -101,6 +225,35 @@ def put_parameter(client: boto3.client, current_date: datetime.datetime):
         Exception: catches all exceptions
 
     """
-    client.put_parameter(
-        Name="lambda_last_run", Value=current_date.strftime("%Y_%m_%d-%H_%M"), Overwrite=True, Type="String"
-    )
+    set_parameter(client, "lambda_last_run", current_date.strftime("%Y_%m_%d-%H_%M"))
+
+
+def load_last_run(client: boto3.client, bucket: str, source: str) -> str:
+    """Reads the last run of a named source, kept with its other state in the ingestion bucket
+
+    Args:
+        client (boto3.client): s3_client
+        bucket (str): ingestion bucket name
+        source (str): source name
+
+    Returns:
+        str: last run as "%Y_%m_%d-%H_%M", or "None" before the first run, like the lambda_last_run parameter
+    """
+    body = load_state(client, bucket, f"{state_name('extract_last_run', source)}.txt")
+    return body.decode("utf-8") if body else "None"
+
+
+def save_last_run(client: boto3.client, bucket: str, source: str, current_date: datetime.datetime) -> str:
+    """Writes the last run of a named source
+
+    Args:
+        client (boto3.client): s3_client
+        bucket (str): ingestion bucket name
+        source (str): source name
+        current_date (datetime.datetime): current date
+
+    Returns:
+        str: the object key
+    """
+    body = current_date.strftime("%Y_%m_%d-%H_%M").encode("utf-8")
+    return save_state(client, bucket, f"{state_name('extract_last_run', source)}.txt", body)
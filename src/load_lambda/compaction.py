@@ -0,0 +1,184 @@
+import io
+import os
+import re
+import json
+import boto3
+import logging
+import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from src.common.object_store import get_bodies, list_objects, put_body
+    from src.common.manifest import content_hash, load_state, save_state
+    from src.common.warehouse_schema import PRIMARY_KEYS, DIMENSION_TABLES
+    from src.common.fact_files import FACT_TABLES, write_fact_table
+except ImportError:
+    from common.object_store import get_bodies, list_objects, put_body
+    from common.manifest import content_hash, load_state, save_state
+    from common.warehouse_schema import PRIMARY_KEYS, DIMENSION_TABLES
+    from common.fact_files import FACT_TABLES, write_fact_table
+
+logger = logging.getLogger(__name__)
+
+COMPACTED_PREFIX = "_compacted/"
+COMPACTION_MANIFEST_NAME = "compaction_manifest.json"
+# "day" or "month", the span of transformed files merged into one compacted file
+COMPACTION_PERIOD = os.getenv("COMPACTION_PERIOD", "day")
+COMPACTION_MIN_FILES = int(os.getenv("COMPACTION_MIN_FILES", "2"))
+COMPACTION_ROW_GROUP_ROWS = int(os.getenv("COMPACTION_ROW_GROUP_ROWS", "131072"))
+
+# Fact tables are sorted by date then natural id, dimensions by their primary key
+SORT_KEYS = {
+    "fact_sales_order": ["created_date", "sales_order_id"],
+    "fact_payment": ["created_date", "payment_id"],
+    "fact_purchase_order": ["created_date", "purchase_order_id"],
+    **{table: [PRIMARY_KEYS[table]] for table in DIMENSION_TABLES},
+}
+
+TRANSFORMED_KEY = re.compile(
+    r"^[a-z_]+/transformed/(?:source=[^/]+/)?(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/"
+)
+
+
+def period_of(key: str) -> str | None:
+    """Returns the compaction period a transformed file belongs to
+
+    Args:
+        key (str): object key, {table}/transformed/[source={name}/]YYYY/MM/DD/HH_MM-{table}.parquet
+
+    Returns:
+        str | None: "YYYY/MM/DD" or "YYYY/MM" depending on COMPACTION_PERIOD, None for other keys
+    """
+    match = TRANSFORMED_KEY.match(key)
+    if match is None:
+        return None
+    if COMPACTION_PERIOD == "month":
+        return f"{match['year']}/{match['month']}"
+    return f"{match['year']}/{match['month']}/{match['day']}"
+
+
+def load_compaction_manifest(client: boto3.client, bucket: str) -> dict[str, dict]:
+    """Reads the compaction manifest
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+
+    Returns:
+        dict[str, dict]: compacted files by table and period, each with its key and source keys
+    """
+    body = load_state(client, bucket, COMPACTION_MANIFEST_NAME)
+    return json.loads(body) if body else {}
+
+
+def save_compaction_manifest(client: boto3.client, bucket: str, manifest: dict[str, dict]) -> str:
+    """Writes the compaction manifest in a single put, so readers see every compacted file or none
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+        manifest (dict[str, dict]): compacted files by table and period
+
+    Returns:
+        str: the object key
+    """
+    return save_state(client, bucket, COMPACTION_MANIFEST_NAME, json.dumps(manifest).encode("utf-8"))
+
+
+def merge_files(table: str, bodies: list[bytes]) -> bytes:
+    """Merges transformed Parquet files into one sorted Parquet file
+
+    Files are concatenated in key order and stably sorted, so rows with the same
+    sort key keep the order they were transformed in. Dimensions get large row
+    groups, facts the date-range layout of write_fact_table.
+
+    Args:
+        table (str): warehouse table name
+        bodies (list[bytes]): Parquet file contents, oldest first
+
+    Returns:
+        bytes: the merged Parquet file
+    """
+    merged = pa.concat_tables(
+        [pq.read_table(io.BytesIO(body)) for body in bodies], promote_options="default"
+    )
+    sort_keys = [column for column in SORT_KEYS.get(table, []) if column in merged.column_names]
+    if sort_keys:
+        merged = merged.sort_by([(column, "ascending") for column in sort_keys])
+    buffer = io.BytesIO()
+    if table in FACT_TABLES:
+        write_fact_table(merged, buffer)
+    else:
+        pq.write_table(merged, buffer, row_group_size=COMPACTION_ROW_GROUP_ROWS)
+    return buffer.getvalue()
+
+
+def compact_table(
+    client: boto3.client, bucket: str, table: str, manifest: dict[str, dict], today: datetime.date
+) -> int:
+    """Compacts every closed period of a table that has enough small files and is not compacted yet
+
+    The period of today is left alone, since it can still receive files. Each
+    compacted file gets a new key named by its content hash, and only becomes
+    visible to the loader when the manifest pointing at it is saved.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+        table (str): warehouse table name
+        manifest (dict[str, dict]): compaction manifest, updated in place
+        today (datetime.date): current date
+
+    Returns:
+        int: number of periods compacted
+    """
+    current = period_of(f"{table}/transformed/{today.strftime('%Y/%m/%d')}/")
+    periods = {}
+    for item in list_objects(client, bucket, f"{table}/transformed/"):
+        period = period_of(item["Key"])
+        if period is not None and period != current:
+            periods.setdefault(period, []).append(item["Key"])
+
+    compacted = manifest.setdefault(table, {})
+    count = 0
+    for period, keys in sorted(periods.items()):
+        keys.sort()
+        if len(keys) < COMPACTION_MIN_FILES or compacted.get(period, {}).get("sources") == keys:
+            continue
+        body = merge_files(table, get_bodies(client, bucket, keys))
+        key = f"{COMPACTED_PREFIX}{table}/{period}/{table}-{content_hash(body)[:16]}.parquet"
+        put_body(client, bucket, key, body)
+        compacted[period] = {"key": key, "sources": keys}
+        logger.info(f"Compacted {len(keys)} {table} files for {period} into {key}")
+        count += 1
+    return count
+
+
+def swap_in_compacted(file_keys: list[str], compacted: dict[str, dict]) -> list[str]:
+    """Replaces new transformed files with compacted files wherever a whole period is new
+
+    A loader that is catching up reads one compacted file per period instead
+    of its many small files. Periods that are only partly new keep their
+    transformed files, so nothing is loaded twice. Files are returned in
+    period order, so later rows still win when dimensions are merged.
+
+    Args:
+        file_keys (list[str]): new transformed object keys of a table
+        compacted (dict[str, dict]): the table's entries in the compaction manifest
+
+    Returns:
+        list[str]: the object keys to load
+    """
+    remaining = set(file_keys)
+    ordered = []
+    for period, entry in compacted.items():
+        sources = set(entry["sources"])
+        if sources <= remaining:
+            remaining -= sources
+            ordered.append((period, "", entry["key"]))
+    if not ordered:
+        return file_keys
+    logger.info(f"Reading {len(ordered)} compacted files in place of {len(file_keys) - len(remaining)}")
+    ordered.extend((period_of(key) or "", key, key) for key in remaining)
+    return [key for _, _, key in sorted(ordered)]
@@ -0,0 +1,109 @@
+import logging
+import pandas as pd
+
+try:
+    from src.common.warehouse_schema import FOREIGN_KEYS, PRIMARY_KEYS
+except ImportError:
+    from common.warehouse_schema import FOREIGN_KEYS, PRIMARY_KEYS
+
+logger = logging.getLogger(__name__)
+
+
+def key_strings(values: pd.Series, dimension: str) -> pd.Series:
+    """Normalises dimension keys or fact references to the text Postgres gives for them
+
+    Dates compare as YYYY-MM-DD, whatever time part they carry, and integer ids
+    compare as plain integers, even when missing values made them floats.
+
+    Args:
+        values (pd.Series): key values
+        dimension (str): dimension table the keys belong to
+
+    Returns:
+        pd.Series: text keys on the same index
+    """
+    if dimension == "dim_date":
+        return pd.to_datetime(values, format="ISO8601").dt.strftime("%Y-%m-%d")
+    return pd.to_numeric(values).astype("Int64").astype(str)
+
+
+class DimensionKeyCache:
+    """In-memory hash index of the keys held by each warehouse dimension
+
+    The keys of every dimension a fact table references are read with one
+    bulk query the first time they are needed, and kept for the rest of the
+    run. Dimensions loaded later in the run add their keys with add, so the
+    index never has to be read again.
+    """
+
+    def __init__(self):
+        self.keys = {}
+
+    def load(self, conn, dimensions: list[str]) -> None:
+        """Reads the keys of any dimensions not already cached in one UNION ALL query
+
+        Args:
+            conn (pg8000.native.Connection): warehouse connection
+            dimensions (list[str]): dimension table names
+        """
+        missing = sorted(set(dimensions) - set(self.keys))
+        if not missing:
+            return
+        query = " UNION ALL ".join(
+            f"SELECT '{dimension}', {PRIMARY_KEYS[dimension]}::text FROM {dimension}"  # nosec
+            for dimension in missing
+        )
+        rows = conn.run(query)
+        for dimension in missing:
+            self.keys[dimension] = set()
+        for dimension, key in rows:
+            self.keys[dimension].add(key)
+        logger.info(f"Cached {len(rows)} keys from {", ".join(missing)}")
+
+    def add(self, dimension: str, values: pd.Series) -> None:
+        """Adds newly loaded keys to a dimension that is already cached
+
+        Args:
+            dimension (str): dimension table name
+            values (pd.Series): loaded primary key values
+        """
+        if dimension in self.keys:
+            self.keys[dimension].update(key_strings(values.dropna(), dimension))
+
+    def resolve(self, conn, table: str, df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Splits fact rows into those whose dimension references all exist and orphans
+
+        Every reference column is checked against its dimension's keys at once,
+        and missing references are allowed. Orphan rows gain a missing_keys
+        column naming the references that were not found.
+
+        Args:
+            conn (pg8000.native.Connection): warehouse connection, used if the keys are not cached yet
+            table (str): fact table name
+            df (pd.DataFrame): fact rows
+
+        Returns:
+            tuple[pd.DataFrame, pd.DataFrame]: the resolved rows and the orphan rows
+        """
+        references = {
+            column: dimension
+            for column, (dimension, _) in FOREIGN_KEYS.get(table, {}).items()
+            if column in df.columns
+        }
+        if not references or df.empty:
+            return df, df.iloc[0:0]
+        self.load(conn, list(references.values()))
+
+        missing = pd.DataFrame(
+            {
+                column: df[column].notna() & ~key_strings(df[column], dimension).isin(self.keys[dimension])
+                for column, dimension in references.items()
+            },
+            index=df.index,
+        )
+        is_orphan = missing.any(axis=1)
+        orphans = df[is_orphan].copy()
+        orphans["missing_keys"] = missing[is_orphan].dot(missing.columns + ",").str.rstrip(",")
+        if len(orphans):
+            logger.warning(f"{len(orphans)} {table} rows reference missing dimension keys")
+        return df[~is_orphan], orphans
@@ -4,7 +4,6 @@ data warehouse at defined intervals.
 Again the application should be adequately logged and monitored.
 
 """
-import boto3
 import logging
 from pg8000 import DatabaseError
 from botocore.exceptions import ClientError
@@ -12,18 +11,64 @@ from datetime import datetime as dt
 try:
     from src.load_lambda.load_utils import (
         list_new_from_s3,
-        write_to_database,
-        get_parquet_files,
-        get_parameter,
-        put_parameter
+        load_new_files,
+        redrive_quarantine,
+        ensure_date_set,
+        put_parameter,
+        create_conn,
+        close_db_connection,
+    )
+    from src.load_lambda.micro_batch import MicroBatcher, parse_object_events
+    from src.load_lambda.key_cache import DimensionKeyCache
+    from src.load_lambda.compaction import (
+        load_compaction_manifest,
+        save_compaction_manifest,
+        compact_table,
+        swap_in_compacted,
+    )
+    from src.common.object_store import get_s3_client
+    from src.common.parameter_store import get_ssm_client, get_parameter, get_parameters
+    from src.common.manifest import load_manifest, save_manifest
+    from src.common.profiling import profiled, profile_section
+    from src.common.run_history import recorded
+    from src.common.warehouse_schema import FOREIGN_KEYS
+    from src.common.reconciliation import (
+        RECONCILED_TABLES,
+        load_ledger,
+        save_ledger,
+        warehouse_aggregates,
+        reconcile,
     )
 except Exception:
     from load_utils import (
         list_new_from_s3,
-        write_to_database,
-        get_parquet_files,
-        get_parameter,
-        put_parameter
+        load_new_files,
+        redrive_quarantine,
+        ensure_date_set,
+        put_parameter,
+        create_conn,
+        close_db_connection,
+    )
+    from micro_batch import MicroBatcher, parse_object_events
+    from key_cache import DimensionKeyCache
+    from compaction import (
+        load_compaction_manifest,
+        save_compaction_manifest,
+        compact_table,
+        swap_in_compacted,
+    )
+    from common.object_store import get_s3_client
+    from common.parameter_store import get_ssm_client, get_parameter, get_parameters
+    from common.manifest import load_manifest, save_manifest
+    from common.profiling import profiled, profile_section
+    from common.run_history import recorded
+    from common.warehouse_schema import FOREIGN_KEYS
+    from common.reconciliation import (
+        RECONCILED_TABLES,
+        load_ledger,
+        save_ledger,
+        warehouse_aggregates,
+        reconcile,
     )
 
 
@@ -31,36 +76,75 @@ except Exception:
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+FOLDER_LIST = ["dim_date", "dim_counterparty", "dim_currency", "dim_design",
+               "dim_location", "dim_staff", "fact_sales_order"]
+
 
+def redrive_orphans(s3_client, processed_bucket: str, key_cache: DimensionKeyCache) -> list[str]:
+    """Loads the quarantined rows of every fact table whose dimension keys have since been loaded
+
+    Returns:
+        list[str]: fact tables whose quarantined rows failed to load
+    """
+    failed_tables = []
+    for folder in FOLDER_LIST:
+        if folder not in FOREIGN_KEYS:
+            continue
+        try:
+            redrive_quarantine(s3_client, processed_bucket, folder, key_cache)
+        except DatabaseError as e:
+            logger.exception(f"Database Error: {e}")
+            failed_tables.append(folder)
+    return failed_tables
+
+
+@recorded("load")
+@profiled
 def load_data(event, context):
     """Loads data into the data warehouse."""
     try:
         logger.info("Started load data...")
-        s3_client = boto3.client("s3")
-        ssm_client = boto3.client("ssm")
-        last_run = get_parameter(ssm_client, "load_last_run")
+        s3_client = get_s3_client()
+        ssm_client = get_ssm_client()
+        parameters = get_parameters(ssm_client, ["load_last_run", "processed_bucket_name"])
+        last_run = parameters["load_last_run"]
         if last_run == "None":
             last_run = None
         else:
             last_run = dt.strptime(last_run, "%Y_%m_%d-%H_%M_%S")
 
-        processed_bucket = get_parameter(ssm_client, "processed_bucket_name")
-        put_parameter(ssm_client, dt.now())
-
-        folder_list = ["dim_date", "dim_counterparty", "dim_currency", "dim_design",
-                       "dim_location", "dim_staff", "fact_sales_order"]
-        for folder in folder_list:
-            new_files = list_new_from_s3(s3_client, last_run, processed_bucket, folder)
-            if new_files != []:
-                logger.info(f"Found {len(new_files)} {folder} parquet files")
-                new_parquet_files = get_parquet_files(s3_client, new_files, processed_bucket)
-                try:
-                    write_to_database(folder, new_parquet_files)
-                    logger.info(f"Succesfully wrote {", ".join(new_files)} to {folder} table")
-                except DatabaseError as e:
-                    logger.exception(f"Database Error: {e}")
-            elif new_files == []:
-                logger.info(f"Found no new files in {folder}")
+        processed_bucket = parameters["processed_bucket_name"]
+        run_started = dt.now()
+        manifest = load_manifest(s3_client, processed_bucket, "load_manifest")
+        key_cache = DimensionKeyCache()
+        compacted = load_compaction_manifest(s3_client, processed_bucket)
+
+        failed_folders = []
+        for folder in FOLDER_LIST:
+            with profile_section(folder):
+                new_files = list_new_from_s3(s3_client, last_run, processed_bucket, folder)
+                if new_files != []:
+                    new_files = swap_in_compacted(new_files, compacted.get(folder, {}))
+                    logger.info(f"Found {len(new_files)} {folder} parquet files")
+                    try:
+                        if load_new_files(
+                            s3_client, processed_bucket, folder, new_files, manifest, key_cache
+                        ):
+                            logger.info(f"Succesfully wrote {", ".join(new_files)} to {folder} table")
+                    except DatabaseError as e:
+                        logger.exception(f"Database Error: {e}")
+                        failed_folders.append(folder)
+                elif new_files == []:
+                    logger.info(f"Found no new files in {folder}")
+        failed_folders += redrive_orphans(s3_client, processed_bucket, key_cache)
+        save_manifest(s3_client, processed_bucket, "load_manifest", manifest)
+        ensure_date_set(s3_client, processed_bucket)
+
+        # The checkpoint only moves once every folder has committed, so failed files are retried
+        if failed_folders:
+            logger.info(f"Not advancing load_last_run, {", ".join(failed_folders)} failed to load")
+        else:
+            put_parameter(ssm_client, run_started)
         return "Load function successfully ran."
 
     except ClientError as e:
@@ -69,3 +153,120 @@ def load_data(event, context):
     except Exception as e:
         logger.exception(f"Data load failed: {e}")
         return f"Unexpected error {e}"
+
+
+@profiled
+def compact_data(event, context):
+    """Merges each table's small processed files into one sorted file per closed day or month.
+
+    The loader reads the compacted files in place of the originals whenever it
+    has a whole period to catch up on.
+    """
+    try:
+        logger.info("Started compaction...")
+        s3_client = get_s3_client()
+        processed_bucket = get_parameter(get_ssm_client(), "processed_bucket_name")
+        manifest = load_compaction_manifest(s3_client, processed_bucket)
+        today = dt.now().date()
+        compacted = 0
+        for folder in FOLDER_LIST:
+            compacted += compact_table(s3_client, processed_bucket, folder, manifest, today)
+        save_compaction_manifest(s3_client, processed_bucket, manifest)
+        return f"Compacted {compacted} periods."
+    except ClientError as e:
+        logger.exception(f"ClientError Error: {e}")
+        return f"ClientError Error: {e}"
+
+
+@profiled
+def reconcile_data(event, context):
+    """Compares daily row counts, amounts and key hashes of the loaded fact tables across the pipeline.
+
+    The source ledger is kept by the extract function and the processed ledger
+    by the transform function. The warehouse ledger is computed here from the
+    warehouse tables, and every table day that differs from the stage before
+    it is logged as a mismatch.
+    """
+    try:
+        logger.info("Started reconciliation...")
+        s3_client = get_s3_client()
+        parameters = get_parameters(get_ssm_client(), ["ingestion_bucket_name", "processed_bucket_name"])
+        processed_bucket = parameters["processed_bucket_name"]
+        tables = [folder for folder in FOLDER_LIST if folder in RECONCILED_TABLES]
+
+        conn = create_conn()
+        try:
+            warehouse = {table: warehouse_aggregates(conn, table) for table in tables}
+        finally:
+            close_db_connection(conn)
+        save_ledger(s3_client, processed_bucket, "warehouse", warehouse)
+
+        mismatches = reconcile({
+            "source": load_ledger(s3_client, parameters["ingestion_bucket_name"], "source"),
+            "processed": load_ledger(s3_client, processed_bucket, "processed"),
+            "warehouse": warehouse,
+        }, tables)
+        for mismatch in mismatches:
+            logger.warning(
+                f"Reconciliation mismatch: {mismatch['table']} {mismatch['day']} at {mismatch['stage']}, "
+                f"expected [rows, amount, key hash] {mismatch['expected']}, got {mismatch['actual']}"
+            )
+        return f"Reconciled {len(tables)} tables, {len(mismatches)} mismatched days."
+    except ClientError as e:
+        logger.exception(f"ClientError Error: {e}")
+        return f"ClientError Error: {e}"
+    except DatabaseError as e:
+        logger.exception(f"Database Error: {e}")
+        return f"Database Error: {e}"
+
+
+@profiled
+def load_events(event, context):
+    """Loads new processed files into the data warehouse as their S3 notifications arrive.
+
+    Notifications reach the function in SQS batches. The files are buffered
+    and loaded per table whenever a size or age threshold is reached. Messages
+    whose files fail to load are reported back so SQS retries only them.
+    Once a batch and the redrive of quarantined rows have committed,
+    load_last_run moves to the start of the batch as it does in load_data, so
+    a catch-up run of load_data only lists files newer than the last batch.
+    """
+    logger.info("Started load events...")
+    s3_client = get_s3_client()
+    ssm_client = get_ssm_client()
+    processed_bucket = get_parameter(ssm_client, "processed_bucket_name")
+    run_started = dt.now()
+    manifest = load_manifest(s3_client, processed_bucket, "load_manifest")
+    key_cache = DimensionKeyCache()
+
+    objects = parse_object_events(event)
+    message_ids = {}
+    for item in objects:
+        message_ids.setdefault(item["key"], set()).add(item["message_id"])
+    failed_messages = set()
+
+    def load(folder, keys):
+        try:
+            if load_new_files(s3_client, processed_bucket, folder, keys, manifest, key_cache):
+                logger.info(f"Succesfully wrote {", ".join(keys)} to {folder} table")
+        except DatabaseError as e:
+            logger.exception(f"Database Error: {e}")
+            for key in keys:
+                failed_messages.update(message_ids[key])
+
+    batcher = MicroBatcher(load, FOLDER_LIST)
+    for item in objects:
+        batcher.add(item["key"], item["size"])
+    batcher.flush()
+    failed_tables = redrive_orphans(s3_client, processed_bucket, key_cache)
+    if failed_tables:
+        logger.error(f"Quarantined rows of {", ".join(failed_tables)} failed to load and stay quarantined")
+
+    save_manifest(s3_client, processed_bucket, "load_manifest", manifest)
+    ensure_date_set(s3_client, processed_bucket)
+    if failed_messages or failed_tables:
+        logger.info("Not advancing load_last_run, part of the batch failed to load")
+    else:
+        put_parameter(ssm_client, run_started)
+    failed_messages.discard(None)
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in sorted(failed_messages)]}
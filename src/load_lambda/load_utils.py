@@ -5,13 +5,47 @@ import datetime
 from datetime import timezone
 import pandas as pd
 import io
+import uuid
 from pg8000 import DatabaseError
 import logging
 
+try:
+    from src.common.object_store import get_bodies, list_objects, put_body, RangedObject
+    from src.common.fact_files import read_date_range
+    from src.common.parameter_store import get_parameter, set_parameter  # noqa: F401
+    from src.common.manifest import content_hash, record_hashes
+    from src.common.date_set import load_date_set, seed_date_set, add_dates
+    from src.common.run_history import record_volume
+    from src.common.warehouse_schema import (
+        PRIMARY_KEYS, DIMENSION_TABLES, FOREIGN_KEYS, NATURAL_KEYS, create_indexes, drop_indexes, analyze,
+        create_natural_key,
+    )
+    from src.load_lambda.key_cache import DimensionKeyCache
+except ImportError:
+    from common.object_store import get_bodies, list_objects, put_body, RangedObject
+    from common.fact_files import read_date_range
+    from common.parameter_store import get_parameter, set_parameter  # noqa: F401
+    from common.manifest import content_hash, record_hashes
+    from common.date_set import load_date_set, seed_date_set, add_dates
+    from common.run_history import record_volume
+    from common.warehouse_schema import (
+        PRIMARY_KEYS, DIMENSION_TABLES, FOREIGN_KEYS, NATURAL_KEYS, create_indexes, drop_indexes, analyze,
+        create_natural_key,
+    )
+    from key_cache import DimensionKeyCache
 
 logger = logging.getLogger(__name__)
 logger.setLevel("INFO")
 
+BULK_LOAD_INDEX_THRESHOLD = int(os.getenv("BULK_LOAD_INDEX_THRESHOLD", "10000"))
+STAGING_BATCH_ROWS = int(os.getenv("STAGING_BATCH_ROWS", "500"))
+# Postgres allows at most 65535 bind parameters per statement
+MAX_QUERY_PARAMETERS = 30000
+QUARANTINE_PREFIX = "_quarantine/"
+
+# Fact tables whose natural key index this process has already made sure of
+_natural_keys_checked = set()
+
 
 def create_conn():
     return pg8000.native.Connection(
@@ -43,16 +77,12 @@ def list_new_from_s3(
     Returns:
         list[str]: List of s3 object keys
     """
-    all_files = client.list_objects_v2(Bucket=bucket_name, Prefix=folder_name)
-    if all_files["KeyCount"] == 0:
-        return []
+    all_files = list_objects(client, bucket_name, folder_name)
     if last_run is None:
-        new_files = [file["Key"] for file in all_files["Contents"] if file["LastModified"]]
+        new_files = [file["Key"] for file in all_files if file["LastModified"]]
     else:
         last_run = last_run.replace(tzinfo=timezone.utc)
-        new_files = [
-            file["Key"] for file in all_files["Contents"] if file["LastModified"] > last_run
-        ]
+        new_files = [file["Key"] for file in all_files if file["LastModified"] > last_run]
     return new_files
 
 
@@ -67,65 +97,379 @@ def get_parquet_files(client: boto3.client, file_keys: list, bucket_name: str) -
     Returns:
         list[object]: List of parquet file objects
     """
-    parquet_files = []
+    return [io.BytesIO(body) for body in get_bodies(client, bucket_name, file_keys)]
+
+
+def remove_loaded_files(
+    parquet_files: list[io.BytesIO], seen_hashes: set[str]
+) -> tuple[list[io.BytesIO], list[str]]:
+    """Drops parquet files whose content hash shows they were already loaded
+
+    Args:
+        parquet_files (list[io.BytesIO]): parquet files from get_parquet_files
+        seen_hashes (set[str]): hashes recorded in the load manifest for the table
+
+    Returns:
+        tuple[list[io.BytesIO], list[str]]: files still to load and their hashes
+    """
+    new_files = []
+    new_hashes = []
+    for parquet_file in parquet_files:
+        file_hash = content_hash(parquet_file.getvalue())
+        if file_hash not in seen_hashes and file_hash not in new_hashes:
+            new_files.append(parquet_file)
+            new_hashes.append(file_hash)
+    return new_files, new_hashes
+
+
+def load_new_files(
+    client: boto3.client,
+    bucket_name: str,
+    table_name: str,
+    file_keys: list[str],
+    manifest: dict,
+    key_cache: DimensionKeyCache = None,
+) -> bool:
+    """Loads parquet files into a warehouse table, skipping files the load manifest
+    shows were already loaded, and records the loaded files in the manifest.
+    With a key cache, fact rows referencing dimension keys that are not in the
+    warehouse are written to a quarantine file instead of being loaded, and are
+    loaded by redrive_quarantine once their dimension rows arrive
+
+    Args:
+        client (boto3.client): s3 Client
+        bucket_name (str): processed bucket name
+        table_name (str): Database table to write to
+        file_keys (list[str]): s3 object keys of the table's new files
+        manifest (dict): load manifest, updated in place
+        key_cache (DimensionKeyCache, optional): dimension keys for the run
+
+    Raises:
+        DatabaseError: raised when the write fails
+
+    Returns:
+        bool: False if every file had already been loaded
+    """
+    parquet_files = get_parquet_files(client, file_keys, bucket_name)
+    parquet_files, new_hashes = remove_loaded_files(parquet_files, set(manifest.get(table_name, [])))
+    if not parquet_files:
+        logger.info(f"All new {table_name} files were already loaded")
+        return False
+    df = read_parquet_files(parquet_files)
+    record_volume(table_name, len(df), sum(len(file.getbuffer()) for file in parquet_files))
+    if key_cache is not None and table_name in FOREIGN_KEYS:
+        conn = create_conn()
+        try:
+            df, orphans = key_cache.resolve(conn, table_name, df)
+        finally:
+            close_db_connection(conn)
+        if len(orphans):
+            quarantine_rows(client, bucket_name, table_name, orphans)
+    if len(df):
+        write_frame(table_name, df)
+        if table_name == "dim_date":
+            record_loaded_dates(client, bucket_name, df["date_id"])
+    if key_cache is not None and table_name in DIMENSION_TABLES and PRIMARY_KEYS[table_name] in df.columns:
+        key_cache.add(table_name, df[PRIMARY_KEYS[table_name]])
+    record_hashes(manifest, table_name, new_hashes)
+    return True
+
+
+def read_fact_date_range(
+    client: boto3.client, bucket_name: str, file_keys: list[str], start: datetime.date, end: datetime.date
+) -> pd.DataFrame:
+    """Reads the fact rows created within a date range from processed files
+
+    Each file is read with ranged GETs of its footer and of only the row groups
+    whose created_date statistics overlap the range, rather than downloaded whole
+
+    Args:
+        client (boto3.client): s3 Client
+        bucket_name (str): processed bucket name
+        file_keys (list[str]): s3 object keys of fact files
+        start (datetime.date): first date to read
+        end (datetime.date): last date to read
+
+    Returns:
+        pd.DataFrame: the rows with start <= created_date <= end
+    """
+    tables = []
     for key in file_keys:
-        s3_object = client.get_object(Bucket=bucket_name, Key=key)
-        parquet_file = io.BytesIO(s3_object['Body'].read())
-        parquet_files.append(parquet_file)
-    return parquet_files
+        source = RangedObject(client, bucket_name, key)
+        tables.append(read_date_range(source, start, end).to_pandas())
+        logger.info(f"Read {len(tables[-1])} rows from {key} in {source.requests} requests")
+    return pd.concat(tables) if tables else pd.DataFrame()
+
+
+def reload_date_range(
+    client: boto3.client, bucket_name: str, table_name: str, start: datetime.date, end: datetime.date
+) -> int:
+    """Reloads a fact table's rows for a date range from every processed file of the table
+
+    Args:
+        client (boto3.client): s3 Client
+        bucket_name (str): processed bucket name
+        table_name (str): fact table to reload
+        start (datetime.date): first date to reload
+        end (datetime.date): last date to reload
+
+    Raises:
+        DatabaseError: raised when the write fails
+
+    Returns:
+        int: number of rows read for the range
+    """
+    file_keys = [item["Key"] for item in list_objects(client, bucket_name, f"{table_name}/")]
+    df = read_fact_date_range(client, bucket_name, file_keys, start, end)
+    if len(df):
+        write_frame(table_name, df.drop_duplicates())
+    return len(df)
+
+
+def quarantine_rows(client: boto3.client, bucket_name: str, table_name: str, df: pd.DataFrame) -> str:
+    """Writes rows that cannot be loaded to a parquet file under QUARANTINE_PREFIX
+
+    Args:
+        client (boto3.client): s3 Client
+        bucket_name (str): processed bucket name
+        table_name (str): Database table the rows were meant for
+        df (pd.DataFrame): rows to set aside
+
+    Returns:
+        str: the object key
+    """
+    timestamp = datetime.datetime.now().strftime("%Y/%m/%d/%H_%M_%S")
+    key = f"{QUARANTINE_PREFIX}{table_name}/{timestamp}-{uuid.uuid4().hex[:8]}.parquet"
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    put_body(client, bucket_name, key, buffer.getvalue())
+    logger.info(f"Quarantined {len(df)} {table_name} rows to {key}")
+    return key
+
+
+def redrive_quarantine(
+    client: boto3.client, bucket_name: str, table_name: str, key_cache: DimensionKeyCache
+) -> int:
+    """Loads quarantined fact rows whose dimension keys have since reached the warehouse
+
+    Each quarantine file of the table is resolved again against the key cache.
+    Its resolved rows are loaded, then the file is deleted, or rewritten with
+    the rows that are still missing keys. Fact rows are only inserted when
+    their key is new, so a redrive interrupted after the load is safe to repeat
+
+    Args:
+        client (boto3.client): s3 Client
+        bucket_name (str): processed bucket name
+        table_name (str): fact table the rows were meant for
+        key_cache (DimensionKeyCache): dimension keys for the run
+
+    Raises:
+        DatabaseError: raised when the write fails, leaving the quarantine file in place
+
+    Returns:
+        int: number of rows loaded
+    """
+    loaded = 0
+    for item in list_objects(client, bucket_name, f"{QUARANTINE_PREFIX}{table_name}/"):
+        key = item["Key"]
+        df = pd.read_parquet(io.BytesIO(get_bodies(client, bucket_name, [key])[0]))
+        conn = create_conn()
+        try:
+            resolved, orphans = key_cache.resolve(conn, table_name, df.drop(columns=["missing_keys"]))
+        finally:
+            close_db_connection(conn)
+        if not len(resolved):
+            continue
+        write_frame(table_name, resolved)
+        if len(orphans):
+            buffer = io.BytesIO()
+            orphans.to_parquet(buffer, index=False)
+            put_body(client, bucket_name, key, buffer.getvalue())
+        else:
+            client.delete_object(Bucket=bucket_name, Key=key)
+        loaded += len(resolved)
+        logger.info(f"Loaded {len(resolved)} quarantined {table_name} rows from {key}")
+    return loaded
+
+
+def read_parquet_files(parquet_file_list: list[object]) -> pd.DataFrame:
+    """Reads parquet files into one DataFrame without duplicate rows
+
+    Args:
+        parquet_file_list (list[object]): parquet files or paths
+
+    Returns:
+        pd.DataFrame: the combined rows
+    """
+    return pd.concat([pd.read_parquet(parquet_file) for parquet_file in parquet_file_list]).drop_duplicates()
+
+
+def stage_rows(conn, staging_table: str, df: pd.DataFrame) -> None:
+    """Inserts DataFrame rows into a staging table with multi-row INSERTs of up to STAGING_BATCH_ROWS rows
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection, inside the load transaction
+        staging_table (str): staging table name
+        df (pd.DataFrame): rows to stage
+    """
+    column_names = list(df.columns)
+    batch_rows = max(1, min(STAGING_BATCH_ROWS, MAX_QUERY_PARAMETERS // max(len(column_names), 1)))
+    records = df.to_dict("records")
+    for start in range(0, len(records), batch_rows):
+        batch = records[start:start + batch_rows]
+        values = []
+        params = {}
+        for i, record in enumerate(batch):
+            names = []
+            for j, column in enumerate(column_names):
+                names.append(f":p{i}_{j}")
+                params[f"p{i}_{j}"] = record[column]
+            values.append(f"({', '.join(names)})")
+        conn.run(
+            f"INSERT INTO {staging_table} ({', '.join(column_names)}) VALUES {', '.join(values)}",  # nosec
+            **params,
+        )
 
 
 def write_to_database(table_name: str, parquet_file_list: list[object]) -> None:
     """Converts parquet file list to a pandas DataFrame, removes duplicates,
-      then writes each row to database table
+      then loads it into the table with write_frame
 
     Args:
         table_name (str): Database table to write to
         parquet_file list[object]: List of parquet files to write
+
+    Raises:
+        DatabaseError: raised when the load fails, after the transaction is rolled back
+    """
+    write_frame(table_name, read_parquet_files(parquet_file_list))
+
+
+def ensure_natural_key(conn, table_name: str) -> None:
+    """Creates a fact table's natural key index the first time this process loads the table
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        table_name (str): fact table name
+    """
+    if table_name not in _natural_keys_checked:
+        create_natural_key(conn, table_name)
+        _natural_keys_checked.add(table_name)
+
+
+def write_frame(table_name: str, df: pd.DataFrame) -> None:
+    """Loads a DataFrame into the table in a single transaction. The rows are staged
+      in a temporary table and merged with one INSERT ... SELECT, so a failure
+      rolls the whole batch back. Dimension rows are merged, so a changed row
+      replaces the warehouse row with the same primary key. Fact record ids
+      restart in every transformed file, so the warehouse assigns them, and
+      fact rows whose natural key is already loaded are skipped.
+      Large loads drop the table's non-unique indexes and rebuild them once
+      the rows are committed, both concurrently and outside the transaction
+      so readers of the table are never locked out, and every load refreshes
+      the table's statistics after the commit
+
+    Args:
+        table_name (str): Database table to write to
+        df (pd.DataFrame): rows to write
+
+    Raises:
+        DatabaseError: raised when the load fails, after the transaction is rolled back
     """
     conn = None
     try:
         conn = create_conn()
-        df_list = []
-        for parquet_file in parquet_file_list:
-            df_list.append(pd.read_parquet(parquet_file))
-        df = pd.concat(df_list).drop_duplicates()
+        if table_name in NATURAL_KEYS:
+            df = df.drop(columns=[PRIMARY_KEYS[table_name]], errors="ignore")
         column_names = list(df.columns)
-        insert_str = f"""
+        staging_table = f"{table_name}_staging"
+        merge_str = f"""
         INSERT INTO {table_name} ({", ".join(column_names)})
-        VALUES (:{", :".join(column_names)})"""  # nosec
-        duplicates = 0
-        for _, row in df.iterrows():
-            row_dict = row.to_dict()
+        SELECT {", ".join(column_names)} FROM {staging_table}"""  # nosec
+        if table_name in DIMENSION_TABLES and PRIMARY_KEYS[table_name] in column_names:
+            primary_key = PRIMARY_KEYS[table_name]
+            keys = df[primary_key]
+            if pd.api.types.is_datetime64_any_dtype(keys):
+                # dim_date keys are DATE columns in the warehouse, so times of one day are one key there
+                keys = keys.dt.normalize()
+            df = df[~keys.duplicated(keep="last")]
+            updates = [f"{column} = EXCLUDED.{column}" for column in column_names if column != primary_key]
+            if updates:
+                merge_str += f" ON CONFLICT ({primary_key}) DO UPDATE SET {', '.join(updates)}"  # nosec
+            else:
+                merge_str += f" ON CONFLICT ({primary_key}) DO NOTHING"  # nosec
+        elif table_name in NATURAL_KEYS:
+            ensure_natural_key(conn, table_name)
+            merge_str += f" ON CONFLICT ({', '.join(NATURAL_KEYS[table_name])}) DO NOTHING"  # nosec
+        else:
+            merge_str += " ON CONFLICT DO NOTHING"
+        bulk_load = df.shape[0] >= BULK_LOAD_INDEX_THRESHOLD
+
+        if bulk_load:
+            drop_indexes(conn, table_name, concurrently=True)
+        try:
+            conn.run("BEGIN")
             try:
-                conn.run(insert_str, **dict(row_dict))
-            except DatabaseError as exc:
-                if exc.args[0]['C'] == "23505":
-                    duplicates += 1
-                else:
-                    raise
-        logger.info(f"Succesfully added {df.shape[0] - duplicates} rows to {table_name}. {duplicates}"
+                conn.run(
+                    f"CREATE TEMP TABLE {staging_table} "  # nosec
+                    f"(LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                stage_rows(conn, staging_table, df)
+                conn.run(merge_str)
+                inserted = conn.row_count
+                conn.run("COMMIT")
+            except Exception:
+                conn.run("ROLLBACK")
+                raise
+        finally:
+            if bulk_load:
+                create_indexes(conn, table_name, concurrently=True)
+        analyze(conn, table_name)
+        logger.info(f"Succesfully added {inserted} rows to {table_name}. {df.shape[0] - inserted}"
                     " duplicates skipped")
     finally:
         if conn:
             close_db_connection(conn)
 
 
-def get_parameter(client: boto3.client, parameter_name: str) -> str:
-    """gets parameter from parameter store
+def ensure_date_set(client: boto3.client, bucket_name: str) -> None:
+    """Seeds the set of dim_date dates from the warehouse if it has not been written yet,
+      so the transform only emits dates the warehouse does not already hold. Seeding is an
+      optimisation, so a failure is logged rather than raised
 
     Args:
-        client (boto3.client): ssm_client
-        parameter_name (str): parameter name
+        client (boto3.client): s3 Client
+        bucket_name (str): processed bucket name
+    """
+    if load_date_set(client, bucket_name) is not None:
+        return
+    conn = None
+    try:
+        conn = create_conn()
+        days = seed_date_set(conn, client, bucket_name)
+        logger.info(f"Seeded the dim_date date set with {len(days)} warehouse dates")
+    except DatabaseError as e:
+        logger.warning(f"Could not seed the dim_date date set: {e}")
+    finally:
+        if conn:
+            close_db_connection(conn)
 
-    Raises:
-        Exception: Catches all exceptions
 
-    Returns:
-        str: parameter value
+def record_loaded_dates(client: boto3.client, bucket_name: str, dates: pd.Series) -> None:
+    """Adds committed dim_date dates to the date set. Only the loader writes the set, so it
+      never holds a date whose dim_date row failed to load. A missing set is seeded from the
+      warehouse, which already holds the committed dates
+
+    Args:
+        client (boto3.client): s3 Client
+        bucket_name (str): processed bucket name
+        dates (pd.Series): date_id values of the committed dim_date rows
     """
-    result = client.get_parameter(Name=parameter_name)
-    return result["Parameter"]["Value"]
+    days = load_date_set(client, bucket_name)
+    if days is None:
+        ensure_date_set(client, bucket_name)
+    else:
+        add_dates(client, bucket_name, days, dates)
 
 
 def put_parameter(client: boto3.client, current_date: datetime.datetime) -> str:
@@ -139,9 +483,4 @@ def put_parameter(client: boto3.client, current_date: datetime.datetime) -> str:
         Exception: catches all exceptions
 
     """
-    client.put_parameter(
-        Name="load_last_run",
-        Value=current_date.strftime("%Y_%m_%d-%H_%M_%S"),
-        Overwrite=True,
-        Type="String",
-    )
+    set_parameter(client, "load_last_run", current_date.strftime("%Y_%m_%d-%H_%M_%S"))
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import logging
+from urllib.parse import unquote_plus
+from typing import Callable
+
+try:
+    from src.common.manifest import is_internal_key
+except ImportError:
+    from common.manifest import is_internal_key
+
+logger = logging.getLogger(__name__)
+
+MICRO_BATCH_MAX_KEYS = int(os.getenv("MICRO_BATCH_MAX_KEYS", "50"))
+MICRO_BATCH_MAX_BYTES = int(os.getenv("MICRO_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+MICRO_BATCH_MAX_AGE_SECONDS = float(os.getenv("MICRO_BATCH_MAX_AGE_SECONDS", "30"))
+
+
+def parse_object_events(event: dict) -> list[dict]:
+    """Extracts processed-bucket objects from an SQS batch of S3 notifications, or a direct S3 event
+
+    Args:
+        event (dict): lambda event
+
+    Returns:
+        list[dict]: one dict per object with bucket, key, size and message_id
+    """
+    objects = []
+    for record in event.get("Records", []):
+        if "body" in record:
+            notification = json.loads(record["body"])
+            message_id = record.get("messageId")
+        else:
+            notification = {"Records": [record]}
+            message_id = None
+        for s3_record in notification.get("Records", []):
+            key = unquote_plus(s3_record["s3"]["object"]["key"])
+            if is_internal_key(key) or not key.endswith(".parquet"):
+                continue
+            objects.append({
+                "bucket": s3_record["s3"]["bucket"]["name"],
+                "key": key,
+                "size": s3_record["s3"]["object"].get("size", 0),
+                "message_id": message_id,
+            })
+    return objects
+
+
+class MicroBatcher:
+    """Buffers new processed objects and loads them per table once a size or age threshold is reached
+
+    Args:
+        load (Callable[[str, list[str]], None]): called with a table name and its buffered keys
+        table_order (list[str]): tables in the order they must be loaded, dimensions before facts
+        max_keys (int): flush once this many keys are buffered
+        max_bytes (int): flush once the buffered objects reach this many bytes
+        max_age (float): flush once the oldest buffered key has waited this many seconds
+        clock (Callable[[], float]): time source, replaceable in tests
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str, list[str]], None],
+        table_order: list[str],
+        max_keys: int = None,
+        max_bytes: int = None,
+        max_age: float = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.load = load
+        self.table_order = table_order
+        self.max_keys = max_keys or MICRO_BATCH_MAX_KEYS
+        self.max_bytes = max_bytes or MICRO_BATCH_MAX_BYTES
+        self.max_age = MICRO_BATCH_MAX_AGE_SECONDS if max_age is None else max_age
+        self.clock = clock
+        self.buffer: dict[str, list[str]] = {}
+        self.buffered_keys = 0
+        self.buffered_bytes = 0
+        self.oldest = None
+
+    def add(self, key: str, size: int = 0) -> None:
+        """Buffers an object key, flushing first if the buffer has grown too old
+
+        Keys for tables the loader does not know about are ignored.
+
+        Args:
+            key (str): processed-bucket object key
+            size (int): object size in bytes
+        """
+        table = key.split("/")[0]
+        if table not in self.table_order:
+            logger.info(f"Ignoring {key}, {table} is not a warehouse table")
+            return
+        if self.oldest is not None and self.clock() - self.oldest >= self.max_age:
+            self.flush()
+        if self.oldest is None:
+            self.oldest = self.clock()
+        self.buffer.setdefault(table, []).append(key)
+        self.buffered_keys += 1
+        self.buffered_bytes += size
+        if self.buffered_keys >= self.max_keys or self.buffered_bytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        """Loads every buffered table in table order and empties the buffer"""
+        buffer = self.buffer
+        self.buffer = {}
+        self.buffered_keys = 0
+        self.buffered_bytes = 0
+        self.oldest = None
+        for table in self.table_order:
+            if table in buffer:
+                self.load(table, buffer[table])
@@ -0,0 +1,95 @@
+import json
+import boto3
+import logging
+import traceback
+from datetime import datetime
+
+try:
+    from src.common.object_store import get_bodies, list_objects, put_body
+    from src.common.manifest import content_hash
+except ImportError:
+    from common.object_store import get_bodies, list_objects, put_body
+    from common.manifest import content_hash
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_PREFIX = "_dead_letter/"
+
+
+def record_key(record: dict) -> str | None:
+    """Returns the object key of an S3 event record, or None if the record is malformed"""
+    try:
+        return record["s3"]["object"]["key"]
+    except (KeyError, TypeError):
+        return None
+
+
+def record_table(record: dict) -> str:
+    """Returns the source table of an S3 event record, "unknown" if the record is malformed"""
+    key = record_key(record)
+    return key.split("/")[0] if key else "unknown"
+
+
+def write_dead_letter(
+    client: boto3.client, bucket: str, record: dict, error: Exception, attempts: int = 1
+) -> str:
+    """Writes a record that failed to transform, with its error, under DEAD_LETTER_PREFIX
+
+    Dead letters are named by their table and the hash of their object key, so
+    a record that fails again replaces its earlier dead letter.
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket to write to, the ingestion bucket
+        record (dict): the S3 event record
+        error (Exception): the error raised while transforming it
+        attempts (int, optional): number of times the record has failed
+
+    Returns:
+        str: the object key
+    """
+    key = record_key(record)
+    table = record_table(record)
+    name = content_hash((key or json.dumps(record, sort_keys=True, default=str)).encode("utf-8"))[:16]
+    letter_key = f"{DEAD_LETTER_PREFIX}{table}/{name}.json"
+    letter = {
+        "record": record,
+        "error_type": type(error).__name__,
+        "error": str(error),
+        "traceback": "".join(traceback.format_exception(error)),
+        "failed_at": datetime.now().isoformat(),
+        "attempts": attempts,
+    }
+    put_body(client, bucket, letter_key, json.dumps(letter, default=str).encode("utf-8"))
+    logger.info(f"Dead-lettered {key} to {letter_key}: {letter['error_type']}")
+    return letter_key
+
+
+def load_dead_letters(client: boto3.client, bucket: str, table: str = None) -> dict[str, dict]:
+    """Reads every dead letter, or only those of one table
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket holding the dead letters
+        table (str, optional): source table name
+
+    Returns:
+        dict[str, dict]: dead letters keyed by their object key
+    """
+    prefix = f"{DEAD_LETTER_PREFIX}{table}/" if table else DEAD_LETTER_PREFIX
+    keys = [item["Key"] for item in list_objects(client, bucket, prefix)]
+    return {key: json.loads(body) for key, body in zip(keys, get_bodies(client, bucket, keys))}
+
+
+def delete_dead_letters(client: boto3.client, bucket: str, keys: list[str]) -> None:
+    """Deletes dead letters whose records have been replayed, a thousand keys per request
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): bucket holding the dead letters
+        keys (list[str]): dead letter object keys
+    """
+    for i in range(0, len(keys), 1000):
+        client.delete_objects(
+            Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True}
+        )
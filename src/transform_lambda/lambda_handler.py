@@ -1,79 +1,278 @@
-import boto3
-import json
+import os
+import re
 import logging
 import pandas as pd
-from datetime import datetime
-from decimal import Decimal
-
-from botocore.exceptions import ClientError
 
 try:
-    from src.transform_lambda.transform_helpers import transform_data, save_to_parquet
+    from src.transform_lambda.transform_helpers import transform_data, save_to_parquet, read_ingested_body
+    from src.transform_lambda.spill import should_spill, transform_with_spill
+    from src.transform_lambda.parallel import should_parallelize, transform_parallel
+    from src.transform_lambda.dead_letter import (
+        write_dead_letter,
+        load_dead_letters,
+        delete_dead_letters,
+        record_table,
+    )
+    from src.transform_lambda.row_diff import DIFFED_TABLES, load_fingerprints, save_fingerprints, diff_rows
+    from src.common.object_store import get_s3_client, get_body, put_file
+    from src.common.parameter_store import get_ssm_client, get_parameter
+    from src.common.manifest import is_internal_key, content_hash, load_manifest, save_manifest, record_hashes
+    from src.common.date_set import load_date_set, new_dates
+    from src.common.fact_files import FACT_TABLES
+    from src.common.profiling import profiled, profile_section
+    from src.common.run_history import recorded, record_volume
+    from src.common.sources import source_of, source_partition
+    from src.common.reconciliation import (
+        RECONCILED_TABLES,
+        add_aggregates,
+        add_frame,
+        reconciled_columns,
+        save_ledger,
+    )
 except ImportError:
-    from transform_helpers import transform_data, save_to_parquet
+    from transform_helpers import transform_data, save_to_parquet, read_ingested_body
+    from spill import should_spill, transform_with_spill
+    from parallel import should_parallelize, transform_parallel
+    from dead_letter import write_dead_letter, load_dead_letters, delete_dead_letters, record_table
+    from row_diff import DIFFED_TABLES, load_fingerprints, save_fingerprints, diff_rows
+    from common.object_store import get_s3_client, get_body, put_file
+    from common.parameter_store import get_ssm_client, get_parameter
+    from common.manifest import is_internal_key, content_hash, load_manifest, save_manifest, record_hashes
+    from common.date_set import load_date_set, new_dates
+    from common.fact_files import FACT_TABLES
+    from common.profiling import profiled, profile_section
+    from common.run_history import recorded, record_volume
+    from common.sources import source_of, source_partition
+    from common.reconciliation import (
+        RECONCILED_TABLES,
+        add_aggregates,
+        add_frame,
+        reconciled_columns,
+        save_ledger,
+    )
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-s3_client = boto3.client("s3")
+# Keys the extract writes, {table}/[source={name}/]YYYY/MM/DD/HH-MM-{table}.{extension}
+INGESTED_KEY = re.compile(
+    r"^[^/]+/(?:source=[^/]+/)?(?P<date>\d{2,4}/\d{2}/\d{2})/(?P<hour>\d{2})-(?P<minute>\d{2})-[^/]+$"
+)
 
+s3_client = get_s3_client()
 
-def lambda_handler(event, context):
-    """Lambda function triggered by S3 event to process and transform ingested data."""
-    try:
-        # Validate event structure
-        if "Records" not in event or not isinstance(event["Records"], list):
-            raise ValueError("Invalid event structure: 'Records' field missing or invalid.")
 
-        for record in event["Records"]:
+def transformed_key(output_table: str, key: str) -> str:
+    """Names the transformed object of an ingested object, in the partition of its source database
+
+    The name comes from the ingested key rather than the time of the
+    transform, so transforming an object again, such as a replayed dead
+    letter, overwrites the outputs of the earlier attempt instead of adding
+    duplicates. Keys outside the extract layout are named by their hash.
+    """
+    match = INGESTED_KEY.match(key)
+    name = f"{match['date']}/{match['hour']}_{match['minute']}" if match else content_hash(key.encode())[:16]
+    return f"{output_table}/transformed/{source_partition(source_of(key))}{name}-{output_table}.parquet"
+
+
+def save_new_dates(dim_date: pd.DataFrame, parquet_key: str, processed_bucket: str) -> None:
+    """Saves only the dim_date rows whose dates the warehouse does not hold yet
+
+    The loader adds dates to the set once it commits them, so a date is
+    emitted again until a dim_date file holding it has loaded.
+    """
+    dim_date = new_dates(dim_date, load_date_set(s3_client, processed_bucket))
+    if dim_date.empty:
+        logger.info("No new dim_date rows to save.")
+        return
+    save_to_parquet(dim_date, parquet_key, s3_client, processed_bucket)
+    logger.info("Successfully processed dim_date data to Parquet.")
+
+
+def record_transformed(
+    manifest: dict, ledger: dict, table_name: str, body_hash: str, record_ledger: dict
+) -> None:
+    """Records a transformed file in the batch's manifest, and its rows in the batch's ledger"""
+    record_hashes(manifest, table_name, [body_hash])
+    for output_table, days in record_ledger.items():
+        add_aggregates(ledger, output_table, days)
+
+
+def transform_records(records: list[dict]) -> list[tuple[dict, Exception]]:
+    """Transforms the ingested objects named by a batch of S3 event records.
+
+    Each record is isolated, so a failing record does not stop or retry the
+    rest of the batch. The transform manifest is read once and saved once, and
+    the batch's additions to the processed reconciliation ledger are saved once.
+    A record only adds to the ledger once all of its outputs are saved, and
+    its outputs are named after its key, so a failed record that is replayed
+    replaces what it wrote rather than counting or loading it twice.
+
+    Returns the records that failed, with their errors.
+    """
+    processed_bucket = get_parameter(get_ssm_client(), "processed_bucket_name")
+    manifest = load_manifest(s3_client, processed_bucket, "transform_manifest")
+    ledger = {}
+    manifest_changed = False
+    failures = []
+
+    for record in records:
+        with profile_section(record_table(record)):
             try:
                 # Validate record structure
                 bucket = record["s3"]["bucket"]["name"]
 
                 key = record["s3"]["object"].get("key")  # Safely get 'key'
-                response = s3_client.get_object(Bucket=bucket, Key=key)
-                # Process the raw data
-                data = response["Body"].read().decode("utf-8")
-                raw_data = json.loads(data, parse_float=Decimal)
+                if is_internal_key(key):
+                    logger.info(f"Skipping pipeline state object {key}")
+                    continue
 
-                # Transform and save data
+                # Process the raw data
+                body = get_body(s3_client, bucket, key)
                 table_name = key.split("/")[0]
-                transformed_df = transform_data(raw_data, table_name)
+                record_volume(table_name, size=len(body))
+                record_ledger = {}
+
+                # Skip data identical to a file that was already transformed
+                body_hash = content_hash(body)
+                if body_hash in manifest.get(table_name, []):
+                    logger.info(f"Skipping {key}, identical {table_name} data was already transformed")
+                    continue
+
+                # Files too big to transform in memory are transformed in chunks and spilled to disk
+                if should_spill(table_name, len(body)):
+                    for output_table, path in transform_with_spill(body, key, table_name).items():
+                        parquet_key = transformed_key(output_table, key)
+                        if output_table == "dim_date":
+                            save_new_dates(pd.read_parquet(path), parquet_key, processed_bucket)
+                        else:
+                            if output_table in RECONCILED_TABLES:
+                                columns = reconciled_columns(output_table)
+                                add_frame(record_ledger, output_table, pd.read_parquet(path, columns=columns))
+                            put_file(s3_client, processed_bucket, parquet_key, path)
+                            logger.info(f"Successfully processed {output_table} data to Parquet.")
+                        os.remove(path)
+                    record_transformed(manifest, ledger, table_name, body_hash, record_ledger)
+                    manifest_changed = True
+                    continue
+
+                raw_data = read_ingested_body(body, key)
+                record_volume(table_name, rows=len(raw_data))
+
+                # Transform and save data, large payloads across several processes
+                if should_parallelize(table_name, len(raw_data)):
+                    transformed_df = transform_parallel(raw_data, table_name)
+                else:
+                    transformed_df = transform_data(raw_data, table_name)
 
                 if isinstance(transformed_df, pd.DataFrame):
-                    current_date = datetime.now().strftime("%Y/%m/%d/%H_%M")
                     if table_name == "address":
-                        parquet_key = f"dim_location/transformed/{current_date}-dim_location.parquet"
+                        output_table = "dim_location"
                     elif table_name in ["payment", "purchase_order"]:
-                        parquet_key = f"""fact_{table_name}/transformed/
-                                          {current_date}-fact_{table_name}.parquet"""
+                        output_table = f"fact_{table_name}"
+                    else:
+                        output_table = f"dim_{table_name}"
+                    parquet_key = transformed_key(output_table, key)
+
+                    # Only new and changed dimension rows are passed on to the loader
+                    if output_table in DIFFED_TABLES:
+                        fingerprints = load_fingerprints(s3_client, processed_bucket, output_table)
+                        transformed_df, fingerprints = diff_rows(transformed_df, output_table, fingerprints)
+
+                    if transformed_df.empty:
+                        logger.info(f"No new or changed {table_name} rows to save.")
                     else:
-                        parquet_key = f"dim_{table_name}/transformed/{current_date}-dim_{table_name}.parquet"
-                    save_to_parquet(transformed_df, parquet_key, s3_client)
+                        save_to_parquet(transformed_df, parquet_key, s3_client, processed_bucket,
+                                        fact=output_table in FACT_TABLES)
+                        if output_table in DIFFED_TABLES:
+                            save_fingerprints(s3_client, processed_bucket, output_table, fingerprints)
+                        add_frame(record_ledger, output_table, transformed_df)
 
-                    logger.info(f"Successfully processed {table_name} data to Parquet.")
+                        logger.info(f"Successfully processed {table_name} data to Parquet.")
 
                 elif isinstance(transformed_df, list):
                     table_names = ["fact_sales_order", "dim_date"]
                     for i in range(len(transformed_df)):
-                        current_date = datetime.now().strftime("%Y/%m/%d/%H_%M")
-                        parquet_key = f"{table_names[i]}/transformed/{current_date}-{table_names[i]}.parquet"
-                        save_to_parquet(transformed_df[i], parquet_key, s3_client)
+                        parquet_key = transformed_key(table_names[i], key)
+                        # Only dates that are new to the warehouse are passed on to the loader
+                        if table_names[i] == "dim_date":
+                            save_new_dates(transformed_df[i], parquet_key, processed_bucket)
+                            continue
+                        save_to_parquet(transformed_df[i], parquet_key, s3_client, processed_bucket,
+                                        fact=table_names[i] in FACT_TABLES)
+                        add_frame(record_ledger, table_names[i], transformed_df[i])
 
                         logger.info(f"Successfully processed {table_names[i]} data to Parquet.")
                 else:
-                    raise ClientError
+                    # Lookup tables such as department have no warehouse table of their own
+                    logger.info(f"No warehouse output for {table_name}, skipping {key}")
 
-            except ClientError as botoErr:
-                logger.error(f"Botocore error {botoErr}")
-                raise
+                record_transformed(manifest, ledger, table_name, body_hash, record_ledger)
+                manifest_changed = True
 
             except Exception as record_error:
                 logger.exception(f"Error processing record {record}: {record_error}")
-                continue
+                failures.append((record, record_error))
+
+    if manifest_changed:
+        save_manifest(s3_client, processed_bucket, "transform_manifest", manifest)
+        save_ledger(s3_client, processed_bucket, "processed", ledger)
+    return failures
 
+
+@recorded("transform")
+@profiled
+def lambda_handler(event, context):
+    """Lambda function triggered by S3 event to process and transform ingested data.
+
+    Records that fail are written to the dead-letter prefix of their bucket
+    instead of failing the invocation, so S3 never retries the healthy ones.
+    """
+    try:
+        # Validate event structure
+        if "Records" not in event or not isinstance(event["Records"], list):
+            raise ValueError("Invalid event structure: 'Records' field missing or invalid.")
+
+        for record, error in transform_records(event["Records"]):
+            write_dead_letter(s3_client, dead_letter_bucket(record), record, error)
         return "Successfully ran"
 
     except Exception as e:
         logger.exception(f"Critical error processing event: {e}")
         raise e
+
+
+def dead_letter_bucket(record: dict) -> str:
+    """Returns the bucket a failed record's dead letter is written to, the bucket it came from"""
+    try:
+        return record["s3"]["bucket"]["name"]
+    except (KeyError, TypeError):
+        return get_parameter(get_ssm_client(), "ingestion_bucket_name")
+
+
+@profiled
+def replay_dead_letters(event, context):
+    """Re-drives dead-lettered records through the batched transform path.
+
+    The event can name a "table" to replay only its records, and a "bucket"
+    other than the ingestion bucket. Records that transform are removed from
+    the dead letters, and records that fail again have their dead letter
+    updated with the new error.
+    """
+    bucket = event.get("bucket") or get_parameter(get_ssm_client(), "ingestion_bucket_name")
+    letters = load_dead_letters(s3_client, bucket, event.get("table"))
+    if not letters:
+        return "No dead letters to replay"
+
+    failed = {id(record): error for record, error in
+              transform_records([letter["record"] for letter in letters.values()])}
+    replayed = []
+    for letter_key, letter in letters.items():
+        error = failed.get(id(letter["record"]))
+        if error is None:
+            replayed.append(letter_key)
+        else:
+            write_dead_letter(s3_client, bucket, letter["record"], error, letter.get("attempts", 1) + 1)
+    delete_dead_letters(s3_client, bucket, replayed)
+    logger.info(f"Replayed {len(replayed)} of {len(letters)} dead letters")
+    return f"Replayed {len(replayed)} of {len(letters)} dead letters"
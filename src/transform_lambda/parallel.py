@@ -0,0 +1,162 @@
+import os
+import math
+import logging
+import traceback
+import multiprocessing
+import pandas as pd
+import pyarrow as pa
+
+try:
+    from src.transform_lambda.transform_helpers import transform_data
+    from src.transform_lambda.spill import CHUNKED_TABLES, DEDUPLICATED_OUTPUTS
+except ImportError:
+    from transform_helpers import transform_data
+    from spill import CHUNKED_TABLES, DEDUPLICATED_OUTPUTS
+
+logger = logging.getLogger(__name__)
+
+# "process" transforms large payloads of CHUNKED_TABLES in row ranges across worker processes
+TRANSFORM_PARALLEL = os.getenv("TRANSFORM_PARALLEL", "off")
+TRANSFORM_PARALLEL_WORKERS = int(os.getenv("TRANSFORM_PARALLEL_WORKERS", str(os.cpu_count() or 1)))
+# Below this many rows starting processes costs more than it saves
+TRANSFORM_PARALLEL_MIN_ROWS = int(os.getenv("TRANSFORM_PARALLEL_MIN_ROWS", "20000"))
+
+
+def should_parallelize(table_name: str, num_rows: int) -> bool:
+    """Checks whether a payload is transformed across worker processes
+
+    Args:
+        table_name (str): source table name
+        num_rows (int): rows in the payload
+
+    Returns:
+        bool: True for large payloads of row-local tables when parallel mode is on and there are several CPUs
+    """
+    return (
+        TRANSFORM_PARALLEL == "process"
+        and TRANSFORM_PARALLEL_WORKERS > 1
+        and table_name in CHUNKED_TABLES
+        and num_rows >= TRANSFORM_PARALLEL_MIN_ROWS
+    )
+
+
+def row_ranges(num_rows: int, workers: int) -> list[tuple[int, int]]:
+    """Splits rows into at most one contiguous range per worker
+
+    Args:
+        num_rows (int): number of rows
+        workers (int): number of workers
+
+    Returns:
+        list[tuple[int, int]]: start and end of each range
+    """
+    size = max(1, math.ceil(num_rows / workers))
+    return [(start, min(start + size, num_rows)) for start in range(0, num_rows, size)]
+
+
+def chunk_frame(raw_data, start: int, end: int) -> pd.DataFrame:
+    """Builds the frame of one row range, indexed by row position so row numbers match a single pass
+
+    Args:
+        raw_data: json rows, a typed Arrow table or a frame
+        start (int): first row
+        end (int): row after the last
+
+    Returns:
+        pd.DataFrame: the rows of the range
+    """
+    if isinstance(raw_data, pd.DataFrame):
+        return raw_data.iloc[start:end]
+    if isinstance(raw_data, pa.Table):
+        df = raw_data.slice(start, end - start).to_pandas()
+    else:
+        df = pd.DataFrame(raw_data[start:end])
+    df.index = pd.RangeIndex(start, end)
+    return df
+
+
+def to_ipc(df: pd.DataFrame) -> bytes:
+    """Serialises a transformed frame as an Arrow IPC stream"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def transform_range(conn, raw_data, start: int, end: int, table_name: str) -> None:
+    """Worker process body: transforms one row range and sends its outputs back through a pipe
+
+    The worker builds the frame of its own range, so parsing rows into a
+    frame is spread across the workers too. Each output is sent as Arrow IPC
+    bytes, and a failure is sent as its traceback.
+    """
+    try:
+        transformed = transform_data(chunk_frame(raw_data, start, end), table_name)
+        if isinstance(transformed, pd.DataFrame):
+            transformed = [transformed]
+        conn.send(("ok", [to_ipc(df) for df in transformed]))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def transform_parallel(raw_data, table_name: str, workers: int = None):
+    """Transforms a payload in row ranges across worker processes and concatenates the results
+
+    Workers are forked with the raw payload already in memory and return their
+    outputs through pipes, which unlike pools and queues need no shared
+    memory, so this works in Lambda. Outputs are concatenated as Arrow tables,
+    and the outputs in DEDUPLICATED_OUTPUTS keep one row per calendar day.
+
+    Args:
+        raw_data: json rows, a typed Arrow table or a frame
+        table_name (str): source table name, one of CHUNKED_TABLES
+        workers (int, optional): number of processes, TRANSFORM_PARALLEL_WORKERS by default
+
+    Raises:
+        RuntimeError: when a worker fails or dies, with the worker's traceback
+
+    Returns:
+        pd.DataFrame | list[pd.DataFrame]: the same outputs as transform_data
+    """
+    num_rows = len(raw_data)
+    if not num_rows:
+        return transform_data(raw_data, table_name)
+    ranges = row_ranges(num_rows, workers or TRANSFORM_PARALLEL_WORKERS)
+    context = multiprocessing.get_context("fork")
+
+    processes = []
+    for start, end in ranges:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=transform_range, args=(sender, raw_data, start, end, table_name))
+        process.start()
+        sender.close()
+        processes.append((process, receiver))
+
+    results, errors = [], []
+    for process, receiver in processes:
+        try:
+            status, payload = receiver.recv()
+        except EOFError:
+            status, payload = "error", None
+        receiver.close()
+        process.join()
+        if payload is None:
+            payload = f"worker exited with code {process.exitcode} before sending its results"
+        if status == "ok":
+            results.append([pa.ipc.open_stream(body).read_all() for body in payload])
+        else:
+            errors.append(payload)
+    if errors:
+        raise RuntimeError(f"Parallel transform of {table_name} failed:\n{errors[0]}")
+    logger.info(f"Transformed {num_rows} {table_name} rows in {len(ranges)} processes")
+
+    outputs = []
+    for name, tables in zip(CHUNKED_TABLES[table_name], zip(*results)):
+        df = pa.concat_tables(tables, promote_options="default").to_pandas()
+        if name in DEDUPLICATED_OUTPUTS:
+            df = df[~df["date_id"].dt.normalize().duplicated()].reset_index(drop=True)
+        outputs.append(df)
+    return outputs[0] if len(outputs) == 1 else outputs
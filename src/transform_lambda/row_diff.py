@@ -0,0 +1,99 @@
+import io
+import boto3
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from src.common.manifest import load_state, save_state
+    from src.common.warehouse_schema import PRIMARY_KEYS
+except ImportError:
+    from common.manifest import load_state, save_state
+    from common.warehouse_schema import PRIMARY_KEYS
+
+logger = logging.getLogger(__name__)
+
+DIFFED_TABLES = [
+    "dim_staff",
+    "dim_location",
+    "dim_currency",
+    "dim_design",
+    "dim_counterparty",
+    "dim_transaction",
+    "dim_payment_type",
+]
+
+
+def row_fingerprints(df: pd.DataFrame, table: str) -> pd.Series:
+    """Hashes every row of a transformed table
+
+    Args:
+        df (pd.DataFrame): transformed table
+        table (str): warehouse table name
+
+    Returns:
+        pd.Series: uint64 row hashes indexed by primary key
+    """
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    hashes.index = df[PRIMARY_KEYS[table]].values
+    return hashes
+
+
+def load_fingerprints(client: boto3.client, bucket: str, table: str) -> pd.Series:
+    """Reads the fingerprint index (primary key -> row hash) for a table
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+        table (str): warehouse table name
+
+    Returns:
+        pd.Series: row hashes indexed by primary key, empty if there is no index yet
+    """
+    body = load_state(client, bucket, f"fingerprints/{table}.parquet")
+    if body is None:
+        return pd.Series(dtype="uint64")
+    df = pq.read_table(io.BytesIO(body)).to_pandas()
+    return pd.Series(df["row_hash"].values, index=df["key"].values)
+
+
+def save_fingerprints(client: boto3.client, bucket: str, table: str, fingerprints: pd.Series) -> str:
+    """Writes the fingerprint index for a table
+
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): processed bucket name
+        table (str): warehouse table name
+        fingerprints (pd.Series): row hashes indexed by primary key
+
+    Returns:
+        str: the object key
+    """
+    index_table = pa.table({"key": fingerprints.index.values, "row_hash": fingerprints.values})
+    buffer = pa.BufferOutputStream()
+    pq.write_table(index_table, buffer)
+    return save_state(client, bucket, f"fingerprints/{table}.parquet", buffer.getvalue().to_pybytes())
+
+
+def diff_rows(df: pd.DataFrame, table: str, fingerprints: pd.Series) -> tuple[pd.DataFrame, pd.Series]:
+    """Keeps only the rows that are new or have changed since the fingerprint index was written
+
+    Args:
+        df (pd.DataFrame): transformed table
+        table (str): warehouse table name
+        fingerprints (pd.Series): current fingerprint index for the table
+
+    Returns:
+        tuple[pd.DataFrame, pd.Series]: the delta rows and the updated fingerprint index
+    """
+    df = df.drop_duplicates(subset=[PRIMARY_KEYS[table]], keep="last")
+    hashes = row_fingerprints(df, table)
+    known = hashes.index.isin(fingerprints.index)
+    changed = ~known
+    changed[known] = fingerprints.reindex(hashes.index[known]).values != hashes.values[known]
+    delta = df[changed]
+
+    updated = pd.concat([fingerprints[~fingerprints.index.isin(hashes.index)], hashes])
+    logger.info(f"{len(delta)} of {len(df)} {table} rows are new or changed")
+    return delta, updated
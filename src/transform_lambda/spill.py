@@ -0,0 +1,254 @@
+import io
+import os
+import json
+import uuid
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from decimal import Decimal
+from typing import Iterator
+
+try:
+    from src.transform_lambda.transform_helpers import transform_data
+    from src.common.fact_files import FACT_TABLES, FACT_SORT_COLUMN, FACT_ROW_GROUP_ROWS
+except ImportError:
+    from transform_helpers import transform_data
+    from common.fact_files import FACT_TABLES, FACT_SORT_COLUMN, FACT_ROW_GROUP_ROWS
+
+logger = logging.getLogger(__name__)
+
+TRANSFORM_MEMORY_BUDGET_BYTES = int(os.getenv("TRANSFORM_MEMORY_BUDGET_BYTES", str(256 * 1024 * 1024)))
+TRANSFORM_SPILL_DIR = os.getenv("TRANSFORM_SPILL_DIR", tempfile.gettempdir())
+# Rough in-memory size of parsed rows (dicts and DataFrames) relative to their raw file size
+TRANSFORM_EXPANSION_FACTOR = int(os.getenv("TRANSFORM_EXPANSION_FACTOR", "10"))
+
+# Row-local transforms and the tables they produce. The outputs named in
+# DEDUPLICATED_OUTPUTS are small and are combined in memory and deduplicated.
+CHUNKED_TABLES = {
+    "sales_order": ["fact_sales_order", "dim_date"],
+    "payment": ["fact_payment"],
+    "purchase_order": ["fact_purchase_order"],
+}
+DEDUPLICATED_OUTPUTS = {"dim_date"}
+
+
+def should_spill(table_name: str, size: int) -> bool:
+    """Checks whether an ingested file is too big to transform in memory
+
+    Args:
+        table_name (str): source table name
+        size (int): raw file size in bytes
+
+    Returns:
+        bool: True if the table can be chunked and the file would exceed the memory budget
+    """
+    return table_name in CHUNKED_TABLES and size * TRANSFORM_EXPANSION_FACTOR > TRANSFORM_MEMORY_BUDGET_BYTES
+
+
+def chunk_rows_for(size: int, num_rows: int) -> int:
+    """Picks a chunk length whose parsed rows fit in half the memory budget
+
+    Args:
+        size (int): raw file size in bytes
+        num_rows (int): number of rows in the file
+
+    Returns:
+        int: rows per chunk
+    """
+    row_bytes = max(1, size * TRANSFORM_EXPANSION_FACTOR // max(num_rows, 1))
+    return max(1, TRANSFORM_MEMORY_BUDGET_BYTES // 2 // row_bytes)
+
+
+def iter_row_chunks(body: bytes, key: str, chunk_rows: int = None) -> Iterator[pd.DataFrame]:
+    """Yields an ingested file as DataFrames of at most chunk_rows rows
+
+    Each chunk keeps its row positions as its index, so transforms that number
+    rows from the index give the same ids as a single in-memory pass. Parquet
+    files are read a batch at a time. Json files have to be parsed whole, but
+    only one chunk is turned into a DataFrame at a time.
+
+    Args:
+        body (bytes): file contents
+        key (str): object key, whose suffix gives the file format
+        chunk_rows (int, optional): rows per chunk, sized from the memory budget by default
+
+    Yields:
+        pd.DataFrame: the next chunk of rows
+    """
+    if key.endswith(".parquet"):
+        parquet_file = pq.ParquetFile(io.BytesIO(body))
+        chunk_rows = chunk_rows or chunk_rows_for(len(body), parquet_file.metadata.num_rows)
+        start = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            df = batch.to_pandas()
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield df
+    else:
+        rows = json.loads(body.decode("utf-8"), parse_float=Decimal)
+        chunk_rows = chunk_rows or chunk_rows_for(len(body), len(rows))
+        for start in range(0, len(rows), chunk_rows):
+            chunk = rows[start:start + chunk_rows]
+            yield pd.DataFrame(chunk, index=pd.RangeIndex(start, start + len(chunk)))
+
+
+def merge_sorted_runs(runs: list[pa.Table], column: str, rows: int) -> Iterator[pa.Table]:
+    """Merges tables that are each sorted by a column into one stream in column order
+
+    The runs are cut at every distinct value of the column, so only slices
+    of the (memory mapped) runs are gathered, and rows with equal values keep
+    the order of their runs, as a stable sort of all the rows would.
+
+    Args:
+        runs (list[pa.Table]): tables sorted ascending by column, nulls last
+        column (str): sort column, a date or another type that casts to integers
+        rows (int): rows per yielded table, except for the last
+
+    Yields:
+        pa.Table: the next rows in column order
+    """
+    keys = []
+    for run in runs:
+        integer = pa.int32() if pa.types.is_date32(run.schema.field(column).type) else pa.int64()
+        # Nulls are sorted last, so they take the largest key
+        keys.append(run[column].cast(integer).fill_null(np.iinfo(integer.to_pandas_dtype()).max).to_numpy())
+    positions = [0] * len(runs)
+    pending, pending_rows = [], 0
+    for value in np.unique(np.concatenate([np.unique(key) for key in keys] or [[]])):
+        for i, run in enumerate(runs):
+            end = int(np.searchsorted(keys[i], value, side="right"))
+            if end > positions[i]:
+                pending.append(run.slice(positions[i], end - positions[i]))
+                pending_rows += end - positions[i]
+                positions[i] = end
+        if pending_rows >= rows:
+            table = pa.concat_tables(pending)
+            full = pending_rows // rows * rows
+            yield table.slice(0, full)
+            pending, pending_rows = [table.slice(full)], pending_rows - full
+    if pending_rows:
+        yield pa.concat_tables(pending)
+
+
+class SpillFile:
+    """Arrow IPC file in the spill directory that transformed chunks are appended to
+
+    Fact chunks are sorted by created_date as they are written, so each
+    chunk is a sorted run, and the runs are merged when the Parquet file is
+    written.
+
+    Args:
+        name (str): output table name, used in the file name
+        spill_dir (str): directory to write to
+    """
+
+    def __init__(self, name: str, spill_dir: str):
+        self.name = name
+        self.path = os.path.join(spill_dir, f"{name}-{uuid.uuid4().hex}.arrow")
+        self.schema = None
+        self.writer = None
+        self.sort_column = None
+        # Number of record batches in each sorted run
+        self.runs = []
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Appends a transformed chunk, cast to the schema of the first chunk"""
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pa.ipc.new_file(self.path, self.schema)
+            if self.name in FACT_TABLES and FACT_SORT_COLUMN in self.schema.names:
+                self.sort_column = FACT_SORT_COLUMN
+        if self.sort_column:
+            table = table.sort_by([(self.sort_column, "ascending")])
+        batches = table.to_batches()
+        for batch in batches:
+            self.writer.write_batch(batch)
+        self.runs.append(len(batches))
+
+    def to_parquet(self, parquet_path: str) -> None:
+        """Closes the spill file and streams its batches from a memory map into a Parquet file
+
+        Fact tables are written sorted by created_date, merging the sorted
+        runs of the chunks, with the sort order recorded in the metadata like
+        write_fact_table. They get small row groups with statistics and page
+        indexes, so loads can still skip row groups outside a date range.
+        """
+        self.writer.close()
+        fact = self.name in FACT_TABLES
+        row_group_size = FACT_ROW_GROUP_ROWS if fact else None
+        options = {"write_page_index": fact}
+        if self.sort_column:
+            options["sorting_columns"] = pq.SortingColumn.from_ordering(
+                self.schema, [(self.sort_column, "ascending")]
+            )
+        with pa.memory_map(self.path) as source:
+            reader = pa.ipc.open_file(source)
+            with pq.ParquetWriter(parquet_path, reader.schema, **options) as writer:
+                if self.sort_column:
+                    runs, start = [], 0
+                    for count in self.runs:
+                        batches = [reader.get_batch(i) for i in range(start, start + count)]
+                        runs.append(pa.Table.from_batches(batches, schema=reader.schema))
+                        start += count
+                    for table in merge_sorted_runs(runs, self.sort_column, row_group_size):
+                        writer.write_table(table, row_group_size=row_group_size)
+                else:
+                    for i in range(reader.num_record_batches):
+                        writer.write_batch(reader.get_batch(i), row_group_size=row_group_size)
+        os.remove(self.path)
+
+
+def transform_with_spill(
+    body: bytes, key: str, table_name: str, chunk_rows: int = None, spill_dir: str = None
+) -> dict[str, str]:
+    """Transforms an ingested file chunk by chunk, spilling the output to disk
+
+    Transformed chunks are appended to Arrow IPC files and combined into one
+    Parquet file per output table once every chunk is done, so only one
+    chunk of input and output is held in memory at a time. Fact outputs
+    come out sorted by created_date, as the in-memory transform writes them.
+
+    Args:
+        body (bytes): file contents
+        key (str): object key, whose suffix gives the file format
+        table_name (str): source table name, one of CHUNKED_TABLES
+        chunk_rows (int, optional): rows per chunk, sized from the memory budget by default
+        spill_dir (str, optional): directory for the spill and output files
+
+    Returns:
+        dict[str, str]: local Parquet file path keyed by output table
+    """
+    spill_dir = spill_dir or TRANSFORM_SPILL_DIR
+    outputs = CHUNKED_TABLES[table_name]
+    spill_files = {name: SpillFile(name, spill_dir) for name in outputs if name not in DEDUPLICATED_OUTPUTS}
+    deduplicated = {name: [] for name in outputs if name in DEDUPLICATED_OUTPUTS}
+
+    chunks = 0
+    for chunk in iter_row_chunks(body, key, chunk_rows):
+        transformed = transform_data(chunk, table_name)
+        if isinstance(transformed, pd.DataFrame):
+            transformed = [transformed]
+        for name, df in zip(outputs, transformed):
+            if name in spill_files:
+                spill_files[name].write(df)
+            else:
+                deduplicated[name].append(df)
+        chunks += 1
+    logger.info(f"Transformed {table_name} in {chunks} chunks")
+    if not chunks:
+        return {}
+
+    paths = {}
+    for name in outputs:
+        paths[name] = os.path.join(spill_dir, f"{name}-{uuid.uuid4().hex}.parquet")
+        if name in spill_files:
+            spill_files[name].to_parquet(paths[name])
+        else:
+            df = pd.concat(deduplicated[name])
+            df = df[~df["date_id"].dt.normalize().duplicated()].reset_index(drop=True)
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), paths[name])
+    return paths
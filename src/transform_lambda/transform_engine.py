@@ -0,0 +1,285 @@
+import logging
+import numpy as np
+import pandas as pd
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+CURRENCY_NAMES = {
+    "USD": "United States Dollar",
+    "GBP": "British Pound",
+    "EUR": "Euro",
+}
+
+# Each warehouse table is declared as a mapping of output column to a column
+# expression over its source rows. Expressions are tuples:
+#   ("column", source)                    copy a source column
+#   ("fill", source, value)               copy a source column, filling missing values
+#   ("date", source) / ("time", source)   date or time part of an ISO8601 timestamp column
+#   ("float", source)                     cast to float
+#   ("round", source, digits)             round to a number of decimal places
+#   ("constant", value)                   the same value on every row
+#   ("row_number",)                       1-based position of the row in the source file
+#   ("lookup", lookup, key, value)        value column of a lookup row, matched on a key column
+#   ("map", source, mapping, override)    map a column through a dict, unless an override column exists
+#   ("dt", source, field, offset)         a datetime field of a timestamp column, plus an offset
+#   ("strftime", source, format)          a timestamp column formatted as text
+# A spec's "lookups" name the ingested table and key column of each lookup,
+# and a spec with "unique_days" builds its rows from the distinct calendar
+# days found in those timestamp columns instead of from the source rows.
+TRANSFORM_SPECS = {
+    "dim_staff": {
+        "lookups": {"department": ("department", "department_id")},
+        "columns": {
+            "staff_id": ("column", "staff_id"),
+            "first_name": ("column", "first_name"),
+            "last_name": ("column", "last_name"),
+            "email_address": ("column", "email_address"),
+            "department_name": ("lookup", "department", "department_id", "department_name"),
+            "location": ("lookup", "department", "department_id", "location"),
+        },
+    },
+    "dim_location": {
+        "columns": {
+            "location_id": ("column", "address_id"),
+            "address_line_1": ("column", "address_line_1"),
+            "address_line_2": ("fill", "address_line_2", "None"),
+            "district": ("fill", "district", "None"),
+            "city": ("column", "city"),
+            "postal_code": ("column", "postal_code"),
+            "country": ("column", "country"),
+            "phone": ("column", "phone"),
+        },
+    },
+    "dim_design": {
+        "columns": {
+            "design_id": ("column", "design_id"),
+            "design_name": ("column", "design_name"),
+            "file_location": ("column", "file_location"),
+            "file_name": ("column", "file_name"),
+        },
+    },
+    "dim_currency": {
+        "columns": {
+            "currency_id": ("column", "currency_id"),
+            "currency_code": ("column", "currency_code"),
+            "currency_name": ("map", "currency_code", CURRENCY_NAMES, "currency_name"),
+        },
+    },
+    "dim_counterparty": {
+        "lookups": {"address": ("address", "address_id")},
+        "columns": {
+            "counterparty_id": ("column", "counterparty_id"),
+            "counterparty_legal_name": ("column", "counterparty_legal_name"),
+            "counterparty_legal_address_line_1": ("lookup", "address", "legal_address_id", "address_line_1"),
+            "counterparty_legal_address_line_2": ("lookup", "address", "legal_address_id", "address_line_2"),
+            "counterparty_legal_district": ("lookup", "address", "legal_address_id", "district"),
+            "counterparty_legal_city": ("lookup", "address", "legal_address_id", "city"),
+            "counterparty_legal_postal_code": ("lookup", "address", "legal_address_id", "postal_code"),
+            "counterparty_legal_country": ("lookup", "address", "legal_address_id", "country"),
+            "counterparty_legal_phone_number": ("lookup", "address", "legal_address_id", "phone"),
+        },
+    },
+    "dim_transaction": {
+        "columns": {
+            "transaction_id": ("column", "transaction_id"),
+            "transaction_type": ("column", "transaction_type"),
+            "sales_order_id": ("column", "sales_order_id"),
+            "purchase_order_id": ("column", "purchase_order_id"),
+        },
+    },
+    "dim_payment_type": {
+        "columns": {
+            "payment_type_id": ("column", "payment_type_id"),
+            "payment_type_name": ("column", "payment_type_name"),
+        },
+    },
+    "dim_date": {
+        "unique_days": ["created_at", "last_updated", "agreed_payment_date", "agreed_delivery_date"],
+        "columns": {
+            "date_id": ("column", "date_id"),
+            "year": ("dt", "date_id", "year", 0),
+            "month": ("dt", "date_id", "month", 0),
+            "day": ("dt", "date_id", "day", 0),
+            "day_of_week": ("dt", "date_id", "weekday", 1),
+            "day_name": ("strftime", "date_id", "%A"),
+            "month_name": ("strftime", "date_id", "%B"),
+            "quarter": ("dt", "date_id", "quarter", 0),
+        },
+    },
+    "fact_sales_order": {
+        "columns": {
+            "sales_record_id": ("row_number",),
+            "sales_order_id": ("column", "sales_order_id"),
+            "created_date": ("date", "created_at"),
+            "created_time": ("time", "created_at"),
+            "last_updated_date": ("date", "last_updated"),
+            "last_updated_time": ("time", "last_updated"),
+            "sales_staff_id": ("column", "staff_id"),
+            "counterparty_id": ("column", "counterparty_id"),
+            "units_sold": ("column", "units_sold"),
+            "unit_price": ("float", "unit_price"),
+            "currency_id": ("column", "currency_id"),
+            "design_id": ("column", "design_id"),
+            "agreed_payment_date": ("date", "agreed_payment_date"),
+            "agreed_delivery_date": ("date", "agreed_delivery_date"),
+            "agreed_delivery_location_id": ("column", "agreed_delivery_location_id"),
+        },
+    },
+    "fact_payment": {
+        "columns": {
+            "payment_record_id": ("row_number",),
+            "payment_id": ("column", "payment_id"),
+            "created_date": ("date", "created_at"),
+            "created_time": ("time", "created_at"),
+            "last_updated_date": ("date", "last_updated"),
+            "last_updated_time": ("time", "last_updated"),
+            "transaction_id": ("column", "transaction_id"),
+            "counterparty_id": ("column", "counterparty_id"),
+            "payment_amount": ("round", "payment_amount", 2),
+            "currency_id": ("column", "currency_id"),
+            "payment_type_id": ("column", "payment_type_id"),
+            "paid": ("column", "paid"),
+            "payment_date": ("date", "payment_date"),
+        },
+    },
+    "fact_purchase_order": {
+        "columns": {
+            "purchase_record_id": ("row_number",),
+            "purchase_order_id": ("column", "purchase_order_id"),
+            "created_date": ("date", "created_at"),
+            "created_time": ("time", "created_at"),
+            "last_updated_date": ("date", "last_updated"),
+            "last_updated_time": ("time", "last_updated"),
+            "staff_id": ("column", "staff_id"),
+            "counterparty_id": ("column", "counterparty_id"),
+            "item_code": ("column", "item_code"),
+            "item_quantity": ("column", "item_quantity"),
+            "item_unit_price": ("round", "item_unit_price", 2),
+            "currency_id": ("column", "currency_id"),
+            "agreed_delivery_date": ("date", "agreed_delivery_date"),
+            "agreed_payment_date": ("date", "agreed_payment_date"),
+            "agreed_delivery_location_id": ("column", "agreed_delivery_location_id"),
+        },
+    },
+}
+
+# Warehouse tables produced from each ingested source table, in output order
+SOURCE_OUTPUTS = {
+    "staff": ["dim_staff"],
+    "sales_order": ["fact_sales_order", "dim_date"],
+    "address": ["dim_location"],
+    "design": ["dim_design"],
+    "currency": ["dim_currency"],
+    "counterparty": ["dim_counterparty"],
+    "transaction": ["dim_transaction"],
+    "payment_type": ["dim_payment_type"],
+    "payment": ["fact_payment"],
+    "purchase_order": ["fact_purchase_order"],
+}
+
+
+class _Pass:
+    """State for one pass over a source frame, caching parsed timestamp columns and lookups"""
+
+    def __init__(self, frame: pd.DataFrame, lookups: dict, load_lookup: Callable[[str], pd.DataFrame]):
+        self.frame = frame
+        self.lookups = lookups
+        self.load_lookup = load_lookup
+        self.timestamps = {}
+        self.lookup_frames = {}
+
+    def timestamp(self, source: str) -> pd.Series:
+        if source not in self.timestamps:
+            column = self.frame[source]
+            if not pd.api.types.is_datetime64_any_dtype(column):
+                column = pd.to_datetime(column, format="ISO8601")
+            self.timestamps[source] = column
+        return self.timestamps[source]
+
+    def lookup(self, name: str) -> pd.DataFrame:
+        if name not in self.lookup_frames:
+            table, key = self.lookups[name]
+            lookup_frame = self.load_lookup(table)
+            self.lookup_frames[name] = lookup_frame.drop_duplicates(subset=[key], keep="last").set_index(key)
+        return self.lookup_frames[name]
+
+
+def _evaluate(expression: tuple, state: _Pass):
+    """Evaluates one column expression against the source frame of a pass"""
+    op, *args = expression
+    frame = state.frame
+    match op:
+        case "column":
+            return frame[args[0]]
+        case "fill":
+            return frame[args[0]].fillna(args[1])
+        case "date":
+            return state.timestamp(args[0]).dt.date
+        case "time":
+            return state.timestamp(args[0]).dt.time
+        case "float":
+            return frame[args[0]].astype(float)
+        case "round":
+            return frame[args[0]].round(args[1])
+        case "constant":
+            return args[0]
+        case "row_number":
+            return np.asarray(frame.index) + 1
+        case "lookup":
+            name, key, value = args
+            return frame[key].map(state.lookup(name)[value])
+        case "map":
+            source, mapping, override = args
+            if override in frame.columns:
+                return frame[override]
+            return frame[source].map(mapping)
+        case "dt":
+            source, field, offset = args
+            return getattr(state.timestamp(source).dt, field) + offset
+        case "strftime":
+            return state.timestamp(args[0]).dt.strftime(args[1])
+    raise ValueError(f"Unknown transform expression: {op}")
+
+
+def unique_days(frame: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """Builds one row per calendar day found in some timestamp columns
+
+    Each day keeps the first timestamp seen for it, in column order.
+
+    Args:
+        frame (pd.DataFrame): source rows
+        columns (list[str]): ISO8601 timestamp columns
+
+    Returns:
+        pd.DataFrame: a frame with a single date_id column
+    """
+    timestamps = pd.concat([pd.to_datetime(frame[column], format="ISO8601") for column in columns])
+    timestamps = timestamps[~timestamps.dt.normalize().duplicated()]
+    return pd.DataFrame({"date_id": timestamps.values})
+
+
+def apply_spec(
+    table: str, frame: pd.DataFrame, load_lookup: Callable[[str], pd.DataFrame] = None
+) -> pd.DataFrame:
+    """Transforms source rows into a warehouse table in a single pass over their columns
+
+    Every output column is evaluated from the source frame and the result is
+    built as one DataFrame, sharing the source index so row numbers survive
+    chunked transforms.
+
+    Args:
+        table (str): warehouse table name, a key of TRANSFORM_SPECS
+        frame (pd.DataFrame): source rows
+        load_lookup (Callable[[str], pd.DataFrame], optional): returns the ingested rows of a lookup table
+
+    Returns:
+        pd.DataFrame: the warehouse table
+    """
+    spec = TRANSFORM_SPECS[table]
+    if "unique_days" in spec:
+        frame = unique_days(frame, spec["unique_days"])
+    state = _Pass(frame, spec.get("lookups", {}), load_lookup)
+    columns = {name: _evaluate(expression, state) for name, expression in spec["columns"].items()}
+    logger.info(f"Transformed {len(frame)} rows to {table} schema.")
+    return pd.DataFrame(columns, index=frame.index)
@@ -1,3 +1,4 @@
+import io
 import boto3
 import pandas as pd
 import pyarrow as pa
@@ -6,341 +7,163 @@ import logging
 import json
 from decimal import Decimal
 
+try:
+    from src.common.object_store import get_s3_client, get_bodies, list_objects, put_body
+    from src.common.parameter_store import get_ssm_client, get_parameter
+    from src.common.fact_files import write_fact_table
+    from src.transform_lambda.transform_engine import SOURCE_OUTPUTS, apply_spec
+except ImportError:
+    from common.object_store import get_s3_client, get_bodies, list_objects, put_body
+    from common.parameter_store import get_ssm_client, get_parameter
+    from common.fact_files import write_fact_table
+    from transform_engine import SOURCE_OUTPUTS, apply_spec
+
 logger = logging.getLogger(__name__)
 
 
-def get_parameter(client: boto3.client, parameter_name: str):
-    """gets parameter from parameter store
+def read_ingested_body(body: bytes, key: str) -> list[dict] | pa.Table:
+    """Parses an ingested file, json rows or the typed parquet written in typed extraction mode
 
     Args:
-        client (boto3.client): ssm_client
-        parameter_name (str): parameter name
-
-    Raises:
-        Exception: Catches all exceptions
+        body (bytes): file contents
+        key (str): object key, whose suffix gives the file format
 
     Returns:
-        str: parameter value
+        list[dict] | pa.Table: rows for json files, an Arrow table for parquet files
     """
+    if key.endswith(".parquet"):
+        return pq.read_table(io.BytesIO(body))
+    return json.loads(body.decode("utf-8"), parse_float=Decimal)
 
-    result = client.get_parameter(Name=parameter_name)
-    return result["Parameter"]["Value"]
 
+def raw_frame(raw_data: list[dict] | pa.Table | pd.DataFrame) -> pd.DataFrame:
+    """Builds the one DataFrame that every output of a raw payload is derived from
 
-def transform_data(raw_data, table_name):
-    """Transforms raw data to the data warehouse schema using match-case."""
-    match table_name:
-        case "staff":
-            return transform_dim_staff(raw_data)
-        case "sales_order":
-            return [transform_fact_sales_order(raw_data), transform_dim_date(raw_data)]
-        case "address":
-            return transform_dim_location(raw_data)
-        case "design":
-            return transform_dim_design(raw_data)
-        case "currency":
-            return transform_dim_currency(raw_data)
-        case "counterparty":
-            return transform_dim_counterparty(raw_data)
-        case "transaction":
-            return transform_dim_transaction(raw_data)
-        case "payment_type":
-            return transform_dim_payment_type(raw_data)
-        case "payment":
-            return transform_fact_payment(raw_data)
-        case "purchase_order":
-            return transform_fact_purchase_order(raw_data)
-        case _:
-            logger.warning(f"No transformation defined for table: {table_name}")
-            return None
+    Transforms wrap the frame with pd.DataFrame, which shares its columns
+    rather than copying them, so a payload with several outputs is converted
+    once. Transforms must not modify the shared frame in place.
 
+    Args:
+        raw_data (list[dict] | pa.Table | pd.DataFrame): json rows, a typed Arrow table or a frame
 
-def transform_dim_staff(staff_data):
-    """Transforms staff data to dim_staff format."""
+    Returns:
+        pd.DataFrame: the raw frame
+    """
+    if isinstance(raw_data, pd.DataFrame):
+        return raw_data
+    if isinstance(raw_data, pa.Table):
+        return raw_data.to_pandas()
+    return pd.DataFrame(raw_data)
 
-    s3_client = boto3.client("s3")
-    ssm_client = boto3.client("ssm")
-    bucket = get_parameter(ssm_client, "ingestion_bucket_name")
-    response = s3_client.list_objects_v2(Bucket=bucket, Prefix="department/")
-    key = response["Contents"][0]["Key"]
 
-    all_department_data = []
+def read_ingested_table(client: boto3.client, bucket: str, table: str) -> list[dict]:
+    """Reads every ingested json or parquet file for a table, fetching the files concurrently
 
-    for object in response["Contents"]:
-        key = object["Key"]
-        item = s3_client.get_object(Bucket=bucket, Key=key)
-        data = item["Body"].read()
-        dep = json.loads(data, parse_float=Decimal)
-        for i in dep:
-            all_department_data.append(i)
+    Args:
+        client (boto3.client): s3 client
+        bucket (str): ingestion bucket name
+        table (str): source table name, used as the key prefix
 
-    df_department = pd.DataFrame(all_department_data)
-    df_staff = pd.DataFrame(staff_data)
+    Returns:
+        list[dict]: rows from all of the table's files
+    """
+    keys = [item["Key"] for item in list_objects(client, bucket, f"{table}/")]
+    rows = []
+    for key, body in zip(keys, get_bodies(client, bucket, keys)):
+        if key.endswith(".parquet"):
+            rows.extend(pq.read_table(io.BytesIO(body)).to_pylist())
+        else:
+            rows.extend(json.loads(body, parse_float=Decimal))
+    return rows
 
-    # Merge with department data to get department_name and location
-    df_merged = pd.merge(
-        df_staff,
-        df_department[["department_id", "department_name", "location"]],
-        how="left",
-        left_on="department_id",
-        right_on="department_id",
-    )
 
-    # Drop unnecessary columns
-    df_dim_staff = df_merged.drop(columns=["department_id", "created_at", "last_updated"])
-    return df_dim_staff
+def transform_data(raw_data, table_name):
+    """Transforms raw data to the data warehouse schema using the declared transform specs."""
+    outputs = SOURCE_OUTPUTS.get(table_name)
+    if outputs is None:
+        logger.warning(f"No transformation defined for table: {table_name}")
+        return None
+    frame = raw_frame(raw_data)
+    transformed = [apply_spec(table, frame, load_lookup) for table in outputs]
+    return transformed[0] if len(transformed) == 1 else transformed
 
 
-def transform_dim_location(data):
-    """Transforms address data to dim_location format."""
-    df = pd.DataFrame(data)
-    df = df.rename(
-        columns={
-            "address_id": "location_id",
-            "address_line_1": "address_line_1",
-            "address_line_2": "address_line_2",
-            "district": "district",
-            "city": "city",
-            "postal_code": "postal_code",
-            "country": "country",
-            "phone": "phone",
-        }
-    )
+def load_lookup(table: str) -> pd.DataFrame:
+    """Reads every ingested row of a lookup table, such as department for dim_staff."""
+    bucket = get_parameter(get_ssm_client(), "ingestion_bucket_name")
+    return pd.DataFrame(read_ingested_table(get_s3_client(), bucket, table))
 
-    df["address_line_2"] = df["address_line_2"].fillna("None")
-    df["district"] = df["district"].fillna("None")
 
-    df = df.drop(columns=["created_at", "last_updated"])
+def transform_dim_staff(staff_data):
+    """Transforms staff data to dim_staff format."""
+    return apply_spec("dim_staff", raw_frame(staff_data), load_lookup)
 
-    return df
+
+def transform_dim_location(data):
+    """Transforms address data to dim_location format."""
+    return apply_spec("dim_location", raw_frame(data))
 
 
 def transform_dim_design(data):
     """Transforms design data to dim_design format."""
-    df = pd.DataFrame(data)
-    df = df.rename(
-        columns={
-            "design_id": "design_id",
-            "design_name": "design_name",
-            "file_location": "file_location",
-            "file_name": "file_name",
-        }
-    )
-
-    df = df.drop(columns=["created_at", "last_updated"])
-
-    return df
+    return apply_spec("dim_design", raw_frame(data))
 
 
 def transform_fact_sales_order(sales_order_data):
     """Transforms sales_order data to fact_sales_order format."""
-    df = pd.DataFrame(sales_order_data)
-    df_fact_sales_order = pd.DataFrame(
-        {
-            "sales_record_id": df.index + 1,
-            "sales_order_id": df["sales_order_id"],
-            "created_date": pd.to_datetime(df["created_at"], format="ISO8601").dt.date,
-            "created_time": pd.to_datetime(df["created_at"], format="ISO8601").dt.time,
-            "last_updated_date": pd.to_datetime(df["last_updated"], format="ISO8601").dt.date,
-            "last_updated_time": pd.to_datetime(df["last_updated"], format="ISO8601").dt.time,
-            "sales_staff_id": df["staff_id"],
-            "counterparty_id": df["counterparty_id"],
-            "units_sold": df["units_sold"],
-            "unit_price": df["unit_price"].astype(float),
-            "currency_id": 1,
-            "design_id": df["design_id"],
-            "agreed_payment_date": pd.to_datetime(df["agreed_payment_date"], format="ISO8601").dt.date,
-            "agreed_delivery_date": pd.to_datetime(df["agreed_delivery_date"], format="ISO8601").dt.date,
-            "agreed_delivery_location_id": df["agreed_delivery_location_id"],
-        }
-    )
-
-    logger.info("Transformed sales_order data to fact_sales_order schema.")
-    return df_fact_sales_order
+    return apply_spec("fact_sales_order", raw_frame(sales_order_data))
 
 
 def transform_dim_date(data):
     """Transforms raw date data to dim_date format."""
-    df_sales_data = pd.DataFrame(data)
-    date_columns = [
-        pd.to_datetime(df_sales_data["created_at"], format="ISO8601"),
-        pd.to_datetime(df_sales_data["last_updated"], format="ISO8601"),
-        pd.to_datetime(df_sales_data["agreed_payment_date"], format="ISO8601"),
-        pd.to_datetime(df_sales_data["agreed_delivery_date"], format="ISO8601")
-    ]
-
-    unique_dates = pd.concat(date_columns).drop_duplicates()
-
-    df = pd.DataFrame({"date_id": unique_dates})
-
-    df["year"] = df["date_id"].dt.year
-    df["month"] = df["date_id"].dt.month
-    df["day"] = df["date_id"].dt.day
-    df["day_of_week"] = df["date_id"].dt.weekday + 1
-    df["day_name"] = df["date_id"].dt.strftime("%A")
-    df["month_name"] = df["date_id"].dt.strftime("%B")
-    df["quarter"] = df["month"].apply(lambda x: (x - 1) // 3 + 1)
-
-    df.drop_duplicates(subset=["year", "month", "day"], inplace=True)
-
-    df = df[["date_id", "year", "month", "day", "day_of_week", "day_name", "month_name", "quarter"]]
-    return df
+    return apply_spec("dim_date", raw_frame(data))
 
 
 def transform_dim_currency(data):
     """Transforms raw currency data to dim_currency format."""
-    df = pd.DataFrame(data)
-    df = df.rename(columns={"currency_code": "currency_code", "currency_name": "currency_name"})
-
-    if "currency_name" not in df.columns:
-        currency_names = {
-            "USD": "United States Dollar",
-            "GBP": "British Pound",
-            "EUR": "Euro",
-        }
-        df["currency_name"] = df["currency_code"].map(currency_names)
-
-    return df[["currency_id", "currency_code", "currency_name"]]
+    return apply_spec("dim_currency", raw_frame(data))
 
 
 def transform_dim_counterparty(counterparty_data):
     """Transforms raw counterparty data to dim_counterparty format."""
-    df = pd.DataFrame(counterparty_data)
-    s3_client = boto3.client("s3")
-    ssm_client = boto3.client("ssm")
-    bucket = get_parameter(ssm_client, "ingestion_bucket_name")
-    response = s3_client.list_objects_v2(Bucket=bucket, Prefix="address/")
-    key = response["Contents"][0]["Key"]
-
-    all_address_data = []
-
-    for object in response["Contents"]:
-        key = object["Key"]
-        item = s3_client.get_object(Bucket=bucket, Key=key)
-        data = item["Body"].read()
-        dep = json.loads(data, parse_float=Decimal)
-        for i in dep:
-            all_address_data.append(i)
-
-    df_address = pd.DataFrame(all_address_data)
-
-    merged_df = pd.merge(df, df_address, left_on="legal_address_id", right_on="address_id", how="left")
-
-    merged_df = merged_df.rename(
-        columns={
-            "counterparty_id": "counterparty_id",
-            "counterparty_legal_name": "counterparty_legal_name",
-            "address_line_1": "counterparty_legal_address_line_1",
-            "address_line_2": "counterparty_legal_address_line_2",
-            "district": "counterparty_legal_district",
-            "city": "counterparty_legal_city",
-            "postal_code": "counterparty_legal_postal_code",
-            "country": "counterparty_legal_country",
-            "phone": "counterparty_legal_phone_number",
-        }
-    )
-
-    dim_counterparty_df = merged_df[
-        [
-            "counterparty_id",
-            "counterparty_legal_name",
-            "counterparty_legal_address_line_1",
-            "counterparty_legal_address_line_2",
-            "counterparty_legal_district",
-            "counterparty_legal_city",
-            "counterparty_legal_postal_code",
-            "counterparty_legal_country",
-            "counterparty_legal_phone_number",
-        ]
-    ]
-
-    return dim_counterparty_df
+    return apply_spec("dim_counterparty", raw_frame(counterparty_data), load_lookup)
 
 
 def transform_dim_transaction(transaction_data):
-    """Transforms raw currency data to dim_transaction format."""
-    df = pd.DataFrame(transaction_data)
-    df = df.rename(columns={"transaction_id": "transaction_id",
-                            "transaction_type": "transaction_type",
-                            "sales_order_id": "sales_order_id",
-                            "purchase_order_id": "purchase_order_id"})
-
-    df = df.drop(columns=["created_at", "last_updated"])
-
-    return df[["transaction_id", "transaction_type", "sales_order_id", "purchase_order_id"]]
+    """Transforms raw transaction data to dim_transaction format."""
+    return apply_spec("dim_transaction", raw_frame(transaction_data))
 
 
 def transform_dim_payment_type(payment_type_data):
     """Transform raw payment data to dim_payment_type"""
-    df = pd.DataFrame(payment_type_data)
-    df = df.rename(columns={"payment_type_id": "payment_type_id",
-                            "payment_type_name": "payment_type_name"})
-
-    df = df.drop(columns=["created_at", "last_updated"])
-    return df[["payment_type_id", "payment_type_name"]]
+    return apply_spec("dim_payment_type", raw_frame(payment_type_data))
 
 
 def transform_fact_payment(payment_data):
     """Transforms payment data to fact_payment format."""
-    df = pd.DataFrame(payment_data)
-    df_fact_payment = pd.DataFrame(
-        {
-            "payment_record_id": df.index + 1,
-            "payment_id": df["payment_id"],
-            "created_date": pd.to_datetime(df["created_at"], format="ISO8601").dt.date,
-            "created_time": pd.to_datetime(df["created_at"], format="ISO8601").dt.time,
-            "last_updated_date": pd.to_datetime(df["last_updated"], format="ISO8601").dt.date,
-            "last_updated_time": pd.to_datetime(df["last_updated"], format="ISO8601").dt.time,
-            "transaction_id": df["transaction_id"],
-            "counterparty_id": df["counterparty_id"],
-            "payment_amount": df["payment_amount"].round(2),
-            "currency_id": df["currency_id"],
-            "payment_type_id": df["payment_type_id"],
-            "paid": df["paid"],
-            "payment_date": pd.to_datetime(df["payment_date"], format="ISO8601").dt.date
-            }
-    )
-
-    df = df.drop(columns=["company_ac_number", "counterparty_ac_number"])
-
-    return df_fact_payment
+    return apply_spec("fact_payment", raw_frame(payment_data))
 
 
 def transform_fact_purchase_order(puchase_order_data):
     """Transforms purchase order data to fact_purchase_order format."""
-    df = pd.DataFrame(puchase_order_data)
-    df_fact_puchase_order = pd.DataFrame(
-        {
-            "purchase_record_id": df.index + 1,
-            "purchase_order_id": df["purchase_order_id"],
-            "created_date": pd.to_datetime(df["created_at"], format="ISO8601").dt.date,
-            "created_time": pd.to_datetime(df["created_at"], format="ISO8601").dt.time,
-            "last_updated_date": pd.to_datetime(df["last_updated"], format="ISO8601").dt.date,
-            "last_updated_time": pd.to_datetime(df["last_updated"], format="ISO8601").dt.time,
-            "staff_id": df["staff_id"],
-            "counterparty_id": df["counterparty_id"],
-            "item_code": df["item_code"],
-            "item_quantity": df["item_quantity"],
-            "item_unit_price": df["item_unit_price"].round(2),
-            "currency_id": df["currency_id"],
-            "agreed_delivery_date": pd.to_datetime(df["agreed_delivery_date"], format="ISO8601").dt.date,
-            "agreed_payment_date": pd.to_datetime(df["agreed_payment_date"], format="ISO8601").dt.date,
-            "agreed_delivery_location_id": df["agreed_delivery_location_id"]
-            }
-    )
-
-    return df_fact_puchase_order
-
-
-def save_to_parquet(df, s3_path, client, bucket=None):
-    """get bucket name and save the DataFrame to Parquet format in S3."""
+    return apply_spec("fact_purchase_order", raw_frame(puchase_order_data))
+
+
+def save_to_parquet(df, s3_path, client, bucket=None, fact=False):
+    """get bucket name and save the DataFrame to Parquet format in S3.
+
+    Fact tables (fact=True) are sorted by created_date and written with small
+    row groups, statistics and page indexes, so loads can read a date range.
+    """
     if not bucket:
-        ssm_client = boto3.client("ssm")
-        bucket = get_parameter(ssm_client, "processed_bucket_name")
+        bucket = get_parameter(get_ssm_client(), "processed_bucket_name")
 
     table = pa.Table.from_pandas(df)
     pq_buffer = pa.BufferOutputStream()
-    pq.write_table(table, pq_buffer)
+    if fact:
+        write_fact_table(table, pq_buffer)
+    else:
+        pq.write_table(table, pq_buffer)
 
-    client.put_object(Bucket=bucket, Key=s3_path, Body=pq_buffer.getvalue().to_pybytes())
+    put_body(client, bucket, s3_path, pq_buffer.getvalue().to_pybytes())
     logger.info(f"Saved {s3_path} to processed S3 bucket")
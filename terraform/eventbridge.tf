@@ -1,7 +1,7 @@
 resource "aws_cloudwatch_event_rule" "run_extract_lambda" {
   name        = "run-extract-lambda"
-  description = "runs extract function every 30 mins"
-    schedule_expression = "rate(30 minutes)"
+  description = "runs extract function every ${var.extract_min_interval} mins, the adaptive schedule's floor"
+    schedule_expression = "rate(${var.extract_min_interval} minutes)"
     
 }
 
@@ -19,23 +19,42 @@ resource "aws_lambda_permission" "allow_eventbridge" {
     source_arn = aws_cloudwatch_event_rule.run_extract_lambda.arn
 }
 
-resource "aws_cloudwatch_event_rule" "run_load_lambda" {
-  name        = "run-load-lambda"
-  description = "runs load function every 30 mins"
-    schedule_expression = "rate(30 minutes)"
-    
+resource "aws_cloudwatch_event_rule" "run_compact_lambda" {
+  name        = "run-compact-lambda"
+  description = "compacts the previous day's processed files"
+    schedule_expression = "cron(30 0 * * ? *)"
 }
 
-resource "aws_cloudwatch_event_target" "load_lambda" {
-  rule      = aws_cloudwatch_event_rule.run_load_lambda.name
-  target_id = "run-scheduled-task-every-30-mins"
-  arn       = aws_lambda_function.workflow_tasks_loads.arn
+resource "aws_cloudwatch_event_target" "compact_lambda" {
+  rule      = aws_cloudwatch_event_rule.run_compact_lambda.name
+  target_id = "run-compaction-daily"
+  arn       = aws_lambda_function.workflow_tasks_compact.arn
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_compact" {
+    statement_id = "AllowExecutionFromEventBridge"
+    action = "lambda:InvokeFunction"
+    function_name = aws_lambda_function.workflow_tasks_compact.function_name
+    principal = "events.amazonaws.com"
+    source_arn = aws_cloudwatch_event_rule.run_compact_lambda.arn
+}
+
+resource "aws_cloudwatch_event_rule" "run_reconcile_lambda" {
+  name        = "run-reconcile-lambda"
+  description = "reconciles source, processed and warehouse fact aggregates"
+    schedule_expression = "cron(0 1 * * ? *)"
+}
+
+resource "aws_cloudwatch_event_target" "reconcile_lambda" {
+  rule      = aws_cloudwatch_event_rule.run_reconcile_lambda.name
+  target_id = "run-reconciliation-daily"
+  arn       = aws_lambda_function.workflow_tasks_reconcile.arn
 }
 
-resource "aws_lambda_permission" "allow_eventbridge_load" {
+resource "aws_lambda_permission" "allow_eventbridge_reconcile" {
     statement_id = "AllowExecutionFromEventBridge"
     action = "lambda:InvokeFunction"
-    function_name = aws_lambda_function.workflow_tasks_loads.function_name
+    function_name = aws_lambda_function.workflow_tasks_reconcile.function_name
     principal = "events.amazonaws.com"
-    source_arn = aws_cloudwatch_event_rule.run_load_lambda.arn
+    source_arn = aws_cloudwatch_event_rule.run_reconcile_lambda.arn
 }
@@ -12,7 +12,7 @@ resource "aws_lambda_function" "workflow_tasks_extract" {
   handler          = "lambda_handler.lambda_handler"
   runtime          = "python3.12"
   timeout          = var.default_timeout
-  layers           = [aws_lambda_layer_version.dependencies.arn]
+  layers           = [aws_lambda_layer_version.dependencies.arn, "arn:aws:lambda:eu-west-2:336392948345:layer:AWSSDKPandas-Python312:13"]
   environment {
     variables = {
       SECRETS_ARN = aws_secretsmanager_secret.db_credentials.arn
@@ -21,6 +21,14 @@ resource "aws_lambda_function" "workflow_tasks_extract" {
       HOST = local.db_credentials["host"]
       DATABASE = local.db_credentials["database"]
       PORT = local.db_credentials["port"]
+      EXTRACT_SCHEDULE = "adaptive"
+      EXTRACT_MODE = "typed"
+      EXTRACT_BACKFILL = "windowed"
+      EXTRACT_BACKFILL_WINDOW_DAYS = var.extract_backfill_window_days
+      EXTRACT_SOURCES = var.extract_sources
+      EXTRACT_MIN_INTERVAL_MINUTES = var.extract_min_interval
+      EXTRACT_MAX_INTERVAL_MINUTES = var.extract_max_interval
+      RUN_HISTORY_LOCATION = "s3://${aws_s3_bucket.processing_bucket.bucket}/_run_history"
     }
   }
   depends_on = [aws_s3_object.lambda_code, aws_s3_object.lambda_layer]
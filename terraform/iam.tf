@@ -39,7 +39,7 @@ resource "aws_iam_policy" "lambda_get_parameter" {
   policy = jsonencode({
     Version = "2012-10-17"
     Statement = [{
-      Action   = ["ssm:GetParameter", "ssm:PutParameter"],
+      Action   = ["ssm:GetParameter", "ssm:GetParameters", "ssm:PutParameter"],
       Effect   = "Allow",
       Resource = ["arn:aws:ssm:eu-west-2:216989110647:parameter/*"]
     }]
@@ -86,7 +86,7 @@ resource "aws_iam_role_policy_attachment" "attach_parameter_access" {
 data "aws_iam_policy_document" "s3_document" {
   statement {
 
-    actions = ["s3:PutObject", "s3:GetObject", "s3:ListBucket"]
+    actions = ["s3:PutObject", "s3:GetObject", "s3:ListBucket", "s3:DeleteObject"]
     effect = "Allow"
     resources = [
       "${aws_s3_bucket.ingestion_bucket.arn}/*","${aws_s3_bucket.processing_bucket.arn}/*","${aws_s3_bucket.ingestion_bucket.arn}",
@@ -95,6 +95,24 @@ data "aws_iam_policy_document" "s3_document" {
   }
 }
 
+data "aws_iam_policy_document" "sqs_document" {
+  statement {
+    actions   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"]
+    effect    = "Allow"
+    resources = [aws_sqs_queue.processed_objects.arn]
+  }
+}
+
+resource "aws_iam_policy" "sqs_policy" {
+  name_prefix = "sqs-policy-totes"
+  policy      = data.aws_iam_policy_document.sqs_document.json
+}
+
+resource "aws_iam_role_policy_attachment" "lambda_sqs_policy_attachment" {
+  role       = aws_iam_role.lambda_role.name
+  policy_arn = aws_iam_policy.sqs_policy.arn
+}
+
 resource "aws_iam_policy" "s3_policy" {
   name_prefix = "s3-policy-totes"
   policy      = data.aws_iam_policy_document.s3_document.json
@@ -14,12 +14,24 @@ resource "aws_s3_bucket" "ingestion_bucket" {
   force_destroy = true
 }
 
+# Only table objects invoke the transform, never the pipeline's own _state/ and _dead_letter/ objects
+locals {
+  ingested_tables = [
+    "address", "design", "counterparty", "sales_order", "transaction", "payment",
+    "purchase_order", "payment_type", "currency", "department", "staff",
+  ]
+}
+
 resource "aws_s3_bucket_notification" "ingestion_bucket_notification" {
   bucket = aws_s3_bucket.ingestion_bucket.id
   eventbridge = true
-  lambda_function {
-    lambda_function_arn = aws_lambda_function.workflow_tasks_transform.arn
-    events              = ["s3:ObjectCreated:*"]
+  dynamic "lambda_function" {
+    for_each = toset(local.ingested_tables)
+    content {
+      lambda_function_arn = aws_lambda_function.workflow_tasks_transform.arn
+      events              = ["s3:ObjectCreated:*"]
+      filter_prefix       = "${lambda_function.value}/"
+    }
   }
   depends_on = [aws_lambda_permission.allow_ingestion_bucket]
 }
@@ -35,6 +47,12 @@ resource "aws_s3_bucket" "processing_bucket" {
 resource "aws_s3_bucket_notification" "processing_bucket_notification" {
   bucket = aws_s3_bucket.processing_bucket.id
   eventbridge = true
+  queue {
+    queue_arn     = aws_sqs_queue.processed_objects.arn
+    events        = ["s3:ObjectCreated:*"]
+    filter_suffix = ".parquet"
+  }
+  depends_on = [aws_sqs_queue_policy.processed_objects]
 }
 
 
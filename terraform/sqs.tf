@@ -0,0 +1,38 @@
+resource "aws_sqs_queue" "processed_objects" {
+  name                       = "processed-objects"
+  visibility_timeout_seconds = var.load_timeout * 6
+  message_retention_seconds  = 345600
+}
+
+data "aws_iam_policy_document" "processed_objects_queue" {
+  statement {
+    actions   = ["sqs:SendMessage"]
+    effect    = "Allow"
+    resources = [aws_sqs_queue.processed_objects.arn]
+    principals {
+      type        = "Service"
+      identifiers = ["s3.amazonaws.com"]
+    }
+    condition {
+      test     = "ArnEquals"
+      variable = "aws:SourceArn"
+      values   = [aws_s3_bucket.processing_bucket.arn]
+    }
+  }
+}
+
+resource "aws_sqs_queue_policy" "processed_objects" {
+  queue_url = aws_sqs_queue.processed_objects.id
+  policy    = data.aws_iam_policy_document.processed_objects_queue.json
+}
+
+resource "aws_lambda_event_source_mapping" "processed_objects" {
+  event_source_arn                   = aws_sqs_queue.processed_objects.arn
+  function_name                      = aws_lambda_function.workflow_tasks_load_events.arn
+  batch_size                         = var.load_batch_size
+  maximum_batching_window_in_seconds = var.load_batch_window
+  function_response_types            = ["ReportBatchItemFailures"]
+  scaling_config {
+    maximum_concurrency = 2
+  }
+}
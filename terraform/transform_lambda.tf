@@ -12,6 +12,27 @@ resource "aws_lambda_function" "workflow_tasks_transform" {
   handler          = "lambda_handler.lambda_handler"
   runtime          = "python3.12"
   timeout          = var.default_timeout
+  memory_size      = var.transform_memory_size
+  layers           = [aws_lambda_layer_version.dependencies.arn, aws_lambda_layer_version.pyarrow.arn, "arn:aws:lambda:eu-west-2:336392948345:layer:AWSSDKPandas-Python312:13"]
+
+  depends_on = [aws_s3_object.lambda_code, aws_s3_object.lambda_layer]
+  environment {
+    variables = {
+      TRANSFORM_PARALLEL = var.transform_parallel
+      RUN_HISTORY_LOCATION = "s3://${aws_s3_bucket.processing_bucket.bucket}/_run_history"
+    }
+  }
+}
+
+resource "aws_lambda_function" "workflow_tasks_replay" {
+  function_name    = var.replay_lambda
+  source_code_hash = data.archive_file.transform_lambda.output_base64sha256
+  s3_bucket        = aws_s3_bucket.code_bucket.bucket
+  s3_key           = "${var.transform_lambda}/function.zip"
+  role             = aws_iam_role.lambda_role.arn
+  handler          = "lambda_handler.replay_dead_letters"
+  runtime          = "python3.12"
+  timeout          = var.load_timeout
   layers           = [aws_lambda_layer_version.dependencies.arn, aws_lambda_layer_version.pyarrow.arn, "arn:aws:lambda:eu-west-2:336392948345:layer:AWSSDKPandas-Python312:13"]
 
   depends_on = [aws_s3_object.lambda_code, aws_s3_object.lambda_layer]
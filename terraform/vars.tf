@@ -28,6 +28,60 @@ variable "load_lambda" {
   default = "load_lambda"
 }
 
+variable "extract_min_interval" {
+  type    = number
+  default = 5
+}
+
+variable "extract_max_interval" {
+  type    = number
+  default = 1440
+}
+
+variable "extract_backfill_window_days" {
+  type    = number
+  default = 30
+}
+
+# json list of source databases, e.g. [{"name": "north", "host": "...", "tables": ["sales_order"]}],
+# settings a source leaves out come from the db_credentials secret. Empty extracts that one database.
+variable "extract_sources" {
+  type      = string
+  default   = ""
+  sensitive = true
+}
+
+variable "load_events_lambda" {
+  type = string
+  default = "load_events_lambda"
+}
+
+variable "compact_lambda" {
+  type = string
+  default = "compact_lambda"
+}
+
+variable "replay_lambda" {
+  type = string
+  default = "replay_lambda"
+}
+
+variable "reconcile_lambda" {
+  type = string
+  default = "reconcile_lambda"
+}
+
+# "process" splits large fact payloads across processes, worth it from about 3538 MB (2 vCPUs)
+variable "transform_parallel" {
+  type    = string
+  default = "off"
+}
+
+variable "transform_memory_size" {
+  type    = number
+  default = 128
+}
+
 variable "default_timeout" {
   type    = number
   default = 60
@@ -38,6 +92,16 @@ variable "load_timeout" {
   default = 360
 }
 
+variable "load_batch_size" {
+  type    = number
+  default = 100
+}
+
+variable "load_batch_window" {
+  type    = number
+  default = 10
+}
+
 variable "region" {
   type = string  
 }
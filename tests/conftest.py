@@ -0,0 +1,10 @@
+import pytest
+from src.common.parameter_store import clear_parameter_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_parameter_cache():
+    """Stops parameter values cached by one test leaking into the next."""
+    clear_parameter_cache()
+    yield
+    clear_parameter_cache()
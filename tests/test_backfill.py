@@ -0,0 +1,93 @@
+import datetime
+import pytest
+from unittest.mock import patch
+from src.extract_lambda.lambda_handler import lambda_handler
+from src.extract_lambda.backfill import plan_windows, run_backfill, load_checkpoint
+from src.common.manifest import load_manifest
+from tests.test_lambda_handler import s3_client, ssm_client, aws_credentials  # noqa: F401
+
+NOW = datetime.datetime(2024, 3, 1, 12, 30, 45)
+FIRST = {"currency": datetime.datetime(2024, 1, 15, 9, 0), "staff": None}
+
+
+def window_rows(table, since, columns=None, until=None):
+    """Stands in for get_data, returning one row per window named after its bounds"""
+    return [{"table": table, "since": str(since), "until": str(until)}]
+
+
+class TestPlanWindows:
+    def test_windows_cover_the_range_without_gaps(self):
+        windows = plan_windows(FIRST, NOW.replace(second=0), 20)
+        assert windows == [
+            ["currency", None, "2024-02-04T00:00:00"],
+            ["currency", "2024-02-04T00:00:00", "2024-02-24T00:00:00"],
+            ["currency", "2024-02-24T00:00:00", "2024-03-01T12:30:00"],
+        ]
+
+    def test_recent_table_has_one_window(self):
+        windows = plan_windows({"currency": datetime.datetime(2024, 3, 1, 9, 0)}, NOW, 30)
+        assert windows == [["currency", None, NOW.isoformat()]]
+
+
+@patch("src.extract_lambda.backfill.EXTRACT_BACKFILL_WINDOW_DAYS", 20)
+@patch("src.extract_lambda.backfill.first_updated", return_value=FIRST)
+@patch("src.extract_lambda.backfill.get_data", side_effect=window_rows)
+class TestRunBackfill:
+    def test_each_window_is_its_own_object(self, get_data_mock, first_mock, s3_client):  # noqa: F811
+        manifest = {}
+        upper = run_backfill(s3_client, "test-bucket", ["currency", "staff"], manifest, "json", NOW)
+        keys = [item["Key"] for item in s3_client.list_objects_v2(Bucket="test-bucket")["Contents"]
+                if not item["Key"].startswith("_")]
+        assert upper == datetime.datetime(2024, 3, 1, 12, 30)
+        assert keys == [
+            "currency/2024/02/04/00-00-currency.json",
+            "currency/2024/02/24/00-00-currency.json",
+            "currency/2024/03/01/12-30-currency.json",
+        ]
+        assert len(manifest["currency"]) == 3
+        assert load_checkpoint(s3_client, "test-bucket") is None
+
+    def test_backfill_resumes_from_checkpoint(self, get_data_mock, first_mock, s3_client):  # noqa: F811
+        remaining = iter([600000, 1000])
+        upper = run_backfill(s3_client, "test-bucket", ["currency"], {}, "json", NOW,
+                             lambda: next(remaining, 1000))
+        assert upper is None
+        assert load_checkpoint(s3_client, "test-bucket")["done"] == [0]
+
+        get_data_mock.reset_mock()
+        upper = run_backfill(s3_client, "test-bucket", ["currency"], {}, "json", NOW)
+        assert upper == datetime.datetime(2024, 3, 1, 12, 30)
+        assert [c.args[3].isoformat() for c in get_data_mock.call_args_list] == [
+            "2024-02-24T00:00:00", "2024-03-01T12:30:00"
+        ]
+        first_mock.assert_called_once()
+
+    def test_finished_windows_keep_their_hashes_when_a_window_fails(
+        self, get_data_mock, first_mock, s3_client  # noqa: F811
+    ):
+        def failing_last_window(table, since, columns=None, until=None):
+            if until == datetime.datetime(2024, 3, 1, 12, 30):
+                raise ValueError("connection lost")
+            return window_rows(table, since, columns, until)
+
+        get_data_mock.side_effect = failing_last_window
+        manifest = load_manifest(s3_client, "test-bucket", "extract_manifest")
+        with patch("src.extract_lambda.backfill.EXTRACT_BACKFILL_WORKERS", 1), \
+                pytest.raises(ValueError, match="connection lost"):
+            run_backfill(s3_client, "test-bucket", ["currency"], manifest, "json", NOW)
+        assert load_checkpoint(s3_client, "test-bucket")["done"] == [0, 1]
+        assert len(load_manifest(s3_client, "test-bucket", "extract_manifest")["currency"]) == 2
+
+
+class TestBackfillHandler:
+    @patch("src.extract_lambda.lambda_handler.windowed_backfill_enabled", return_value=True)
+    @patch("src.extract_lambda.lambda_handler.probe_changes")
+    @patch("src.extract_lambda.backfill.first_updated", return_value=FIRST)
+    @patch("src.extract_lambda.backfill.get_data", side_effect=window_rows)
+    def test_first_run_backfills_and_sets_last_run(self, get_data_mock, first_mock, probe_mock,
+                                                   enabled_mock, s3_client, ssm_client):  # noqa: F811
+        ssm_client.put_parameter(Name="lambda_last_run", Value="None", Overwrite=True, Type="String")
+        assert lambda_handler({}, {}) == "Successfully ran"
+        probe_mock.assert_not_called()
+        last_run = ssm_client.get_parameter(Name="lambda_last_run")["Parameter"]["Value"]
+        assert last_run != "None"
@@ -0,0 +1,120 @@
+import io
+import datetime
+import pandas as pd
+import pytest
+from src.load_lambda.compaction import (
+    period_of,
+    merge_files,
+    compact_table,
+    swap_in_compacted,
+    load_compaction_manifest,
+    save_compaction_manifest,
+)
+from src.load_lambda.lambda_handler import compact_data, load_data
+from tests.test_load_lambda import ssm_client, aws_credentials, create_db_tables, db_credentials  # noqa: F401
+from tests.test_load_utils import s3_client, read_test_database, load_test_data  # noqa: F401
+
+TODAY = datetime.date(2024, 3, 2)
+
+
+def parquet_body(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def small_files(s3_client):  # noqa: F811
+    """Three dim_design files on a closed day, a lone file on another and one from today"""
+    rows = {
+        "2024/03/01/09_00": [(3, "Steel"), (1, "Wooden")],
+        "2024/03/01/10_00": [(2, "Granite")],
+        "2024/03/01/11_00": [(1, "Oak")],
+        "2024/02/28/09_00": [(4, "Bronze")],
+        "2024/03/02/09_00": [(5, "Soft")],
+    }
+    for stamp, designs in rows.items():
+        df = pd.DataFrame(designs, columns=["design_id", "design_name"])
+        key = f"dim_design/transformed/{stamp}-dim_design.parquet"
+        s3_client.put_object(Bucket="processing-bucket", Key=key, Body=parquet_body(df))
+    return s3_client
+
+
+class TestPeriodOf:
+    def test_day_period(self):
+        assert period_of("dim_design/transformed/2024/03/01/09_00-dim_design.parquet") == "2024/03/01"
+
+    def test_month_period(self, monkeypatch):
+        monkeypatch.setattr("src.load_lambda.compaction.COMPACTION_PERIOD", "month")
+        assert period_of("dim_design/transformed/2024/03/01/09_00-dim_design.parquet") == "2024/03"
+
+    def test_other_keys_have_no_period(self):
+        assert period_of("_state/load_manifest.json") is None
+
+
+class TestMergeFiles:
+    def test_rows_are_sorted_and_keep_their_order_within_a_key(self):
+        bodies = [
+            parquet_body(pd.DataFrame({"design_id": [3, 1], "design_name": ["Steel", "Wooden"]})),
+            parquet_body(pd.DataFrame({"design_id": [1], "design_name": ["Oak"]})),
+        ]
+        merged = pd.read_parquet(io.BytesIO(merge_files("dim_design", bodies)))
+        assert merged.to_dict("records") == [
+            {"design_id": 1, "design_name": "Wooden"},
+            {"design_id": 1, "design_name": "Oak"},
+            {"design_id": 3, "design_name": "Steel"},
+        ]
+
+
+class TestCompactTable:
+    def test_only_closed_periods_with_enough_files_are_compacted(self, small_files):
+        manifest = {}
+        assert compact_table(small_files, "processing-bucket", "dim_design", manifest, TODAY) == 1
+        assert list(manifest["dim_design"]) == ["2024/03/01"]
+        entry = manifest["dim_design"]["2024/03/01"]
+        assert len(entry["sources"]) == 3
+        body = small_files.get_object(Bucket="processing-bucket", Key=entry["key"])["Body"].read()
+        assert len(pd.read_parquet(io.BytesIO(body))) == 4
+
+    def test_compacted_periods_are_not_redone(self, small_files):
+        manifest = {}
+        compact_table(small_files, "processing-bucket", "dim_design", manifest, TODAY)
+        assert compact_table(small_files, "processing-bucket", "dim_design", manifest, TODAY) == 0
+
+    def test_manifest_round_trips(self, small_files):
+        manifest = {}
+        compact_table(small_files, "processing-bucket", "dim_design", manifest, TODAY)
+        save_compaction_manifest(small_files, "processing-bucket", manifest)
+        assert load_compaction_manifest(small_files, "processing-bucket") == manifest
+
+
+class TestSwapInCompacted:
+    compacted = {"2024/03/01": {"key": "_compacted/dim_design/2024/03/01/dim_design-a.parquet",
+                                "sources": ["dim_design/transformed/2024/03/01/09_00-dim_design.parquet",
+                                            "dim_design/transformed/2024/03/01/10_00-dim_design.parquet"]}}
+
+    def test_whole_new_period_is_swapped_in_order(self):
+        keys = ["dim_design/transformed/2024/03/02/09_00-dim_design.parquet",
+                "dim_design/transformed/2024/03/01/09_00-dim_design.parquet",
+                "dim_design/transformed/2024/03/01/10_00-dim_design.parquet",
+                "dim_design/transformed/2024/02/28/09_00-dim_design.parquet"]
+        assert swap_in_compacted(keys, self.compacted) == [
+            "dim_design/transformed/2024/02/28/09_00-dim_design.parquet",
+            "_compacted/dim_design/2024/03/01/dim_design-a.parquet",
+            "dim_design/transformed/2024/03/02/09_00-dim_design.parquet",
+        ]
+
+    def test_partly_new_period_keeps_its_files(self):
+        keys = ["dim_design/transformed/2024/03/01/10_00-dim_design.parquet"]
+        assert swap_in_compacted(keys, self.compacted) == keys
+
+
+class TestCompactionHandler:
+    def test_loader_reads_compacted_files(self, create_db_tables, db_credentials, small_files,  # noqa: F811
+                                          ssm_client, caplog):  # noqa: F811
+        ssm_client.put_parameter(Name="load_last_run", Value="None", Type="String")
+        assert compact_data({}, {}) == "Compacted 1 periods."
+        load_data({}, {})
+        assert "Reading 1 compacted files in place of 3" in caplog.text
+        designs = {row["design_id"]: row["design_name"] for row in read_test_database("dim_design")}
+        assert designs == {1: "Oak", 2: "Granite", 3: "Steel", 4: "Bronze", 5: "Soft"}
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+import boto3
+import os
+from moto import mock_aws
+from src.common.date_set import to_days, load_date_set, save_date_set, new_dates, add_dates, seed_date_set
+from src.db.connection import connect_to_test_db
+from src.db.seed import seed_db
+
+
+@pytest.fixture(scope="function")
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(Bucket="processed-bucket",
+                             CreateBucketConfiguration={"LocationConstraint": "eu-west-2"})
+        yield client
+
+
+@pytest.fixture(scope="function")
+def db():
+    seed_db()
+    conn = connect_to_test_db()
+    yield conn
+    conn.close()
+
+
+DIM_DATE = pd.DataFrame({"date_id": pd.to_datetime(["2022-11-03 14:20:52", "2022-11-07", "2022-11-08"],
+                                                   format="ISO8601"),
+                         "year": [2022, 2022, 2022]})
+
+
+class TestNewDates:
+    def test_all_dates_are_new_without_a_set(self):
+        assert len(new_dates(DIM_DATE, None)) == 3
+
+    def test_known_dates_are_dropped(self):
+        known = to_days(["2022-11-03", "2022-11-08"])
+        rows = new_dates(DIM_DATE, np.sort(known))
+        assert [str(day.date()) for day in rows["date_id"]] == ["2022-11-07"]
+
+
+class TestDateSetState:
+    def test_missing_set_is_none(self, s3_client):
+        assert load_date_set(s3_client, "processed-bucket") is None
+
+    def test_round_trips_as_packed_int32(self, s3_client):
+        days = to_days(["2022-11-03", "2022-11-07"])
+        save_date_set(s3_client, "processed-bucket", days)
+        body = s3_client.get_object(Bucket="processed-bucket", Key="_state/dim_date_days.bin")["Body"].read()
+        assert len(body) == 8
+        assert list(load_date_set(s3_client, "processed-bucket")) == list(days)
+
+    def test_add_dates_saves_only_new_dates(self, s3_client):
+        days = add_dates(s3_client, "processed-bucket", to_days(["2022-11-08"]), DIM_DATE["date_id"])
+        assert list(days) == sorted(to_days(DIM_DATE["date_id"]))
+        assert list(load_date_set(s3_client, "processed-bucket")) == list(days)
+        s3_client.delete_object(Bucket="processed-bucket", Key="_state/dim_date_days.bin")
+        add_dates(s3_client, "processed-bucket", days, ["2022-11-07"])
+        assert load_date_set(s3_client, "processed-bucket") is None
+
+
+class TestSeedDateSet:
+    def test_seeds_from_warehouse(self, db, s3_client):
+        db.run("INSERT INTO dim_date (date_id, year, month, day, day_of_week, day_name, month_name, quarter) "
+               "VALUES ('2022-11-03', 2022, 11, 3, 4, 'Thursday', 'November', 4)")
+        days = seed_date_set(db, s3_client, "processed-bucket")
+        assert list(days) == list(to_days(["2022-11-03"]))
+        assert list(load_date_set(s3_client, "processed-bucket")) == list(days)
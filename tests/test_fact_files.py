@@ -0,0 +1,53 @@
+import io
+import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.common.fact_files import write_fact_table, date_range_row_groups, read_date_range
+from src.load_lambda.load_utils import read_fact_date_range
+from tests.test_object_store import s3_client, aws_credentials  # noqa: F401
+
+
+def fact_rows(days: int = 28) -> pa.Table:
+    """One fact row per day of January 2024, in reverse order"""
+    dates = [datetime.date(2024, 1, day) for day in range(days, 0, -1)]
+    return pa.table({"sales_order_id": list(range(days)), "created_date": dates})
+
+
+def fact_file(monkeypatch) -> bytes:
+    monkeypatch.setattr("src.common.fact_files.FACT_ROW_GROUP_ROWS", 7)
+    buffer = io.BytesIO()
+    write_fact_table(fact_rows(), buffer)
+    return buffer.getvalue()
+
+
+class TestWriteFactTable:
+    def test_rows_are_sorted_by_created_date(self, monkeypatch):
+        table = pq.read_table(io.BytesIO(fact_file(monkeypatch)))
+        dates = table["created_date"].to_pylist()
+        assert dates == sorted(dates)
+
+    def test_file_records_sort_order_and_row_groups(self, monkeypatch):
+        metadata = pq.ParquetFile(io.BytesIO(fact_file(monkeypatch))).metadata
+        assert metadata.num_row_groups == 4
+        assert metadata.row_group(0).sorting_columns[0].column_index == 1
+        assert metadata.row_group(0).column(1).statistics.has_min_max
+
+
+class TestReadDateRange:
+    def test_only_overlapping_row_groups_are_picked(self, monkeypatch):
+        parquet_file = pq.ParquetFile(io.BytesIO(fact_file(monkeypatch)))
+        january = [datetime.date(2024, 1, day) for day in range(1, 32)]
+        assert date_range_row_groups(parquet_file, january[8], january[9]) == [1]
+        assert date_range_row_groups(parquet_file, january[6], january[7]) == [0, 1]
+
+    def test_rows_are_filtered_to_the_range(self, monkeypatch):
+        table = read_date_range(io.BytesIO(fact_file(monkeypatch)),
+                                datetime.date(2024, 1, 9), datetime.date(2024, 1, 12))
+        assert table["created_date"].to_pylist() == [datetime.date(2024, 1, day) for day in range(9, 13)]
+
+    def test_ranged_read_from_s3(self, s3_client, monkeypatch):  # noqa: F811
+        s3_client.put_object(Bucket="test-bucket", Key="fact_sales_order/transformed/a.parquet",
+                             Body=fact_file(monkeypatch))
+        df = read_fact_date_range(s3_client, "test-bucket", ["fact_sales_order/transformed/a.parquet"],
+                                  datetime.date(2024, 1, 20), datetime.date(2024, 1, 21))
+        assert list(df["sales_order_id"]) == [8, 7]
@@ -0,0 +1,79 @@
+import datetime
+import pandas as pd
+import pytest
+from src.load_lambda.key_cache import DimensionKeyCache, key_strings
+
+
+class FakeConnection:
+    """Answers the bulk key query with fixed rows and counts the queries run"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def run(self, sql, **params):
+        self.queries.append(sql)
+        return self.rows
+
+
+@pytest.fixture
+def conn():
+    return FakeConnection([
+        ["dim_staff", "19"], ["dim_counterparty", "8"], ["dim_currency", "2"], ["dim_design", "3"],
+        ["dim_location", "8"], ["dim_date", "2022-11-03"], ["dim_date", "2022-11-07"],
+    ])
+
+
+@pytest.fixture
+def fact_rows():
+    return pd.DataFrame({
+        "sales_order_id": [1, 2, 3],
+        "created_date": [datetime.date(2022, 11, 3)] * 3,
+        "sales_staff_id": [19, 19, 20],
+        "counterparty_id": [8, 8, 8],
+        "currency_id": [2, 2, 2],
+        "design_id": [3, 4, None],
+        "agreed_delivery_date": [datetime.date(2022, 11, 7)] * 3,
+        "agreed_delivery_location_id": [8, 8, 8],
+    })
+
+
+class TestKeyStrings:
+    def test_dates_drop_their_time(self):
+        values = pd.Series([pd.Timestamp("2022-11-03 14:20:52"), datetime.date(2022, 11, 4)])
+        assert list(key_strings(values, "dim_date")) == ["2022-11-03", "2022-11-04"]
+
+    def test_float_ids_compare_as_integers(self):
+        assert list(key_strings(pd.Series([3.0, 4.0]), "dim_design")) == ["3", "4"]
+
+
+class TestDimensionKeyCache:
+    def test_resolve_splits_orphans(self, conn, fact_rows):
+        resolved, orphans = DimensionKeyCache().resolve(conn, "fact_sales_order", fact_rows)
+        assert list(resolved["sales_order_id"]) == [1]
+        assert list(orphans["sales_order_id"]) == [2, 3]
+        assert list(orphans["missing_keys"]) == ["design_id", "sales_staff_id"]
+
+    def test_keys_are_loaded_once_in_one_query(self, conn, fact_rows):
+        cache = DimensionKeyCache()
+        cache.resolve(conn, "fact_sales_order", fact_rows)
+        cache.resolve(conn, "fact_sales_order", fact_rows)
+        assert len(conn.queries) == 1
+        assert conn.queries[0].count("UNION ALL") == 5
+
+    def test_added_keys_resolve_without_a_query(self, conn, fact_rows):
+        cache = DimensionKeyCache()
+        cache.resolve(conn, "fact_sales_order", fact_rows)
+        cache.add("dim_design", pd.Series([4]))
+        cache.add("dim_staff", pd.Series([20]))
+        resolved, orphans = cache.resolve(conn, "fact_sales_order", fact_rows)
+        assert len(resolved) == 3
+        assert orphans.empty
+        assert len(conn.queries) == 1
+
+    def test_tables_without_references_are_unchanged(self, conn):
+        df = pd.DataFrame({"design_id": [1]})
+        resolved, orphans = DimensionKeyCache().resolve(conn, "dim_design", df)
+        assert resolved is df
+        assert orphans.empty
+        assert conn.queries == []
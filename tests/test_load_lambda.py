@@ -1,4 +1,4 @@
-from src.load_lambda.lambda_handler import load_data
+from src.load_lambda.lambda_handler import load_data, load_events
 import boto3
 from botocore.exceptions import ClientError
 from moto import mock_aws
@@ -6,10 +6,15 @@ from pg8000 import DatabaseError
 import pytest
 import os
 from src.db.seed import seed_db
+from src.common.date_set import load_date_set, save_date_set, to_days
 from datetime import datetime
 from tests.test_load_utils import read_test_database, load_test_data
 import re
+import json
+import pandas as pd
+from io import BytesIO
 from time import sleep
+from unittest.mock import patch
 
 """
 Tests:
@@ -78,6 +83,18 @@ def s3_client(aws_credentials):
         yield s3_client
 
 
+def sqs_event(bucket: str, keys: list[str]) -> dict:
+    """Builds an SQS batch holding one S3 notification per key"""
+    return {"Records": [
+        {
+            "messageId": f"message-{i}",
+            "body": json.dumps({"Records": [{"s3": {"bucket": {"name": bucket},
+                                                    "object": {"key": key, "size": 100}}}]}),
+        }
+        for i, key in enumerate(keys)
+    ]}
+
+
 class TestLoadLambda:
     def test_load_lambda_last_run_is_none(self, create_db_tables, db_credentials,
                                           s3_client, ssm_client):
@@ -154,6 +171,133 @@ class TestLoadLambda:
             assert isinstance(item["units_sold"], int)
 
 
+    def test_load_lambda_skips_files_already_loaded(self, create_db_tables, db_credentials,
+                                                    s3_client, ssm_client, caplog):
+        ssm_client.put_parameter(Name="load_last_run",
+                                 Value="None",
+                                 Type="String")
+        load_data({}, {})
+        current_date = datetime.now().strftime("%Y/%m/%d/%H_%M")
+        s3_client.upload_file(
+            Bucket="processing-bucket",
+            Filename="data_examples/test_load_data/dim_design.parquet",
+            Key=f"dim_design/transformed/{current_date}-dim_design-copy.parquet",
+        )
+        ssm_client.put_parameter(Name="load_last_run", Value="None", Type="String", Overwrite=True)
+        load_data({}, {})
+        assert "All new dim_design files were already loaded" in caplog.text
+        assert read_test_database("dim_design") == load_test_data("dim_design")
+
+    def test_load_lambda_quarantines_orphan_fact_rows(self, create_db_tables, db_credentials,
+                                                     s3_client, ssm_client):
+        ssm_client.put_parameter(Name="load_last_run",
+                                 Value="None",
+                                 Type="String")
+        load_data({}, {})
+        design_ids = {row["design_id"] for row in load_test_data("dim_design")}
+        facts = read_test_database("fact_sales_order")
+        quarantined = s3_client.list_objects_v2(Bucket="processing-bucket",
+                                                Prefix="_quarantine/fact_sales_order/")["Contents"]
+        orphans = pd.read_parquet(BytesIO(s3_client.get_object(
+            Bucket="processing-bucket", Key=quarantined[0]["Key"])["Body"].read()))
+        assert all(item["design_id"] in design_ids for item in facts)
+        assert len(facts) + len(orphans) == len(load_test_data("fact_sales_order"))
+        assert orphans["missing_keys"].str.contains("design_id").any()
+
+    def test_load_lambda_redrives_quarantined_rows(self, create_db_tables, db_credentials,
+                                                   s3_client, ssm_client):
+        ssm_client.put_parameter(Name="load_last_run", Value="None", Type="String")
+        load_data({}, {})
+        key = s3_client.list_objects_v2(Bucket="processing-bucket",
+                                        Prefix="_quarantine/fact_sales_order/")["Contents"][0]["Key"]
+        orphans = pd.read_parquet(BytesIO(s3_client.get_object(
+            Bucket="processing-bucket", Key=key)["Body"].read()))
+        # The missing designs arrive in a later run, but the missing dates do not
+        design_ids = {row["design_id"] for row in load_test_data("dim_design")}
+        designs = pd.DataFrame({"design_id": sorted(set(orphans["design_id"]) - design_ids),
+                                "design_name": "Late", "file_location": "/late", "file_name": "late.json"})
+        s3_client.put_object(Bucket="processing-bucket", Key="dim_design/transformed/late-dim_design.parquet",
+                             Body=designs.to_parquet(index=False))
+        ssm_client.put_parameter(Name="load_last_run", Value="2000_01_01-00_00_00", Overwrite=True)
+        loaded_before = len(read_test_database("fact_sales_order"))
+        load_data({}, {})
+        remaining = pd.read_parquet(BytesIO(s3_client.get_object(
+            Bucket="processing-bucket", Key=key)["Body"].read()))
+        redriven = (orphans["missing_keys"] == "design_id").sum()
+        assert redriven > 0
+        assert len(read_test_database("fact_sales_order")) == loaded_before + redriven
+        assert len(remaining) == len(orphans) - redriven
+        assert not remaining["missing_keys"].str.contains("design_id").any()
+
+
+class TestLoadEvents:
+    def test_load_events_loads_notified_files(self, create_db_tables, db_credentials,
+                                              s3_client, ssm_client):
+        ssm_client.put_parameter(Name="load_last_run", Value="None", Type="String")
+        keys = [item["Key"] for item in s3_client.list_objects_v2(Bucket="processing-bucket")["Contents"]]
+        result = load_events(sqs_event("processing-bucket", keys), {})
+        assert result == {"batchItemFailures": []}
+        for folder in ["dim_date", "dim_counterparty", "dim_currency", "dim_design",
+                       "dim_location", "dim_staff"]:
+            assert read_test_database(folder) == load_test_data(folder)
+        assert len(read_test_database("fact_sales_order")) > 0
+        last_run = ssm_client.get_parameter(Name="load_last_run")["Parameter"]["Value"]
+        assert re.match(r"^\d{4}_\d{2}_\d{2}-\d{2}_\d{2}_\d{2}$", last_run)
+
+    def test_load_events_reports_failed_messages(self, create_db_tables, db_credentials,
+                                                 s3_client, ssm_client):
+        s3_client.upload_file(Bucket="processing-bucket",
+                              Filename="data_examples/test_load_data/fail_dim_date.parquet",
+                              Key="dim_date/transformed/fail_dim_date.parquet")
+        keys = ["dim_design/transformed/fail.parquet", "dim_date/transformed/fail_dim_date.parquet"]
+        s3_client.copy_object(Bucket="processing-bucket", Key=keys[0],
+                              CopySource={"Bucket": "processing-bucket",
+                                          "Key": s3_client.list_objects_v2(
+                                              Bucket="processing-bucket",
+                                              Prefix="dim_design/")["Contents"][0]["Key"]})
+        ssm_client.put_parameter(Name="load_last_run", Value="None", Type="String")
+        result = load_events(sqs_event("processing-bucket", keys), {})
+        assert result == {"batchItemFailures": [{"itemIdentifier": "message-1"}]}
+        assert read_test_database("dim_design") == load_test_data("dim_design")
+        assert ssm_client.get_parameter(Name="load_last_run")["Parameter"]["Value"] == "None"
+
+    def test_load_events_reports_failed_redrives(self, create_db_tables, db_credentials,
+                                                 s3_client, ssm_client, caplog):
+        ssm_client.put_parameter(Name="load_last_run", Value="None", Type="String")
+        keys = [item["Key"] for item in s3_client.list_objects_v2(Bucket="processing-bucket")["Contents"]]
+        with patch("src.load_lambda.lambda_handler.redrive_quarantine",
+                   side_effect=DatabaseError("warehouse is unavailable")):
+            result = load_events(sqs_event("processing-bucket", keys), {})
+        assert result == {"batchItemFailures": []}
+        assert "Quarantined rows of fact_sales_order failed to load and stay quarantined" in caplog.text
+        assert ssm_client.get_parameter(Name="load_last_run")["Parameter"]["Value"] == "None"
+
+    def test_load_events_seeds_date_set(self, create_db_tables, db_credentials,
+                                        s3_client, ssm_client):
+        keys = [item["Key"] for item in s3_client.list_objects_v2(Bucket="processing-bucket")["Contents"]]
+        load_events(sqs_event("processing-bucket", keys), {})
+        days = load_date_set(s3_client, "processing-bucket")
+        assert len(days) == len(load_test_data("dim_date"))
+
+    def test_load_events_records_only_committed_dates(self, create_db_tables, db_credentials,
+                                                      s3_client, ssm_client):
+        save_date_set(s3_client, "processing-bucket", to_days(["1999-01-01"]))
+        s3_client.upload_file(Bucket="processing-bucket",
+                              Filename="data_examples/test_load_data/fail_dim_date.parquet",
+                              Key="dim_date/transformed/fail_dim_date.parquet")
+        failed = load_events(sqs_event("processing-bucket", ["dim_date/transformed/fail_dim_date.parquet"]),
+                             {})
+        assert failed == {"batchItemFailures": [{"itemIdentifier": "message-0"}]}
+        assert list(load_date_set(s3_client, "processing-bucket")) == list(to_days(["1999-01-01"]))
+
+        keys = [item["Key"] for item in s3_client.list_objects_v2(
+            Bucket="processing-bucket", Prefix="dim_date/")["Contents"] if "fail" not in item["Key"]]
+        load_events(sqs_event("processing-bucket", keys), {})
+        days = load_date_set(s3_client, "processing-bucket")
+        assert len(days) == len(load_test_data("dim_date")) + 1
+        assert days[0] == to_days(["1999-01-01"])[0]
+
+
 @mock_aws
 class TestLoadLambdaErrors:
     def test_load_lambda_handles_database_error(self, create_db_tables, db_credentials,
@@ -173,6 +317,8 @@ class TestLoadLambdaErrors:
                               Key="dim_date/transformed/dim_date.parquet")
         load_data({}, {})
         assert "Database Error" in caplog.text
+        last_run = ssm_client.get_parameter(Name="load_last_run")["Parameter"]["Value"]
+        assert last_run == last_run_value
 
     def test_load_lambda_handles_client_error(self, ssm_client):
         assert "ClientError" in load_data({}, {})
@@ -7,6 +7,10 @@ from src.load_lambda.load_utils import (
     get_parquet_files,
     get_parameter,
     put_parameter,
+    remove_loaded_files,
+    stage_rows,
+    quarantine_rows,
+    redrive_quarantine,
     close_db_connection)
 import os
 from datetime import datetime
@@ -14,6 +18,7 @@ from time import sleep
 from io import BytesIO
 from src.db.connection import connect_to_test_db
 from src.db.seed import seed_db
+from src.load_lambda.key_cache import DimensionKeyCache
 import pandas as pd
 import re
 from pg8000 import DatabaseError
@@ -153,6 +158,21 @@ class TestLoadUtils:
         assert len(result) == 3
 
 
+class TestRemoveLoadedFiles:
+    def test_new_files_are_kept(self):
+        files = [BytesIO(b"one"), BytesIO(b"two")]
+        new_files, hashes = remove_loaded_files(files, set())
+        assert new_files == files
+        assert len(hashes) == 2
+
+    def test_loaded_and_repeated_files_are_removed(self):
+        _, hashes = remove_loaded_files([BytesIO(b"one")], set())
+        files = [BytesIO(b"one"), BytesIO(b"two"), BytesIO(b"two")]
+        new_files, new_hashes = remove_loaded_files(files, set(hashes))
+        assert [f.getvalue() for f in new_files] == [b"two"]
+        assert len(new_hashes) == 1
+
+
 class TestDatabaseWrite:
     def test_write_to_database_dimension_tables(self, create_db_tables, db_credentials):
         tables = ["dim_date", "dim_location", "dim_design", "dim_currency", "dim_counterparty"]
@@ -171,6 +191,79 @@ class TestDatabaseWrite:
             result = read_test_database(table)
             assert result == load_test_data(table)
 
+    def test_write_to_database_same_day_dim_date_files(self, create_db_tables, db_credentials):
+        df = pd.read_parquet("data_examples/test_load_data/dim_date.parquet").head(1)
+        later = df.copy()
+        later["date_id"] = later["date_id"] + pd.Timedelta(hours=2)
+        buffers = []
+        for frame in [df, later]:
+            buffers.append(BytesIO())
+            frame.to_parquet(buffers[-1])
+        write_to_database("dim_date", buffers)
+        result = read_test_database("dim_date")
+        assert [row["date_id"] for row in result] == ["2022-11-03"]
+
+    def test_write_to_database_merges_changed_dimension_rows(self, create_db_tables, db_credentials):
+        write_to_database("dim_design", ["data_examples/test_load_data/dim_design.parquet"])
+        df = pd.read_parquet("data_examples/test_load_data/dim_design.parquet").head(1)
+        df["design_name"] = "Changed"
+        buffer = BytesIO()
+        df.to_parquet(buffer)
+        write_to_database("dim_design", [buffer])
+        result = read_test_database("dim_design")
+        changed = [row for row in result if row["design_id"] == df.iloc[0]["design_id"]]
+        assert len(result) == len(load_test_data("dim_design"))
+        assert changed[0]["design_name"] == "Changed"
+
+    def test_write_to_database_bulk_load_rebuilds_indexes(self, create_db_tables, db_credentials,
+                                                          monkeypatch):
+        monkeypatch.setattr("src.load_lambda.load_utils.BULK_LOAD_INDEX_THRESHOLD", 10)
+        dropped = []
+        monkeypatch.setattr("src.load_lambda.load_utils.drop_indexes",
+                            lambda conn, table, concurrently: dropped.append((table, concurrently)))
+        write_to_database("fact_sales_order", ["data_examples/test_load_data/fact_sales_order.parquet"])
+        conn = connect_to_test_db()
+        try:
+            indexes = conn.run("SELECT indexname FROM pg_indexes WHERE tablename = 'fact_sales_order'")
+            last_analyze = conn.run(
+                "SELECT last_analyze FROM pg_stat_user_tables WHERE relname = 'fact_sales_order'")
+        finally:
+            close_db_connection(conn)
+        assert dropped == [("fact_sales_order", True)]
+        assert "fact_sales_order_sales_order_id_idx" in [row[0] for row in indexes]
+        assert last_analyze[0][0] is not None
+
+    def test_write_to_database_consecutive_fact_files(self, create_db_tables, db_credentials):
+        first = pd.read_parquet("data_examples/test_load_data/fact_sales_order.parquet")
+        # A later file numbers its records from 1 again
+        second = first.copy()
+        second["sales_order_id"] += 1000
+        for df in [first, second, first]:
+            buffer = BytesIO()
+            df.to_parquet(buffer)
+            write_to_database("fact_sales_order", [buffer])
+        result = read_test_database("fact_sales_order")
+        assert sorted(row["sales_order_id"] for row in result) == sorted(
+            list(first["sales_order_id"]) + list(second["sales_order_id"]))
+        assert len({row["sales_record_id"] for row in result}) == len(result)
+
+    def test_redrive_quarantine_loads_resolved_rows(self, create_db_tables, db_credentials, s3_client):
+        tables = ["dim_location", "dim_design", "dim_currency", "dim_counterparty", "dim_date", "dim_staff"]
+        for table in tables:
+            write_to_database(table, [f"data_examples/test_load_data/{table}.parquet"])
+        conn = connect_to_test_db()
+        try:
+            facts = pd.read_parquet("data_examples/test_load_data/fact_sales_order.parquet")
+            facts, _ = DimensionKeyCache().resolve(conn, "fact_sales_order", facts)
+        finally:
+            close_db_connection(conn)
+        # Rows quarantined before their designs were loaded
+        quarantine_rows(s3_client, "processing-bucket", "fact_sales_order",
+                        facts.assign(missing_keys="design_id"))
+        loaded = redrive_quarantine(s3_client, "processing-bucket", "fact_sales_order", DimensionKeyCache())
+        assert loaded == len(facts) == len(read_test_database("fact_sales_order"))
+        assert s3_client.list_objects_v2(Bucket="processing-bucket", Prefix="_quarantine/")["KeyCount"] == 0
+
     def test_write_to_database_fact_sales_order(self, create_db_tables, db_credentials):
         tables = ["dim_location", "dim_design", "dim_currency", "dim_counterparty", "dim_date"]
         for table in tables:
@@ -223,6 +316,33 @@ class TestDatabaseWrite:
             assert isinstance(item["units_sold"], int)
         assert len(result) == 50
 
+    def test_write_to_database_rolls_back_failed_batches(self, db_credentials):
+        seed_db(foreign_keys=True)
+        with pytest.raises(DatabaseError):
+            write_to_database("fact_sales_order", ["data_examples/test_load_data/fact_sales_order.parquet"])
+        assert read_test_database("fact_sales_order") == []
+
+    def test_stage_rows_inserts_in_batches(self, create_db_tables, db_credentials, monkeypatch):
+        monkeypatch.setattr("src.load_lambda.load_utils.STAGING_BATCH_ROWS", 4)
+        df = pd.read_parquet("data_examples/test_load_data/dim_design.parquet")
+        conn = connect_to_test_db()
+        statements = []
+        run = conn.run
+
+        def counting_run(sql, **params):
+            statements.append(sql)
+            return run(sql, **params)
+        try:
+            conn.run("CREATE TEMP TABLE dim_design_staging (LIKE dim_design)")
+            conn.run = counting_run
+            stage_rows(conn, "dim_design_staging", df)
+            conn.run = run
+            staged = conn.run("SELECT COUNT(*) FROM dim_design_staging")
+        finally:
+            close_db_connection(conn)
+        assert staged[0][0] == len(df)
+        assert len(statements) == -(-len(df) // 4)
+
     def test_write_to_database_re_raises_database_errors_not_related_to_duplicate_data(self,
                                                                                        create_db_tables,
                                                                                        db_credentials):
@@ -0,0 +1,91 @@
+from src.common.manifest import (
+    is_internal_key,
+    content_hash,
+    load_manifest,
+    save_manifest,
+    record_hashes,
+)
+from moto import mock_aws
+import boto3
+import pytest
+import os
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(scope="function")
+def s3_client(aws_credentials):
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "eu-west-2"}
+        )
+        yield s3_client
+
+
+class TestManifest:
+    def test_is_internal_key(self):
+        assert is_internal_key("_state/extract_manifest.json")
+        assert not is_internal_key("staff/2024/11/12/11-52-staff.json")
+
+    def test_content_hash_is_deterministic(self):
+        assert content_hash(b"abc") == content_hash(b"abc")
+        assert content_hash(b"abc") != content_hash(b"abd")
+
+    def test_load_manifest_returns_empty_when_missing(self, s3_client):
+        assert load_manifest(s3_client, "test-bucket", "extract_manifest") == {}
+
+    def test_save_then_load_manifest(self, s3_client):
+        save_manifest(s3_client, "test-bucket", "extract_manifest", {"staff": ["a", "b"]})
+        assert load_manifest(s3_client, "test-bucket", "extract_manifest") == {"staff": ["a", "b"]}
+        objects = s3_client.list_objects_v2(Bucket="test-bucket")
+        assert objects["Contents"][0]["Key"].startswith("_state/extract_manifest/")
+
+    def test_concurrent_runs_keep_both_additions(self, s3_client):
+        save_manifest(s3_client, "test-bucket", "load_manifest", {"dim_date": ["a"]})
+        first = load_manifest(s3_client, "test-bucket", "load_manifest")
+        second = load_manifest(s3_client, "test-bucket", "load_manifest")
+        record_hashes(first, "dim_date", ["b"])
+        record_hashes(second, "dim_staff", ["c"])
+        save_manifest(s3_client, "test-bucket", "load_manifest", first)
+        save_manifest(s3_client, "test-bucket", "load_manifest", second)
+        assert load_manifest(s3_client, "test-bucket", "load_manifest") == {
+            "dim_date": ["a", "b"], "dim_staff": ["c"]
+        }
+
+    def test_save_replaces_the_objects_it_read(self, s3_client):
+        # Written by an earlier version, as one object
+        s3_client.put_object(Bucket="test-bucket", Key="_state/load_manifest.json",
+                             Body=b'{"dim_date": ["a"]}')
+        save_manifest(s3_client, "test-bucket", "load_manifest", {"dim_date": ["b"]})
+        manifest = load_manifest(s3_client, "test-bucket", "load_manifest")
+        assert manifest == {"dim_date": ["a", "b"]}
+        for hashes in [["c"], ["d"]]:
+            record_hashes(manifest, "dim_date", hashes)
+            key = save_manifest(s3_client, "test-bucket", "load_manifest", manifest)
+        keys = [item["Key"] for item in s3_client.list_objects_v2(Bucket="test-bucket")["Contents"]]
+        assert keys == [key]
+        assert load_manifest(s3_client, "test-bucket", "load_manifest") == {"dim_date": ["a", "b", "c", "d"]}
+
+    def test_manifests_of_other_names_are_not_read(self, s3_client):
+        save_manifest(s3_client, "test-bucket", "extract_manifest_north", {"staff": ["a"]})
+        assert load_manifest(s3_client, "test-bucket", "extract_manifest") == {}
+
+    def test_record_hashes_skips_known_hashes(self):
+        manifest = {"staff": ["a"]}
+        record_hashes(manifest, "staff", ["a", "b", "b"])
+        assert manifest == {"staff": ["a", "b"]}
+
+    def test_record_hashes_keeps_most_recent(self, monkeypatch):
+        monkeypatch.setattr("src.common.manifest.MANIFEST_HISTORY", 3)
+        manifest = {}
+        record_hashes(manifest, "staff", ["a", "b", "c", "d"])
+        assert manifest == {"staff": ["b", "c", "d"]}
@@ -0,0 +1,75 @@
+import json
+from src.load_lambda.micro_batch import MicroBatcher, parse_object_events
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_batcher(**kwargs):
+    loads = []
+    batcher = MicroBatcher(lambda table, keys: loads.append((table, keys)),
+                           ["dim_date", "dim_staff", "fact_sales_order"], **kwargs)
+    return batcher, loads
+
+
+class TestMicroBatcher:
+    def test_flushes_when_key_limit_reached(self):
+        batcher, loads = make_batcher(max_keys=2)
+        batcher.add("dim_date/a.parquet")
+        assert loads == []
+        batcher.add("dim_date/b.parquet")
+        assert loads == [("dim_date", ["dim_date/a.parquet", "dim_date/b.parquet"])]
+
+    def test_flushes_when_byte_limit_reached(self):
+        batcher, loads = make_batcher(max_bytes=100)
+        batcher.add("dim_date/a.parquet", 60)
+        assert loads == []
+        batcher.add("dim_date/b.parquet", 60)
+        assert len(loads) == 1
+
+    def test_flushes_when_buffer_is_too_old(self):
+        clock = FakeClock()
+        batcher, loads = make_batcher(max_age=30, clock=clock)
+        batcher.add("dim_date/a.parquet")
+        clock.now = 31
+        batcher.add("dim_date/b.parquet")
+        assert loads == [("dim_date", ["dim_date/a.parquet"])]
+        batcher.flush()
+        assert loads[-1] == ("dim_date", ["dim_date/b.parquet"])
+
+    def test_flush_loads_tables_in_table_order(self):
+        batcher, loads = make_batcher()
+        batcher.add("fact_sales_order/a.parquet")
+        batcher.add("dim_staff/a.parquet")
+        batcher.add("dim_date/a.parquet")
+        batcher.flush()
+        assert [table for table, _ in loads] == ["dim_date", "dim_staff", "fact_sales_order"]
+
+    def test_ignores_unknown_tables(self):
+        batcher, loads = make_batcher()
+        batcher.add("dim_unknown/a.parquet")
+        batcher.flush()
+        assert loads == []
+
+
+class TestParseObjectEvents:
+    def test_parses_sqs_batch(self):
+        body = {"Records": [{"s3": {"bucket": {"name": "bucket"},
+                                    "object": {"key": "dim_date/2024/01/01-dim+date.parquet", "size": 5}}}]}
+        event = {"Records": [{"messageId": "1", "body": json.dumps(body)}]}
+        assert parse_object_events(event) == [{"bucket": "bucket", "key": "dim_date/2024/01/01-dim date.parquet",
+                                               "size": 5, "message_id": "1"}]
+
+    def test_skips_internal_and_non_parquet_keys(self):
+        records = [{"s3": {"bucket": {"name": "bucket"}, "object": {"key": key}}}
+                   for key in ["_state/load_manifest.json", "dim_date/a.json", "dim_date/a.parquet"]]
+        assert [item["key"] for item in parse_object_events({"Records": records})] == ["dim_date/a.parquet"]
+
+    def test_ignores_test_events_without_records(self):
+        event = {"Records": [{"messageId": "1", "body": json.dumps({"Event": "s3:TestEvent"})}]}
+        assert parse_object_events(event) == []
@@ -0,0 +1,91 @@
+from src.common.object_store import (
+    get_s3_client,
+    put_body,
+    get_body,
+    get_bodies,
+    put_bodies,
+    list_objects,
+    RangedObject,
+)
+from moto import mock_aws
+import boto3
+import pytest
+import os
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(scope="function")
+def s3_client(aws_credentials):
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "eu-west-2"}
+        )
+        yield s3_client
+
+
+class TestGetS3Client:
+    def test_client_is_shared(self, aws_credentials):
+        assert get_s3_client() is get_s3_client()
+
+    def test_client_uses_pool_and_adaptive_retries(self, aws_credentials):
+        config = get_s3_client().meta.config
+        assert config.max_pool_connections >= 10
+        assert config.retries["mode"] == "adaptive"
+
+
+class TestPutAndGetBody:
+    def test_put_body_then_get_body(self, s3_client):
+        put_body(s3_client, "test-bucket", "table/file.json", b"[1, 2, 3]")
+        assert get_body(s3_client, "test-bucket", "table/file.json") == b"[1, 2, 3]"
+
+    def test_put_body_uses_multipart_for_large_bodies(self, s3_client, monkeypatch):
+        monkeypatch.setattr("src.common.object_store.MULTIPART_THRESHOLD", 10)
+        put_body(s3_client, "test-bucket", "table/large.bin", b"x" * 100)
+        assert get_body(s3_client, "test-bucket", "table/large.bin") == b"x" * 100
+
+    def test_get_body_byte_range(self, s3_client):
+        put_body(s3_client, "test-bucket", "table/file.bin", b"0123456789")
+        assert get_body(s3_client, "test-bucket", "table/file.bin", byte_range=(2, 5)) == b"2345"
+
+
+class TestBatchOperations:
+    def test_put_bodies_and_get_bodies_preserve_order(self, s3_client):
+        items = {f"table/{i}.json": str(i).encode() for i in range(20)}
+        put_bodies(s3_client, "test-bucket", items)
+        result = get_bodies(s3_client, "test-bucket", list(items))
+        assert result == list(items.values())
+
+    def test_get_bodies_empty(self, s3_client):
+        assert get_bodies(s3_client, "test-bucket", []) == []
+
+    def test_list_objects_follows_pages(self, s3_client):
+        for i in range(5):
+            s3_client.put_object(Bucket="test-bucket", Key=f"table/{i}.json", Body=b"")
+        s3_client.put_object(Bucket="test-bucket", Key="other/0.json", Body=b"")
+        paginator = s3_client.get_paginator("list_objects_v2")
+        assert len(list(paginator.paginate(Bucket="test-bucket", Prefix="table/",
+                                           PaginationConfig={"PageSize": 2}))) == 3
+        result = list_objects(s3_client, "test-bucket", "table/")
+        assert [item["Key"] for item in result] == [f"table/{i}.json" for i in range(5)]
+
+
+class TestRangedObject:
+    def test_reads_and_seeks_with_ranged_gets(self, s3_client):
+        put_body(s3_client, "test-bucket", "table/file.bin", b"0123456789")
+        source = RangedObject(s3_client, "test-bucket", "table/file.bin")
+        source.seek(-3, 2)
+        assert source.read() == b"789"
+        source.seek(2)
+        assert source.read(3) == b"234"
+        assert source.read(0) == b""
+        assert source.requests == 2
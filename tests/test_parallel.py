@@ -0,0 +1,78 @@
+import json
+import logging
+import pytest
+import pandas as pd
+import pyarrow as pa
+from unittest.mock import patch
+from moto import mock_aws
+from src.transform_lambda.transform_helpers import transform_data
+from src.transform_lambda.parallel import should_parallelize, row_ranges, chunk_frame, transform_parallel
+from src.transform_lambda.lambda_handler import lambda_handler
+from tests.test_spill import SALES, PAYMENTS
+from tests.test_transform_lambda_function import (  # noqa: F401
+    aws_credentials,
+    ssm_mock,
+    s3_client,
+    bucket_name,
+)
+
+
+class TestShouldParallelize:
+    def test_off_by_default(self):
+        assert not should_parallelize("sales_order", 10 ** 6)
+
+    def test_only_large_chunkable_payloads(self, monkeypatch):
+        monkeypatch.setattr("src.transform_lambda.parallel.TRANSFORM_PARALLEL", "process")
+        monkeypatch.setattr("src.transform_lambda.parallel.TRANSFORM_PARALLEL_WORKERS", 4)
+        monkeypatch.setattr("src.transform_lambda.parallel.TRANSFORM_PARALLEL_MIN_ROWS", 100)
+        assert should_parallelize("sales_order", 100)
+        assert not should_parallelize("sales_order", 99)
+        assert not should_parallelize("staff", 1000)
+
+
+class TestRowRanges:
+    def test_ranges_cover_every_row(self):
+        assert row_ranges(10, 4) == [(0, 3), (3, 6), (6, 9), (9, 10)]
+
+    def test_fewer_rows_than_workers(self):
+        assert row_ranges(2, 4) == [(0, 1), (1, 2)]
+
+    def test_chunks_keep_row_positions(self):
+        assert list(chunk_frame(SALES, 3, 6).index) == [3, 4, 5]
+        assert list(chunk_frame(pa.Table.from_pylist(SALES), 3, 6).index) == [3, 4, 5]
+
+
+class TestTransformParallel:
+    def test_sales_order_matches_single_process_transform(self):
+        fact, dates = transform_parallel(SALES, "sales_order", workers=3)
+        expected_fact, expected_dates = transform_data(SALES, "sales_order")
+        pd.testing.assert_frame_equal(fact, expected_fact.reset_index(drop=True))
+        assert sorted(dates["date_id"].dt.date) == sorted(expected_dates["date_id"].dt.date)
+
+    def test_typed_payment_matches_single_process_transform(self):
+        table = pa.Table.from_pylist(PAYMENTS)
+        fact = transform_parallel(table, "payment", workers=2)
+        pd.testing.assert_frame_equal(fact, transform_data(table, "payment").reset_index(drop=True))
+
+    def test_worker_errors_are_raised(self):
+        rows = [{key: value for key, value in row.items() if key != "units_sold"} for row in SALES]
+        with pytest.raises(RuntimeError, match="Parallel transform of sales_order failed"):
+            transform_parallel(rows, "sales_order", workers=2)
+
+
+@mock_aws
+class TestHandlerParallel:
+    @patch("src.transform_lambda.lambda_handler.should_parallelize", return_value=True)
+    def test_sales_file_is_transformed_in_processes(self, parallel_mock, s3_client, ssm_mock,  # noqa: F811
+                                                    caplog, monkeypatch):
+        monkeypatch.setattr("src.transform_lambda.parallel.TRANSFORM_PARALLEL_WORKERS", 2)
+        caplog.set_level(logging.INFO)
+        key = "sales_order/24/11/20/12-10-sales_order.json"
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=json.dumps(SALES))
+        response = lambda_handler({"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                                       "object": {"key": key}}}]}, {})
+        assert response == "Successfully ran"
+        assert "Transformed 7 sales_order rows in 2 processes" in caplog.text
+        for table in ["fact_sales_order", "dim_date"]:
+            objects = s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix=f"{table}/")
+            assert objects["KeyCount"] == 1
@@ -0,0 +1,95 @@
+from src.common.parameter_store import (
+    get_parameter,
+    get_parameters,
+    set_parameter,
+    clear_parameter_cache,
+)
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from unittest.mock import patch
+import boto3
+import pytest
+import os
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(scope="function")
+def ssm_client(aws_credentials):
+    with mock_aws():
+        ssm_client = boto3.client("ssm", region_name="eu-west-2")
+        ssm_client.put_parameter(Name="ingestion_bucket_name", Value="ingestion", Type="String")
+        ssm_client.put_parameter(Name="processed_bucket_name", Value="processed", Type="String")
+        ssm_client.put_parameter(Name="lambda_last_run", Value="None", Type="String")
+        yield ssm_client
+
+
+class TestGetParameter:
+    def test_get_parameter_returns_correct_value(self, ssm_client):
+        assert get_parameter(ssm_client, "ingestion_bucket_name") == "ingestion"
+
+    def test_get_parameter_uses_cache(self, ssm_client):
+        get_parameter(ssm_client, "ingestion_bucket_name")
+        with patch.object(ssm_client, "get_parameters") as mock_get:
+            assert get_parameter(ssm_client, "ingestion_bucket_name") == "ingestion"
+            mock_get.assert_not_called()
+
+    def test_get_parameter_refetches_after_ttl(self, ssm_client):
+        get_parameter(ssm_client, "ingestion_bucket_name")
+        ssm_client.put_parameter(Name="ingestion_bucket_name", Value="new", Type="String", Overwrite=True)
+        assert get_parameter(ssm_client, "ingestion_bucket_name", ttl=0) == "new"
+
+    def test_watermarks_are_never_cached(self, ssm_client):
+        assert get_parameter(ssm_client, "lambda_last_run") == "None"
+        # Moved by a run in another container
+        ssm_client.put_parameter(Name="lambda_last_run", Value="2024_11_12-11_52", Overwrite=True)
+        assert get_parameter(ssm_client, "lambda_last_run") == "2024_11_12-11_52"
+        with patch.object(ssm_client, "get_parameters", wraps=ssm_client.get_parameters) as mock_get:
+            get_parameters(ssm_client, ["lambda_last_run", "ingestion_bucket_name"])
+            get_parameters(ssm_client, ["lambda_last_run", "ingestion_bucket_name"])
+            assert [call.kwargs["Names"] for call in mock_get.call_args_list] == [
+                ["lambda_last_run", "ingestion_bucket_name"], ["lambda_last_run"]
+            ]
+
+    def test_get_parameter_missing_raises_client_error(self, ssm_client):
+        with pytest.raises(ClientError, match="ParameterNotFound"):
+            get_parameter(ssm_client, "not_a_parameter")
+
+
+class TestGetParameters:
+    def test_get_parameters_returns_all_values(self, ssm_client):
+        result = get_parameters(ssm_client, ["ingestion_bucket_name", "processed_bucket_name"])
+        assert result == {"ingestion_bucket_name": "ingestion", "processed_bucket_name": "processed"}
+
+    def test_get_parameters_fetches_in_one_call(self, ssm_client):
+        with patch.object(ssm_client, "get_parameters", wraps=ssm_client.get_parameters) as mock_get:
+            get_parameters(ssm_client, ["ingestion_bucket_name", "processed_bucket_name", "lambda_last_run"])
+            assert mock_get.call_count == 1
+
+    def test_get_parameters_only_fetches_uncached_values(self, ssm_client):
+        get_parameter(ssm_client, "ingestion_bucket_name")
+        with patch.object(ssm_client, "get_parameters", wraps=ssm_client.get_parameters) as mock_get:
+            get_parameters(ssm_client, ["ingestion_bucket_name", "processed_bucket_name"])
+            mock_get.assert_called_once_with(Names=["processed_bucket_name"])
+
+    def test_clear_parameter_cache(self, ssm_client):
+        get_parameter(ssm_client, "ingestion_bucket_name")
+        clear_parameter_cache()
+        with patch.object(ssm_client, "get_parameters", wraps=ssm_client.get_parameters) as mock_get:
+            get_parameter(ssm_client, "ingestion_bucket_name")
+            assert mock_get.call_count == 1
+
+
+class TestSetParameter:
+    def test_set_parameter_invalidates_cached_value(self, ssm_client):
+        assert get_parameter(ssm_client, "lambda_last_run") == "None"
+        set_parameter(ssm_client, "lambda_last_run", "2024_11_12-11_52")
+        assert get_parameter(ssm_client, "lambda_last_run") == "2024_11_12-11_52"
@@ -0,0 +1,110 @@
+import time
+import json
+import threading
+import pytest
+from unittest.mock import patch
+from src.extract_lambda.lambda_handler import lambda_handler
+from src.extract_lambda.pipeline import UploadPipeline
+from tests.test_lambda_handler import s3_client, ssm_client, aws_credentials  # noqa: F401
+
+TABLES = ["currency", "staff", "design", "address"]
+
+
+def slow_put_body(seconds):
+    """Stands in for put_body, taking seconds per upload"""
+    def put(client, bucket, key, body):
+        time.sleep(seconds)
+        return key
+    return put
+
+
+def slow_rows(seconds):
+    """Stands in for get_data, taking seconds per query"""
+    def get(table, since):
+        time.sleep(seconds)
+        return [{f"{table}_id": i, "created_at": "2024-01-01T09:00:00"} for i in range(3)]
+    return get
+
+
+class TestUploadPipeline:
+    def test_objects_are_uploaded(self, s3_client):  # noqa: F811
+        with UploadPipeline(s3_client, "test-bucket", workers=2) as uploads:
+            for table in TABLES:
+                uploads.submit(f"{table}/{table}.json", b"[]")
+        assert uploads.close() == [f"{table}/{table}.json" for table in TABLES]
+        assert s3_client.list_objects_v2(Bucket="test-bucket")["KeyCount"] == 4
+
+    @patch("src.extract_lambda.pipeline.put_body", side_effect=slow_put_body(0.02))
+    def test_pending_bytes_stay_under_the_limit(self, put_mock):
+        with UploadPipeline(None, "test-bucket", workers=4, max_bytes=25) as uploads:
+            for i in range(10):
+                uploads.submit(f"{i}.json", b"x" * 10)
+        assert uploads.peak_bytes == 20
+        assert uploads.pending_bytes == 0
+        assert put_mock.call_count == 10
+
+    @patch("src.extract_lambda.pipeline.put_body", side_effect=slow_put_body(0.02))
+    def test_oversized_body_is_uploaded_alone(self, put_mock):
+        with UploadPipeline(None, "test-bucket", max_bytes=5) as uploads:
+            uploads.submit("small.json", b"x" * 4)
+            uploads.submit("large.json", b"x" * 50)
+        assert uploads.peak_bytes == 50
+
+    def test_submit_waits_for_uploads_to_drain(self):
+        released = threading.Event()
+
+        def blocked_put(client, bucket, key, body):
+            released.wait(5)
+            return key
+
+        with patch("src.extract_lambda.pipeline.put_body", side_effect=blocked_put):
+            with UploadPipeline(None, "test-bucket", max_bytes=10) as uploads:
+                uploads.submit("first.json", b"x" * 8)
+                waiting = threading.Thread(target=uploads.submit, args=("second.json", b"x" * 8))
+                waiting.start()
+                waiting.join(0.2)
+                assert waiting.is_alive()
+                released.set()
+                waiting.join(5)
+        assert uploads.close() == ["first.json", "second.json"]
+
+    @patch("src.extract_lambda.pipeline.put_body", side_effect=ValueError("bucket is gone"))
+    def test_upload_errors_are_raised(self, put_mock):
+        with pytest.raises(ValueError, match="bucket is gone"):
+            with UploadPipeline(None, "test-bucket", workers=1) as uploads:
+                uploads.submit("first.json", b"[]")
+                time.sleep(0.1)
+                uploads.submit("second.json", b"[]")
+        put_mock.assert_called_once()
+
+
+@patch("src.extract_lambda.lambda_handler.probe_changes",
+       side_effect=lambda tables, since: {table: (3, None) for table in tables})
+class TestPipelineHandler:
+    def test_every_changed_table_is_uploaded(self, probe_mock, s3_client, ssm_client):  # noqa: F811
+        with patch("src.extract_lambda.lambda_handler.get_data", side_effect=slow_rows(0)):
+            assert lambda_handler({}, {}) == "Successfully ran"
+        keys = [item["Key"] for item in s3_client.list_objects_v2(Bucket="test-bucket")["Contents"]]
+        sales = [key for key in keys if key.startswith("sales_order/")]
+        assert len(sales) == 1
+        body = s3_client.get_object(Bucket="test-bucket", Key=sales[0])["Body"].read()
+        assert json.loads(body)[0] == {"sales_order_id": 0, "created_at": "2024-01-01T09:00:00"}
+        assert len([key for key in keys if not key.startswith("_")]) == 11
+
+    @patch("src.extract_lambda.pipeline.put_body", side_effect=slow_put_body(0.05))
+    def test_queries_overlap_uploads(self, put_mock, probe_mock, s3_client, ssm_client):  # noqa: F811
+        with patch("src.extract_lambda.lambda_handler.get_data", side_effect=slow_rows(0.05)):
+            start = time.perf_counter()
+            assert lambda_handler({}, {}) == "Successfully ran"
+            elapsed = time.perf_counter() - start
+        # 11 queries and 11 uploads of 50ms each take 1.1s one after the other
+        assert put_mock.call_count == 11
+        assert elapsed < 0.9
+
+    @patch("src.extract_lambda.pipeline.put_body", side_effect=ValueError("bucket is gone"))
+    def test_failed_upload_saves_no_state(self, put_mock, probe_mock, s3_client, ssm_client):  # noqa: F811
+        with patch("src.extract_lambda.lambda_handler.get_data", side_effect=slow_rows(0)):
+            assert lambda_handler({}, {}) == "Unexpected Error: bucket is gone"
+        assert s3_client.list_objects_v2(Bucket="test-bucket")["KeyCount"] == 0
+        last_run = ssm_client.get_parameter(Name="lambda_last_run")["Parameter"]["Value"]
+        assert last_run == "2020_11_11-10_10"
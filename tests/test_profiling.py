@@ -0,0 +1,91 @@
+import os
+import json
+import boto3
+import pytest
+import tracemalloc
+from moto import mock_aws
+from src.common.profiling import should_profile, profile_section, profiled, write_report
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.common.profiling.PROFILE_LOCATION", str(tmp_path))
+    return tmp_path
+
+
+def written_reports(directory) -> list[dict]:
+    reports = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name)) as file:
+                reports.append(json.load(file))
+    return reports
+
+
+@profiled
+def handler(event, context):
+    for table in ["design", "staff"]:
+        with profile_section(table):
+            [bytes(1024) for _ in range(100)]
+    if event.get("fail"):
+        raise ValueError("handler failed")
+    return "Successfully ran"
+
+
+class TestShouldProfile:
+    def test_off_by_default(self):
+        assert not should_profile({})
+
+    def test_event_flag_profiles(self):
+        assert should_profile({"profile": True})
+
+    def test_sample_rate_applies_when_on(self, monkeypatch):
+        monkeypatch.setattr("src.common.profiling.PROFILE_HANDLERS", "on")
+        monkeypatch.setattr("src.common.profiling.PROFILE_SAMPLE_RATE", 1.0)
+        assert should_profile({})
+        monkeypatch.setattr("src.common.profiling.PROFILE_SAMPLE_RATE", 0.0)
+        assert not should_profile({})
+
+
+class TestProfiled:
+    def test_unprofiled_invocations_write_nothing(self, profile_dir):
+        assert handler({}, None) == "Successfully ran"
+        assert written_reports(profile_dir) == []
+
+    def test_report_has_functions_allocations_and_tables(self, profile_dir, monkeypatch):
+        monkeypatch.setattr("src.common.profiling.PROFILE_TOP_N", 5)
+        assert handler({"profile": True}, None) == "Successfully ran"
+        [report] = written_reports(profile_dir)
+        assert report["handler"] == "handler"
+        assert 0 < len(report["functions"]) <= 5
+        assert 0 < len(report["allocations"]) <= 5
+        assert set(report["sections"]) == {"design", "staff"}
+        assert report["sections"]["design"]["calls"] == 1
+        assert not tracemalloc.is_tracing()
+
+    def test_failing_handler_is_still_profiled(self, profile_dir):
+        with pytest.raises(ValueError):
+            handler({"profile": True, "fail": True}, None)
+        assert len(written_reports(profile_dir)) == 1
+
+    def test_unwritable_report_does_not_fail_the_handler(self, monkeypatch, caplog):
+        def fail(*args):
+            raise OSError("read-only file system")
+
+        monkeypatch.setattr("src.common.profiling.write_report", fail)
+        assert handler({"profile": True}, None) == "Successfully ran"
+        assert "Could not write profile of handler" in caplog.text
+
+
+class TestWriteReport:
+    @mock_aws
+    def test_s3_location(self, monkeypatch):
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-2")
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(Bucket="profiles", CreateBucketConfiguration={"LocationConstraint": "eu-west-2"})
+        monkeypatch.setattr("src.common.profiling.PROFILE_LOCATION", "s3://profiles/_profiles")
+        uri = write_report({"handler": "handler"}, "handler", "request-1")
+        assert uri.startswith("s3://profiles/_profiles/handler/") and uri.endswith("-request-1.json")
+        key = uri[len("s3://profiles/"):]
+        body = client.get_object(Bucket="profiles", Key=key)["Body"].read()
+        assert json.loads(body) == {"handler": "handler"}
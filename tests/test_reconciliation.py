@@ -0,0 +1,149 @@
+import pandas as pd
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from src.common.reconciliation import (
+    key_hashes,
+    aggregate,
+    add_aggregates,
+    add_source_rows,
+    load_ledger,
+    save_ledger,
+    warehouse_aggregates,
+    reconcile,
+)
+from src.transform_lambda.transform_helpers import transform_fact_sales_order
+from src.load_lambda.lambda_handler import reconcile_data
+from src.load_lambda.load_utils import write_to_database, create_conn, close_db_connection
+from tests.test_load_lambda import ssm_client, aws_credentials, create_db_tables, db_credentials  # noqa: F401
+from tests.test_load_utils import s3_client  # noqa: F401
+
+FACT_FILE = "data_examples/test_load_data/fact_sales_order.parquet"
+
+SALES_ORDERS = [
+    {"sales_order_id": 2, "created_at": "2022-11-03T14:20:52.186", "last_updated": "2022-11-03T15:20:52.186",
+     "design_id": 3, "staff_id": 19, "counterparty_id": 8, "units_sold": 100, "unit_price": 3.94,
+     "currency_id": 2, "agreed_delivery_date": "2022-11-07", "agreed_payment_date": "2022-11-08",
+     "agreed_delivery_location_id": 8},
+    {"sales_order_id": 3, "created_at": "2022-11-03T16:20:52.186", "last_updated": "2022-11-03T16:20:52.186",
+     "design_id": 3, "staff_id": 19, "counterparty_id": 8, "units_sold": 50, "unit_price": 3.94,
+     "currency_id": 2, "agreed_delivery_date": "2022-11-07", "agreed_payment_date": "2022-11-08",
+     "agreed_delivery_location_id": 8},
+    {"sales_order_id": 4, "created_at": "2022-11-04T09:00:00.000", "last_updated": "2022-11-04T09:00:00.000",
+     "design_id": 3, "staff_id": 19, "counterparty_id": 8, "units_sold": 7, "unit_price": 3.94,
+     "currency_id": 2, "agreed_delivery_date": "2022-11-07", "agreed_payment_date": "2022-11-08",
+     "agreed_delivery_location_id": 8},
+]
+
+
+class TestAggregate:
+    def test_key_hash_is_order_independent(self):
+        keys = pd.Series([5, 17, 123456])
+        assert key_hashes(keys).sum() == key_hashes(keys[::-1]).sum()
+        assert key_hashes(pd.Series([5, 18, 123456])).sum() != key_hashes(keys).sum()
+
+    def test_source_and_transformed_rows_agree(self):
+        source = {}
+        add_source_rows(source, "sales_order", SALES_ORDERS)
+        processed = {}
+        add_aggregates(processed, "fact_sales_order",
+                       aggregate(transform_fact_sales_order(SALES_ORDERS), "fact_sales_order"))
+        assert source == processed
+        assert source["fact_sales_order"]["2022-11-03"][:2] == [2, 150.0]
+        assert source["fact_sales_order"]["2022-11-04"][:2] == [1, 7.0]
+
+    def test_unreconciled_tables_are_ignored(self):
+        ledger = {}
+        add_source_rows(ledger, "design", [{"design_id": 1}])
+        assert ledger == {}
+
+
+class TestLedger:
+    def test_aggregates_add_up_across_threads(self):
+        ledger = {}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for _ in range(20):
+                executor.submit(add_aggregates, ledger, "fact_sales_order", {"2022-11-03": [1, 1.5, 10]})
+        assert ledger == {"fact_sales_order": {"2022-11-03": [20, 30.0, 200]}}
+
+    def test_ledger_round_trips(self, s3_client):  # noqa: F811
+        ledger = {"fact_sales_order": {"2022-11-03": [2, 150.0, 99]}}
+        save_ledger(s3_client, "processing-bucket", "processed", ledger)
+        assert load_ledger(s3_client, "processing-bucket", "processed") == ledger
+        assert load_ledger(s3_client, "processing-bucket", "source") == {}
+
+    def test_overlapping_runs_are_summed(self, s3_client):  # noqa: F811
+        runs = [{"fact_sales_order": {"2022-11-03": [2, 150.0, 99]}},
+                {"fact_sales_order": {"2022-11-03": [1, 0.5, 1], "2022-11-04": [1, 7.0, 5]}}]
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            keys = list(executor.map(
+                lambda run: save_ledger(s3_client, "processing-bucket", "processed", run), runs
+            ))
+        assert len(set(keys)) == 2
+        assert load_ledger(s3_client, "processing-bucket", "processed") == {
+            "fact_sales_order": {"2022-11-03": [3, 150.5, 100], "2022-11-04": [1, 7.0, 5]}
+        }
+
+    def test_runs_without_additions_write_nothing(self, s3_client):  # noqa: F811
+        assert save_ledger(s3_client, "processing-bucket", "source", {}) is None
+        assert s3_client.list_objects_v2(Bucket="processing-bucket", Prefix="_state/")["KeyCount"] == 0
+
+    def test_warehouse_snapshot_replaces_the_last(self, s3_client):  # noqa: F811
+        for rows in [1, 2]:
+            snapshot = {"fact_sales_order": {"2022-11-03": [rows, 1.0, 7]}}
+            save_ledger(s3_client, "processing-bucket", "warehouse", snapshot)
+        assert load_ledger(s3_client, "processing-bucket", "warehouse") == {
+            "fact_sales_order": {"2022-11-03": [2, 1.0, 7]}
+        }
+
+
+class TestReconcile:
+    ledger = {"fact_sales_order": {"2022-11-03": [2, 150.0, 99], "2022-11-04": [1, 7.0, 5]}}
+
+    def test_matching_ledgers(self):
+        assert reconcile({"source": self.ledger, "processed": self.ledger}, ["fact_sales_order"]) == []
+
+    def test_mismatch_is_reported_at_the_stage_it_appears(self):
+        warehouse = {"fact_sales_order": {"2022-11-03": [1, 100.0, 40]}}
+        mismatches = reconcile(
+            {"source": self.ledger, "processed": self.ledger, "warehouse": warehouse}, ["fact_sales_order"]
+        )
+        assert mismatches == [
+            {"table": "fact_sales_order", "day": "2022-11-03", "stage": "warehouse",
+             "expected": [2, 150.0, 99], "actual": [1, 100.0, 40]},
+            {"table": "fact_sales_order", "day": "2022-11-04", "stage": "warehouse",
+             "expected": [1, 7.0, 5], "actual": [0, 0.0, 0]},
+        ]
+
+
+@pytest.fixture
+def loaded_warehouse(create_db_tables, db_credentials):  # noqa: F811
+    for table in ["dim_location", "dim_design", "dim_currency", "dim_counterparty", "dim_date"]:
+        write_to_database(table, [f"data_examples/test_load_data/{table}.parquet"])
+    write_to_database("fact_sales_order", [FACT_FILE])
+
+
+class TestWarehouse:
+    def test_warehouse_aggregates_match_the_loaded_file(self, loaded_warehouse):
+        conn = create_conn()
+        try:
+            aggregates = warehouse_aggregates(conn, "fact_sales_order")
+        finally:
+            close_db_connection(conn)
+        assert aggregates == aggregate(pd.read_parquet(FACT_FILE), "fact_sales_order")
+
+    def test_handler_reports_mismatches(self, loaded_warehouse, s3_client, ssm_client, caplog):  # noqa: F811
+        s3_client.create_bucket(Bucket="ingestion-bucket",
+                                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"})
+        ssm_client.put_parameter(Name="ingestion_bucket_name", Value="ingestion-bucket", Type="String")
+        ledger = {}
+        add_aggregates(ledger, "fact_sales_order", aggregate(pd.read_parquet(FACT_FILE), "fact_sales_order"))
+        save_ledger(s3_client, "processing-bucket", "processed", ledger)
+        save_ledger(s3_client, "ingestion-bucket", "source", ledger)
+        assert reconcile_data({}, {}) == "Reconciled 1 tables, 0 mismatched days."
+        assert load_ledger(s3_client, "processing-bucket", "warehouse") == ledger
+
+        # A later extract adds a row to one day that never reached the processed files
+        day = sorted(ledger["fact_sales_order"])[0]
+        save_ledger(s3_client, "ingestion-bucket", "source", {"fact_sales_order": {day: [1, 0.0, 0]}})
+        assert reconcile_data({}, {}) == "Reconciled 1 tables, 1 mismatched days."
+        assert f"Reconciliation mismatch: fact_sales_order {day} at processed" in caplog.text
@@ -0,0 +1,76 @@
+from src.transform_lambda.row_diff import (
+    row_fingerprints,
+    load_fingerprints,
+    save_fingerprints,
+    diff_rows,
+)
+from moto import mock_aws
+import pandas as pd
+import boto3
+import pytest
+import os
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(scope="function")
+def s3_client(aws_credentials):
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name="eu-west-2")
+        s3_client.create_bucket(
+            Bucket="processed-bucket", CreateBucketConfiguration={"LocationConstraint": "eu-west-2"}
+        )
+        yield s3_client
+
+
+@pytest.fixture
+def dim_design():
+    return pd.DataFrame({"design_id": [1, 2, 3],
+                         "design_name": ["Wooden", "Steel", "Bronze"],
+                         "file_location": ["/usr", "/usr", "/opt"],
+                         "file_name": ["wooden.json", "steel.json", "bronze.json"]})
+
+
+class TestRowDiff:
+    def test_row_fingerprints_indexed_by_primary_key(self, dim_design):
+        result = row_fingerprints(dim_design, "dim_design")
+        assert list(result.index) == [1, 2, 3]
+        assert result.dtype == "uint64"
+
+    def test_all_rows_are_new_without_index(self, dim_design):
+        delta, fingerprints = diff_rows(dim_design, "dim_design", pd.Series(dtype="uint64"))
+        assert delta.equals(dim_design)
+        assert len(fingerprints) == 3
+
+    def test_unchanged_rows_are_removed(self, dim_design):
+        _, fingerprints = diff_rows(dim_design, "dim_design", pd.Series(dtype="uint64"))
+        delta, _ = diff_rows(dim_design, "dim_design", fingerprints)
+        assert delta.empty
+
+    def test_only_inserted_and_changed_rows_are_kept(self, dim_design):
+        _, fingerprints = diff_rows(dim_design, "dim_design", pd.Series(dtype="uint64"))
+        changed = dim_design.copy()
+        changed.loc[1, "design_name"] = "Iron"
+        changed.loc[3] = [4, "Glass", "/opt", "glass.json"]
+        delta, updated = diff_rows(changed, "dim_design", fingerprints)
+        assert list(delta["design_id"]) == [2, 4]
+        assert len(updated) == 4
+        assert updated[2] != fingerprints[2]
+
+    def test_save_then_load_fingerprints(self, s3_client, dim_design):
+        fingerprints = row_fingerprints(dim_design, "dim_design")
+        save_fingerprints(s3_client, "processed-bucket", "dim_design", fingerprints)
+        result = load_fingerprints(s3_client, "processed-bucket", "dim_design")
+        assert list(result.index) == [1, 2, 3]
+        assert list(result.values) == list(fingerprints.values)
+
+    def test_load_fingerprints_when_missing(self, s3_client):
+        assert load_fingerprints(s3_client, "processed-bucket", "dim_design").empty
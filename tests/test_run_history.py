@@ -0,0 +1,99 @@
+import json
+import boto3
+import multiprocessing
+import pytest
+from moto import mock_aws
+from src.common.run_history import record_volume, recorded, save_run, load_runs
+
+
+class FakeContext:
+    memory_limit_in_mb = "512"
+
+    def get_remaining_time_in_millis(self):
+        return 300000
+
+
+@recorded("extract")
+def handler(event, context):
+    record_volume("design", 10, 1000)
+    record_volume("design", 5, 500)
+    record_volume("staff", size=200)
+    if event.get("fail"):
+        raise ValueError("handler failed")
+    return "Successfully ran"
+
+
+@pytest.fixture
+def history_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.common.run_history.RUN_HISTORY_LOCATION", str(tmp_path))
+    return tmp_path
+
+
+class TestRecorded:
+    def test_nothing_is_recorded_without_a_location(self, tmp_path):
+        assert handler({}, FakeContext()) == "Successfully ran"
+        assert list(tmp_path.iterdir()) == []
+
+    def test_run_has_volumes_duration_and_limits(self, history_dir):
+        assert handler({}, FakeContext()) == "Successfully ran"
+        [run] = load_runs(str(history_dir))
+        assert run["function"] == "extract"
+        assert run["tables"] == {"design": {"rows": 15, "bytes": 1500}, "staff": {"rows": 0, "bytes": 200}}
+        assert run["seconds"] >= 0 and run["peak_memory_mb"] > 0
+        assert run["memory_limit_mb"] == 512
+        assert run["timeout_seconds"] == 300
+
+    def test_later_invocations_are_warm_starts(self, history_dir, monkeypatch):
+        monkeypatch.setattr("src.common.run_history._invocations", 0)
+        for _ in range(2):
+            handler({}, FakeContext())
+        assert [run["warm_start"] for run in load_runs(str(history_dir))] == [False, True]
+
+    def test_worker_peak_memory_is_recorded(self, history_dir):
+        @recorded("transform")
+        def forking_handler(event, context):
+            worker = multiprocessing.get_context("fork").Process(target=bytearray, args=(50 * 2 ** 20,))
+            worker.start()
+            worker.join()
+
+        forking_handler({}, None)
+        [run] = load_runs(str(history_dir))
+        assert run["child_peak_memory_mb"] >= 50
+
+    def test_failing_runs_are_recorded(self, history_dir):
+        with pytest.raises(ValueError):
+            handler({"fail": True}, None)
+        [run] = load_runs(str(history_dir))
+        assert run["memory_limit_mb"] is None and run["timeout_seconds"] is None
+
+    def test_volumes_outside_a_run_are_ignored(self):
+        record_volume("design", 1, 1)
+
+    def test_unwritable_history_does_not_fail_the_handler(self, history_dir, monkeypatch, caplog):
+        def fail(run):
+            raise OSError("read-only file system")
+
+        monkeypatch.setattr("src.common.run_history.save_run", fail)
+        assert handler({}, None) == "Successfully ran"
+        assert "Could not record run of extract" in caplog.text
+
+
+class TestS3History:
+    @mock_aws
+    def test_runs_round_trip_through_s3(self, monkeypatch):
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-2")
+        client = boto3.client("s3", region_name="eu-west-2")
+        client.create_bucket(Bucket="history", CreateBucketConfiguration={"LocationConstraint": "eu-west-2"})
+        runs = [
+            {"function": "load", "started_at": "2024-03-02T10:00:00", "tables": {}},
+            {"function": "load", "started_at": "2024-03-01T10:00:00", "tables": {}},
+            {"function": "extract", "started_at": "2024-03-01T10:00:00", "tables": {}},
+        ]
+        for run in runs:
+            uri = save_run(run, "s3://history/_run_history")
+        assert uri.startswith("s3://history/_run_history/extract/2024/03/01/10_00_00-")
+        body = client.get_object(Bucket="history", Key=uri[len("s3://history/"):])["Body"].read()
+        assert json.loads(body) == runs[2]
+        assert [run["started_at"] for run in load_runs("s3://history/_run_history", "load")] == [
+            "2024-03-01T10:00:00", "2024-03-02T10:00:00"
+        ]
@@ -0,0 +1,87 @@
+import datetime
+from unittest.mock import patch, call
+from src.extract_lambda.lambda_handler import lambda_handler
+from src.extract_lambda.scheduler import (
+    load_schedule,
+    save_schedule,
+    is_due,
+    table_watermark,
+    reschedule,
+)
+from tests.test_lambda_handler import s3_client, ssm_client, aws_credentials  # noqa: F401
+
+NOW = datetime.datetime(2024, 1, 1, 12, 0)
+
+
+class TestReschedule:
+    def test_cold_table_backs_off_to_ceiling(self):
+        schedule = {}
+        assert reschedule(schedule, "currency", 0, NOW) == 1440
+        assert schedule["currency"]["next_run"] == "2024-01-02T12:00:00"
+        assert schedule["currency"]["watermark"] == NOW.isoformat()
+
+    def test_hot_table_polled_at_floor(self):
+        schedule = {}
+        assert reschedule(schedule, "sales_order", 600, NOW) == 5
+
+    def test_interval_tracks_change_rate(self):
+        schedule = {}
+        reschedule(schedule, "staff", 3, NOW)
+        # 3 rows over the 5 minute floor, then none over the 16 minutes to the next run
+        assert schedule["staff"]["interval"] == 16
+        reschedule(schedule, "staff", 0, NOW + datetime.timedelta(minutes=16))
+        assert schedule["staff"]["interval"] == 33
+
+
+class TestIsDue:
+    def test_unscheduled_table_is_due(self):
+        assert is_due({}, "currency", NOW)
+
+    def test_table_not_due_before_next_run(self):
+        schedule = {}
+        reschedule(schedule, "currency", 0, NOW)
+        assert not is_due(schedule, "currency", NOW + datetime.timedelta(minutes=30))
+        assert is_due(schedule, "currency", NOW + datetime.timedelta(minutes=1438))
+
+
+class TestTableWatermark:
+    def test_defaults_for_unscheduled_table(self):
+        assert table_watermark({}, "currency", None) is None
+
+    def test_returns_last_extract_time(self):
+        schedule = {}
+        reschedule(schedule, "currency", 0, NOW)
+        assert table_watermark(schedule, "currency", None) == NOW
+
+
+class TestScheduleState:
+    def test_round_trips_schedule(self, s3_client):  # noqa: F811
+        assert load_schedule(s3_client, "test-bucket") == {}
+        schedule = {}
+        reschedule(schedule, "currency", 0, NOW)
+        save_schedule(s3_client, "test-bucket", schedule)
+        assert load_schedule(s3_client, "test-bucket") == schedule
+
+
+class TestAdaptiveHandler:
+    @patch("src.extract_lambda.lambda_handler.dt")
+    @patch("src.extract_lambda.lambda_handler.adaptive_schedule_enabled", return_value=True)
+    @patch("src.extract_lambda.lambda_handler.probe_changes")
+    @patch("src.extract_lambda.lambda_handler.get_data")
+    def test_skips_tables_that_are_not_due(self, get_data_mock, probe_mock, enabled_mock, dt_mock,
+                                           s3_client, ssm_client):  # noqa: F811
+        ssm_client.put_parameter(Name="lambda_last_run", Value="None", Overwrite=True, Type="String")
+        dt_mock.strptime.side_effect = datetime.datetime.strptime
+        dt_mock.now.return_value = NOW
+        get_data_mock.side_effect = lambda table, since: [{"id": 1}] * 600 if table == "sales_order" else []
+        probe_mock.side_effect = lambda tables, since: {
+            table: (600, None) if table == "sales_order" else (0, None) for table in tables
+        }
+
+        lambda_handler({}, {})
+        assert get_data_mock.call_args_list == [call("sales_order", None)]
+        get_data_mock.reset_mock()
+
+        dt_mock.now.return_value = NOW + datetime.timedelta(minutes=30)
+        lambda_handler({}, {})
+        assert get_data_mock.call_args_list == [call("sales_order", NOW)]
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from src.common.run_history import save_run
+from src.common.sizing import fit_line, project_tables, size_function, main
+
+START = datetime(2024, 3, 1)
+
+
+def make_runs(days: int, design_growth: int, seconds_per_mb: float = 1.0) -> list[dict]:
+    """Daily load runs whose design bytes grow linearly and whose staff bytes stay flat"""
+    runs = []
+    for day in range(days):
+        design = 1_000_000 + design_growth * day
+        size = design + 500_000
+        runs.append({
+            "function": "load",
+            "started_at": (START + timedelta(days=day)).isoformat(),
+            "seconds": 2 + seconds_per_mb * size / 1_000_000,
+            "cpu_seconds": 1 + seconds_per_mb * size / 2_000_000,
+            "peak_memory_mb": 100 + 50 * size / 1_000_000,
+            "memory_limit_mb": 512,
+            "timeout_seconds": 60,
+            "tables": {
+                "dim_design": {"rows": 10, "bytes": design},
+                "dim_staff": {"rows": 5, "bytes": 500_000},
+            },
+        })
+    return runs
+
+
+class TestFitLine:
+    def test_exact_line(self):
+        assert fit_line([1, 2, 3], [5, 7, 9]) == (3.0, 2.0)
+
+    def test_single_point_goes_through_the_origin(self):
+        assert fit_line([2], [10]) == (0.0, 5.0)
+
+    def test_negative_slopes_are_clipped(self):
+        assert fit_line([1, 2, 3], [9, 7, 5])[1] == 0.0
+
+
+class TestProjectTables:
+    def test_growing_and_flat_tables(self):
+        projections = project_tables(make_runs(10, 100_000), START + timedelta(days=19))
+        assert round(projections["dim_design"]["bytes_per_day"]) == 100_000
+        assert round(projections["dim_design"]["projected_bytes"]) == 2_900_000
+        assert projections["dim_staff"]["bytes_per_day"] == 0
+        assert projections["dim_staff"]["projected_bytes"] == 500_000
+
+
+class TestSizeFunction:
+    def test_recommendation_covers_projected_volume(self):
+        recommendation = size_function(make_runs(10, 100_000), 10, START + timedelta(days=9))
+        # 3.4 MB projected, 270 MB peak with 1.5x headroom, rounded up to 64 MB
+        assert recommendation["projected_bytes"] == 3_400_000
+        assert recommendation["memory_mb"] == 448
+        assert recommendation["recorded_memory_mb"] == 512
+        assert 0 < recommendation["timeout_seconds"] <= 900
+        assert recommendation["flagged_tables"] == []
+
+    def test_small_runs_get_the_minimum_memory(self):
+        runs = make_runs(3, 0)
+        for run in runs:
+            run["peak_memory_mb"] = 40
+        assert size_function(runs, 30, START)["memory_mb"] == 128
+
+    def test_warm_start_peaks_are_not_fitted(self):
+        runs = make_runs(10, 100_000)
+        for run in runs[1::2]:
+            run["warm_start"] = True
+            run["peak_memory_mb"] = 5000
+        assert size_function(runs, 10, START + timedelta(days=9))["memory_mb"] == 448
+
+    def test_worker_peaks_are_added(self):
+        runs = make_runs(3, 0)
+        for run in runs:
+            run["peak_memory_mb"] = 40
+            run["child_peak_memory_mb"] = 200
+        recommendation = size_function(runs, 30, START)
+        assert recommendation["max_peak_memory_mb"] == 240
+        assert recommendation["memory_mb"] == 384
+
+    def test_fast_growing_table_is_flagged(self):
+        runs = make_runs(10, 20_000_000, seconds_per_mb=5)
+        recommendation = size_function(runs, 90, START + timedelta(days=9))
+        assert [flag["table"] for flag in recommendation["flagged_tables"]] == ["dim_design"]
+        assert recommendation["timeout_seconds"] == 900
+
+
+class TestMain:
+    def test_prints_recommendations(self, tmp_path, capsys):
+        for run in make_runs(5, 100_000):
+            save_run(run, str(tmp_path))
+        assert main([str(tmp_path), "--horizon-days", "30"]) == 0
+        assert capsys.readouterr().out.startswith("load: memory ")
+
+    def test_empty_history(self, tmp_path, capsys):
+        assert main([str(tmp_path)]) == 1
+        assert "No runs recorded" in capsys.readouterr().out
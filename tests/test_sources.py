@@ -0,0 +1,253 @@
+import io
+import re
+import copy
+import json
+import datetime
+import threading
+import contextvars
+import pytest
+from unittest.mock import patch, MagicMock
+import pandas as pd
+from moto import mock_aws
+from src.common.sources import source_partition, source_of, state_name
+from src.extract_lambda.source_config import EXTRACT_TABLES, SOURCE_KEY_SPAN, load_sources, namespace_ids
+from src.extract_lambda.connection import use_source, current_source, create_conn, close_db_connection
+from src.extract_lambda.lambda_handler import lambda_handler
+from src.extract_lambda.utils import load_last_run
+from src.common.reconciliation import load_ledger
+from src.common.manifest import load_manifest
+from src.load_lambda.compaction import period_of
+from src.transform_lambda.lambda_handler import lambda_handler as transform_handler
+from tests.test_lambda_handler import s3_client, ssm_client, aws_credentials  # noqa: F401
+from tests.test_transform_lambda_function import ssm_mock, bucket_name  # noqa: F401
+from tests.test_transform_lambda_function import s3_client as transform_s3_client  # noqa: F401
+from tests.test_spill import SALES
+
+NOW = datetime.datetime(2024, 3, 1, 12, 30)
+SOURCES = json.dumps([
+    {"name": "north", "host": "north.example.com", "tables": ["sales_order", "staff"]},
+    {"name": "south", "host": "south.example.com", "tables": ["sales_order", "payment", "currency"],
+     "key_offset": SOURCE_KEY_SPAN},
+])
+AMOUNTS = {"sales_order": {"units_sold": 10}, "payment": {"payment_amount": 2.5}}
+
+
+def source_rows(table, since):
+    """Stands in for get_data, returning three rows of each reconciled table"""
+    if table not in AMOUNTS:
+        return []
+    return [{f"{table}_id": i, "created_at": "2024-03-01T09:00:00.000", **AMOUNTS[table]} for i in range(3)]
+
+
+def source_connection():
+    """Stands in for a source database connection, serving source_rows to the real get_data"""
+    conn = MagicMock()
+    conn.run.side_effect = lambda query: [
+        [row] for row in source_rows(re.search(r"FROM (\w+)", query)[1], None)
+    ]
+    return conn
+
+
+class TestKeyLayout:
+    def test_named_sources_are_partitioned(self):
+        assert source_partition("north") == "source=north/"
+        assert source_of("sales_order/source=north/2024/03/01/12-30-sales_order.json") == "north"
+        assert source_of("fact_sales_order/transformed/source=north/2024/03/01/12_30-x.parquet") == "north"
+        assert period_of("fact_payment/transformed/source=north/2024/03/01/12_30-x.parquet") == "2024/03/01"
+
+    def test_unnamed_source_keeps_the_original_layout(self):
+        assert source_partition(None) == ""
+        assert source_of("sales_order/2024/03/01/12-30-sales_order.json") is None
+        assert state_name("extract_manifest", None) == "extract_manifest"
+        assert state_name("extract_manifest", "north") == "extract_manifest_north"
+
+
+class TestLoadSources:
+    def test_without_config_there_is_one_unnamed_source(self):
+        assert load_sources("") == [{"name": None, "tables": EXTRACT_TABLES}]
+
+    def test_sources_default_to_every_table(self):
+        assert load_sources('[{"name": "north", "host": "north.example.com"}]') == [
+            {"name": "north", "host": "north.example.com", "tables": EXTRACT_TABLES}
+        ]
+
+    def test_sources_keep_their_own_tables(self):
+        north, south = load_sources(SOURCES)
+        assert north["tables"] == ["sales_order", "staff"]
+        assert south["tables"] == ["sales_order", "payment", "currency"]
+        assert south["key_offset"] == SOURCE_KEY_SPAN
+
+    @pytest.mark.parametrize("config, message", [
+        ('[{"host": "x"}]', "Invalid extract source name"),
+        ('[{"name": "North"}]', "Invalid extract source name"),
+        ('[{"name": "north"}, {"name": "north"}]', "defined twice"),
+        ('[{"name": "north", "hots": "x"}]', "Unknown settings for extract source north: hots"),
+        ('[{"name": "north", "tables": ["orders"]}]', "Unknown tables for extract source north: orders"),
+        ("[]", "defines no sources"),
+        ('[{"name": "north"}, {"name": "south", "tables": ["currency"]}]',
+         "Extract sources north and south both extract currency, give them different key_offset"),
+        ('[{"name": "north", "key_offset": 5}]', "Invalid key_offset 5 for extract source north"),
+        ('[{"name": "north", "key_offset": -100000000}]', "Invalid key_offset"),
+        ('[{"name": "north", "key_offset": 2100000000}]', "Invalid key_offset"),
+        ('[{"name": "north", "key_offset": "100000000"}]', "Invalid key_offset"),
+    ])
+    def test_invalid_configs(self, config, message):
+        with pytest.raises(ValueError, match=message):
+            load_sources(config)
+
+
+class TestNamespaceIds:
+    def test_ids_are_moved_into_the_block_of_the_source(self):
+        rows = [
+            {"staff_id": 4, "department_id": 2, "first_name": "Ada"},
+            {"staff_id": 5, "department_id": None},
+        ]
+        assert namespace_ids(rows, "staff", {"name": "south", "key_offset": 2 * SOURCE_KEY_SPAN}) == [
+            {"staff_id": 200000004, "department_id": 200000002, "first_name": "Ada"},
+            {"staff_id": 200000005, "department_id": None},
+        ]
+
+    def test_sources_without_an_offset_keep_their_ids(self):
+        rows = [{"staff_id": 4, "department_id": 2}]
+        assert namespace_ids(rows, "staff", None) == [{"staff_id": 4, "department_id": 2}]
+        assert namespace_ids(rows, "staff", {"name": "north", "tables": []}) == [
+            {"staff_id": 4, "department_id": 2}
+        ]
+
+    def test_ids_outside_the_span_are_refused(self):
+        with pytest.raises(ValueError, match="staff.staff_id 100000000 of extract source south does not fit"):
+            namespace_ids(
+                [{"staff_id": SOURCE_KEY_SPAN}], "staff", {"name": "south", "key_offset": SOURCE_KEY_SPAN}
+            )
+
+
+@patch("src.extract_lambda.connection.pg8000.native.Connection")
+class TestConnectionPool:
+    def test_connections_are_reused_within_a_source(self, connection_mock, monkeypatch):
+        monkeypatch.setenv("USER", "user")
+        monkeypatch.setenv("PORT", "5432")
+        with use_source({"name": "north", "host": "north.example.com", "tables": []}):
+            for _ in range(3):
+                close_db_connection(create_conn())
+        connection_mock.assert_called_once_with(
+            user="user", password=None, database=None, host="north.example.com", port=5432
+        )
+        connection_mock.return_value.close.assert_called_once()
+
+    def test_pool_is_bounded(self, connection_mock, monkeypatch):
+        monkeypatch.setenv("PORT", "5432")
+        connection_mock.side_effect = lambda **settings: MagicMock()
+        monkeypatch.setattr("src.extract_lambda.connection.EXTRACT_POOL_SIZE", 1)
+        with use_source():
+            first = create_conn()
+            waiting = threading.Thread(
+                target=contextvars.copy_context().run, args=(lambda: close_db_connection(create_conn()),)
+            )
+            waiting.start()
+            waiting.join(0.2)
+            assert waiting.is_alive()
+            close_db_connection(first)
+            waiting.join(5)
+        assert connection_mock.call_count == 1
+
+    def test_each_thread_keeps_its_own_source(self, connection_mock):
+        seen = {}
+
+        def extract(name):
+            with use_source({"name": name, "tables": []}):
+                seen[name] = current_source()["name"]
+
+        threads = [threading.Thread(target=extract, args=(name,)) for name in ["north", "south"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert seen == {"north": "north", "south": "south"}
+        assert current_source() is None
+
+
+@patch("src.extract_lambda.lambda_handler.load_sources", return_value=load_sources(SOURCES))
+@patch("src.extract_lambda.lambda_handler.dt")
+@patch("src.extract_lambda.lambda_handler.probe_changes",
+       side_effect=lambda tables, since: {table: (3, None) for table in tables})
+class TestMultiSourceHandler:
+    def test_sources_are_extracted_into_their_partitions(self, probe_mock, dt_mock, sources_mock,
+                                                         s3_client, ssm_client):  # noqa: F811
+        dt_mock.now.return_value = NOW
+        dt_mock.strptime.side_effect = datetime.datetime.strptime
+        with patch("src.extract_lambda.utils.create_conn", side_effect=source_connection), \
+                patch("src.extract_lambda.utils.close_db_connection"):
+            assert lambda_handler({}, {}) == "Successfully ran"
+
+        keys = [item["Key"] for item in s3_client.list_objects_v2(Bucket="test-bucket")["Contents"]]
+        assert "sales_order/source=north/2024/03/01/12-30-sales_order.json" in keys
+        assert "sales_order/source=south/2024/03/01/12-30-sales_order.json" in keys
+        assert "payment/source=south/2024/03/01/12-30-payment.json" in keys
+        # Both sources extract sales_order 0 to 2, south's ids are moved past its key_offset
+        for source, ids in [("north", [0, 1, 2]), ("south", [100000000, 100000001, 100000002])]:
+            key = f"sales_order/source={source}/2024/03/01/12-30-sales_order.json"
+            body = s3_client.get_object(Bucket="test-bucket", Key=key)
+            assert [row["sales_order_id"] for row in json.loads(body["Body"].read())] == ids
+        assert load_manifest(s3_client, "test-bucket", "extract_manifest_north")["sales_order"]
+        assert load_manifest(s3_client, "test-bucket", "extract_manifest_south")["payment"]
+        assert load_last_run(s3_client, "test-bucket", "north") == "2024_03_01-12_30"
+        assert load_last_run(s3_client, "test-bucket", "south") == "2024_03_01-12_30"
+        assert ssm_client.get_parameter(Name="lambda_last_run")["Parameter"]["Value"] == "2020_11_11-10_10"
+        ledger = load_ledger(s3_client, "test-bucket", "source")
+        assert ledger["fact_sales_order"]["2024-03-01"][:2] == [6, 60.0]
+        assert ledger["fact_payment"]["2024-03-01"][:2] == [3, 7.5]
+        # Each source only probes its own tables
+        assert sorted(call.args[0] for call in probe_mock.call_args_list) == [
+            ["sales_order", "payment", "currency"], ["sales_order", "staff"]
+        ]
+
+    def test_failed_source_does_not_stop_the_others(self, probe_mock, dt_mock, sources_mock,
+                                                    s3_client, ssm_client):  # noqa: F811
+        dt_mock.now.return_value = NOW
+        dt_mock.strptime.side_effect = datetime.datetime.strptime
+
+        def failing_south(table, since):
+            if current_source()["name"] == "south":
+                raise ValueError("south is unreachable")
+            return source_rows(table, since)
+
+        with patch("src.extract_lambda.lambda_handler.get_data", side_effect=failing_south):
+            assert lambda_handler({}, {}) == "Unexpected Error: south is unreachable"
+        assert load_last_run(s3_client, "test-bucket", "north") == "2024_03_01-12_30"
+        assert load_last_run(s3_client, "test-bucket", "south") == "None"
+        ledger = load_ledger(s3_client, "test-bucket", "source")
+        assert ledger["fact_sales_order"]["2024-03-01"][:2] == [3, 30.0]
+        assert "fact_payment" not in ledger
+
+
+@mock_aws
+class TestPartitionedTransform:
+    def test_outputs_keep_the_source_partition(self, transform_s3_client, ssm_mock):  # noqa: F811
+        key = "sales_order/source=north/2024/11/20/12-10-sales_order.json"
+        transform_s3_client.put_object(Bucket=bucket_name, Key=key, Body=json.dumps(SALES))
+        response = transform_handler({"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                                          "object": {"key": key}}}]}, {})
+        assert response == "Successfully ran"
+        for table in ["fact_sales_order", "dim_date"]:
+            objects = transform_s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix=f"{table}/")
+            assert [item["Key"].split("/")[2] for item in objects["Contents"]] == ["source=north"]
+
+    def test_sources_sharing_a_table_keep_their_rows_apart(self, transform_s3_client, ssm_mock):  # noqa: F811
+        south = {"name": "south", "key_offset": SOURCE_KEY_SPAN}
+        records = []
+        south_rows = namespace_ids(copy.deepcopy(SALES), "sales_order", south)
+        for source, rows in [("north", SALES), ("south", south_rows)]:
+            key = f"sales_order/source={source}/2024/11/20/12-10-sales_order.json"
+            transform_s3_client.put_object(Bucket=bucket_name, Key=key, Body=json.dumps(rows))
+            records.append({"s3": {"bucket": {"name": bucket_name}, "object": {"key": key}}})
+        assert transform_handler({"Records": records}, {}) == "Successfully ran"
+
+        ids = {}
+        for item in transform_s3_client.list_objects_v2(
+            Bucket="processed_bucket_name", Prefix="fact_sales_order/"
+        )["Contents"]:
+            body = transform_s3_client.get_object(Bucket="processed_bucket_name", Key=item["Key"])["Body"]
+            frame = pd.read_parquet(io.BytesIO(body.read()))
+            ids[item["Key"].split("/")[2]] = set(frame["sales_order_id"])
+            assert set(frame["sales_staff_id"]) == ({19} if "north" in item["Key"] else {100000019})
+        assert ids == {"source=north": set(range(1, 8)), "source=south": set(range(100000001, 100000008))}
@@ -0,0 +1,135 @@
+import io
+import json
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from unittest.mock import patch
+from moto import mock_aws
+from src.transform_lambda.transform_helpers import transform_data
+from src.transform_lambda.spill import should_spill, iter_row_chunks, transform_with_spill
+from src.common.fact_files import write_fact_table
+from src.transform_lambda.lambda_handler import lambda_handler
+from tests.test_transform_lambda_function import (  # noqa: F401
+    aws_credentials,
+    ssm_mock,
+    s3_client,
+    bucket_name,
+)
+
+SALES = [
+    {"sales_order_id": i, "created_at": f"2022-11-0{i % 5 + 1}T14:20:52.186",
+     "last_updated": f"2022-11-0{i % 5 + 1}T14:20:52.186", "design_id": 3, "staff_id": 19,
+     "counterparty_id": 8, "units_sold": 10 * i, "unit_price": 3.94, "currency_id": 2,
+     "agreed_delivery_date": "2022-11-07", "agreed_payment_date": "2022-11-08",
+     "agreed_delivery_location_id": 8}
+    for i in range(1, 8)
+]
+
+PAYMENTS = [
+    {"payment_id": i, "created_at": "2022-11-03T14:20:52.186", "last_updated": "2022-11-03T15:20:52.186",
+     "transaction_id": i, "counterparty_id": 1, "payment_amount": 42.5, "currency_id": 2,
+     "payment_type_id": 1, "paid": True, "payment_date": "2022-11-07",
+     "company_ac_number": 1, "counterparty_ac_number": 8}
+    for i in range(1, 6)
+]
+
+
+def read_parquet(path):
+    return pq.read_table(path).to_pandas()
+
+
+class TestShouldSpill:
+    def test_only_chunkable_tables_spill(self):
+        assert should_spill("sales_order", 10 ** 9)
+        assert not should_spill("staff", 10 ** 9)
+
+    def test_small_files_are_transformed_in_memory(self):
+        assert not should_spill("sales_order", 1024)
+
+
+class TestIterRowChunks:
+    def test_json_chunks_keep_row_positions(self):
+        chunks = list(iter_row_chunks(json.dumps(SALES).encode(), "sales_order/a.json", 3))
+        assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+        assert list(chunks[1].index) == [3, 4, 5]
+
+    def test_parquet_chunks_keep_row_positions(self):
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_pylist(SALES), buffer)
+        chunks = list(iter_row_chunks(buffer.getvalue(), "sales_order/a.parquet", 3))
+        assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+        assert list(chunks[2].index) == [6]
+
+
+class TestTransformWithSpill:
+    def test_sales_order_matches_in_memory_transform(self, tmp_path):
+        paths = transform_with_spill(json.dumps(SALES).encode(), "sales_order/a.json", "sales_order",
+                                     chunk_rows=2, spill_dir=str(tmp_path))
+        fact, dim_date = transform_data(SALES, "sales_order")
+        # Both are sorted by created_date, in one pass in memory and by merging the spilled chunks
+        expected = io.BytesIO()
+        write_fact_table(pa.Table.from_pandas(fact, preserve_index=False), expected)
+        expected.seek(0)
+        pd.testing.assert_frame_equal(read_parquet(paths["fact_sales_order"]), read_parquet(expected))
+        spilled_dates = read_parquet(paths["dim_date"]).sort_values("date_id").reset_index(drop=True)
+        expected_dates = dim_date.sort_values("date_id").reset_index(drop=True)
+        assert list(spilled_dates["date_id"]) == list(expected_dates["date_id"])
+        assert not list(tmp_path.glob("*.arrow"))
+
+    def test_fact_row_groups_are_sorted_by_created_date(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("src.transform_lambda.spill.FACT_ROW_GROUP_ROWS", 4)
+        sales = [{**row, "sales_order_id": row["sales_order_id"] + 10 * n} for n in range(5) for row in SALES]
+        paths = transform_with_spill(json.dumps(sales).encode(), "sales_order/a.json", "sales_order",
+                                     chunk_rows=3, spill_dir=str(tmp_path))
+        parquet_file = pq.ParquetFile(paths["fact_sales_order"])
+        metadata = parquet_file.metadata
+        column = parquet_file.schema_arrow.get_field_index("created_date")
+        statistics = [metadata.row_group(i).column(column).statistics for i in range(metadata.num_row_groups)]
+        assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [4] * 8 + [3]
+        for previous, current in zip(statistics, statistics[1:]):
+            assert previous.min <= previous.max <= current.min <= current.max
+        assert metadata.row_group(0).sorting_columns[0].column_index == column
+        created = read_parquet(paths["fact_sales_order"])["created_date"]
+        assert list(created) == sorted(created)
+        assert sorted(read_parquet(paths["fact_sales_order"])["sales_order_id"]) == sorted(
+            row["sales_order_id"] for row in sales
+        )
+
+    def test_payment_matches_in_memory_transform(self, tmp_path):
+        paths = transform_with_spill(json.dumps(PAYMENTS).encode(), "payment/a.json", "payment",
+                                     chunk_rows=2, spill_dir=str(tmp_path))
+        expected = transform_data(PAYMENTS, "payment")
+        assert list(read_parquet(paths["fact_payment"])["payment_record_id"]) == [1, 2, 3, 4, 5]
+        assert len(read_parquet(paths["fact_payment"])) == len(expected)
+
+    def test_dates_of_one_day_are_kept_once(self, tmp_path):
+        def chunk_dates(chunk, table_name):
+            # Each chunk stamps the same day at a different time
+            times = [pd.Timestamp(2022, 11, 3, chunk.index[0]), pd.Timestamp(2022, 11, 4)]
+            return transform_data(chunk, table_name)[0], pd.DataFrame({"date_id": times, "year": 2022})
+
+        with patch("src.transform_lambda.spill.transform_data", side_effect=chunk_dates):
+            paths = transform_with_spill(json.dumps(SALES).encode(), "sales_order/a.json", "sales_order",
+                                         chunk_rows=2, spill_dir=str(tmp_path))
+        dates = read_parquet(paths["dim_date"])["date_id"]
+        assert list(dates.dt.normalize()) == [pd.Timestamp(2022, 11, 3), pd.Timestamp(2022, 11, 4)]
+
+    def test_empty_input_has_no_outputs(self, tmp_path):
+        assert transform_with_spill(b"[]", "payment/a.json", "payment", spill_dir=str(tmp_path)) == {}
+
+
+@mock_aws
+class TestHandlerSpill:
+    @patch("src.transform_lambda.lambda_handler.should_spill", return_value=True)
+    def test_oversized_sales_file_is_spilled(self, spill_mock, s3_client, ssm_mock, caplog):  # noqa: F811
+        caplog.set_level(logging.INFO)
+        key = "sales_order/24/11/20/12-10-sales_order.json"
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=json.dumps(SALES))
+        response = lambda_handler({"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                                       "object": {"key": key}}}]}, {})
+        assert response == "Successfully ran"
+        assert "Transformed sales_order in 1 chunks" in caplog.text
+        for table in ["fact_sales_order", "dim_date"]:
+            objects = s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix=f"{table}/")
+            assert objects["KeyCount"] == 1
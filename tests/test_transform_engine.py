@@ -0,0 +1,72 @@
+import pytest
+import pandas as pd
+from unittest.mock import patch
+from src.transform_lambda.transform_engine import TRANSFORM_SPECS, apply_spec, unique_days
+
+ORDERS = pd.DataFrame([
+    {"id": 1, "created_at": "2022-11-03T14:20:52.186", "price": 1.5, "name": None, "dept": 1},
+    {"id": 2, "created_at": "2022-11-04T09:00:00.000", "price": 2.5, "name": "b", "dept": 2},
+])
+
+
+@pytest.fixture
+def spec():
+    TRANSFORM_SPECS["test_table"] = {
+        "lookups": {"dept": ("department", "department_id")},
+        "columns": {
+            "record_id": ("row_number",),
+            "order_id": ("column", "id"),
+            "created_date": ("date", "created_at"),
+            "created_time": ("time", "created_at"),
+            "price": ("float", "price"),
+            "name": ("fill", "name", "None"),
+            "source": ("constant", "totesys"),
+            "dept_name": ("lookup", "dept", "dept", "department_name"),
+        },
+    }
+    yield
+    del TRANSFORM_SPECS["test_table"]
+
+
+class TestApplySpec:
+    def test_new_table_is_configuration_only(self, spec):
+        departments = pd.DataFrame([{"department_id": 1, "department_name": "Old"},
+                                    {"department_id": 2, "department_name": "Sales"},
+                                    {"department_id": 1, "department_name": "Finance"}])
+        df = apply_spec("test_table", ORDERS, lambda table: departments)
+        assert list(df.columns) == ["record_id", "order_id", "created_date", "created_time",
+                                    "price", "name", "source", "dept_name"]
+        assert list(df["record_id"]) == [1, 2]
+        assert str(df.iloc[0]["created_date"]) == "2022-11-03"
+        assert str(df.iloc[1]["created_time"]) == "09:00:00"
+        assert df.iloc[0]["name"] == "None"
+        assert list(df["source"]) == ["totesys", "totesys"]
+        assert list(df["dept_name"]) == ["Finance", "Sales"]
+
+    def test_timestamp_columns_are_parsed_once(self, spec):
+        with patch("src.transform_lambda.transform_engine.pd.to_datetime", wraps=pd.to_datetime) as parse:
+            apply_spec("test_table", ORDERS, lambda table: pd.DataFrame(
+                [{"department_id": 1, "department_name": "Sales"}]))
+        assert parse.call_count == 1
+
+    def test_row_numbers_follow_source_index(self, spec):
+        chunk = ORDERS.set_index(pd.RangeIndex(10, 12))
+        df = apply_spec("test_table", chunk, lambda table: pd.DataFrame(
+            [{"department_id": 1, "department_name": "Sales"}]))
+        assert list(df["record_id"]) == [11, 12]
+
+    def test_unknown_expression_raises(self):
+        TRANSFORM_SPECS["bad_table"] = {"columns": {"x": ("explode", "id")}}
+        try:
+            with pytest.raises(ValueError, match="Unknown transform expression"):
+                apply_spec("bad_table", ORDERS)
+        finally:
+            del TRANSFORM_SPECS["bad_table"]
+
+
+class TestUniqueDays:
+    def test_one_row_per_calendar_day(self):
+        frame = pd.DataFrame({"a": ["2022-11-03T14:20:52.186", "2022-11-03T15:00:00"],
+                              "b": ["2022-11-04", "2022-11-03"]})
+        days = unique_days(frame, ["a", "b"])
+        assert [str(day.date()) for day in days["date_id"]] == ["2022-11-03", "2022-11-04"]
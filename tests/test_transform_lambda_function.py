@@ -2,8 +2,19 @@ import pytest
 import json
 from moto import mock_aws
 import boto3
-from src.transform_lambda.lambda_handler import lambda_handler
+from src.transform_lambda.lambda_handler import lambda_handler, replay_dead_letters, transformed_key
+from src.transform_lambda.dead_letter import load_dead_letters
+from src.common.manifest import load_manifest
+from src.common.date_set import load_date_set, save_date_set, to_days
+from src.common.reconciliation import load_ledger
+import io
 import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime
+from decimal import Decimal
 from botocore.exceptions import ClientError
 from unittest.mock import patch
 
@@ -124,6 +135,16 @@ class TestLambdaHandler:
         assert response == "Successfully ran"
         assert "Successfully processed staff data to Parquet." in caplog.text
 
+    def test_table_without_output_is_skipped(self, s3_client, s3_setup, ssm_mock, caplog):
+        """Test a lookup table is skipped and recorded as transformed rather than dead-lettered."""
+        department = "department/24/11/20/12-10-department.json"
+        event = {"Records": [{"s3": {"bucket": {"name": bucket_name}, "object": {"key": department}}}]}
+        assert lambda_handler(event, {}) == "Successfully ran"
+        assert f"No warehouse output for department, skipping {department}" in caplog.text
+        assert load_dead_letters(s3_client, bucket_name) == {}
+        manifest = load_manifest(s3_client, "processed_bucket_name", "transform_manifest")
+        assert len(manifest["department"]) == 1
+
     def test_records_not_in_event(self):
         """Test lamda_handler with records not in event"""
         event = {}
@@ -131,7 +152,7 @@ class TestLambdaHandler:
         with pytest.raises(ValueError, match="Invalid event structure:"):
             lambda_handler(event, context)
 
-    def test_lambda_handler_empty_file(self, s3_client, mock_s3_client_error):
+    def test_lambda_handler_empty_file(self, s3_client, ssm_mock, mock_s3_client_error):
         """Test lambda_handler with an empty S3 file."""
 
         s3_client.put_object(Bucket=bucket_name, Key=key, Body="")
@@ -139,18 +160,64 @@ class TestLambdaHandler:
         event = {"Records": [{"s3": {"bucket": {"name": bucket_name}, "object": {"key": key}}}]}
 
         context = {}
-        with pytest.raises(ClientError, match="The specified key does not exist."):
-            lambda_handler(event, context)
+        assert lambda_handler(event, context) == "Successfully ran"
+        letters = load_dead_letters(s3_client, bucket_name)
+        assert [letter["error_type"] for letter in letters.values()] == ["ClientError"]
 
-    def test_lambda_handler_nonexistent_key(self, mock_s3_client_error):
+    def test_lambda_handler_nonexistent_key(self, s3_client, ssm_mock, mock_s3_client_error):
         """Test lambda_handler with nonexistent S3 object."""
         non_existent_key = "nonexistent/key.json"
 
         event = {"Records": [{"s3": {"bucket": {"name": bucket_name}, "object": {"key": non_existent_key}}}]}
 
         context = {}
-        with pytest.raises(ClientError, match="The specified key does not exist."):
-            lambda_handler(event, context)
+        assert lambda_handler(event, context) == "Successfully ran"
+        letters = load_dead_letters(s3_client, bucket_name, "nonexistent")
+        letter = list(letters.values())[0]
+        assert letter["record"]["s3"]["object"]["key"] == non_existent_key
+        assert "The specified key does not exist." in letter["error"]
+        assert letter["attempts"] == 1
+
+    def test_lambda_handler_raises_when_dead_letter_cannot_be_written(self, mock_s3_client_error):
+        """Test lambda_handler fails the invocation if a failed record cannot be dead-lettered."""
+        event = {"Records": [{"s3": {"bucket": {"name": "missing-bucket"}, "object": {"key": key}}}]}
+        with pytest.raises(ClientError):
+            lambda_handler(event, {})
+
+    def test_lambda_handler_isolates_failing_records(self, s3_client, s3_setup, ssm_mock, caplog):
+        """Test a failing record is dead-lettered while the rest of the batch is transformed."""
+        s3_client.put_object(Bucket=bucket_name, Key="staff/broken.json", Body=b"not json")
+        event = {
+            "Records": [
+                {"s3": {"bucket": {"name": bucket_name}, "object": {"key": "staff/broken.json"}}},
+                {"s3": {"bucket": {"name": bucket_name}, "object": {"key": key}}},
+            ]
+        }
+        assert lambda_handler(event, {}) == "Successfully ran"
+        assert "Successfully processed staff data to Parquet." in caplog.text
+        letters = load_dead_letters(s3_client, bucket_name)
+        assert [letter["record"]["s3"]["object"]["key"] for letter in letters.values()] == ["staff/broken.json"]
+
+    def test_replay_dead_letters_redrives_fixed_records(self, s3_client, s3_setup, ssm_mock, caplog):
+        """Test replay removes dead letters whose records now transform and keeps the rest."""
+        s3_client.put_object(Bucket=bucket_name, Key="staff/broken.json", Body=b"not json")
+        s3_client.put_object(Bucket=bucket_name, Key="staff/late.json", Body=b"not json yet")
+        event = {"Records": [
+            {"s3": {"bucket": {"name": bucket_name}, "object": {"key": "staff/broken.json"}}},
+            {"s3": {"bucket": {"name": bucket_name}, "object": {"key": "staff/late.json"}}},
+        ]}
+        lambda_handler(event, {})
+        s3_client.copy_object(Bucket=bucket_name, Key="staff/late.json",
+                              CopySource={"Bucket": bucket_name, "Key": key})
+
+        assert replay_dead_letters({"table": "staff"}, {}) == "Replayed 1 of 2 dead letters"
+        letters = list(load_dead_letters(s3_client, bucket_name).values())
+        assert [letter["record"]["s3"]["object"]["key"] for letter in letters] == ["staff/broken.json"]
+        assert letters[0]["attempts"] == 2
+        assert "Successfully processed staff data to Parquet." in caplog.text
+
+    def test_replay_with_no_dead_letters(self, s3_client, ssm_mock):
+        assert replay_dead_letters({}, {}) == "No dead letters to replay"
 
     def test_lambda_handler_multiple_records(self, s3_setup, ssm_mock, caplog):
         """Test lambda_handler with multiple records in the event."""
@@ -186,6 +253,113 @@ class TestLambdaHandler:
         assert response == "Successfully ran"
         assert "Successfully processed address data to Parquet." in caplog.text
 
+    def test_lambda_handler_skips_already_transformed_data(self, s3_client, s3_setup, ssm_mock, caplog):
+        """Test identical data under a new key is not transformed again"""
+        s3_client.copy_object(Bucket=bucket_name, Key="staff/raw_data_copy.json",
+                              CopySource={"Bucket": bucket_name, "Key": key})
+        lambda_handler({"Records": [{"s3": {"bucket": {"name": bucket_name}, "object": {"key": key}}}]}, {})
+        event = {"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                     "object": {"key": "staff/raw_data_copy.json"}}}]}
+        response = lambda_handler(event, {})
+        assert response == "Successfully ran"
+        assert "identical staff data was already transformed" in caplog.text
+        objects = s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix="dim_staff/")
+        assert objects["KeyCount"] == 1
+
+    def test_lambda_handler_only_saves_changed_dimension_rows(self, s3_client, s3_setup, ssm_mock, caplog):
+        """Test a dimension file with no new or changed rows is not saved"""
+        address_key = "address/24/11/20/12-10-address.json"
+        lambda_handler({"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                            "object": {"key": address_key}}}]}, {})
+        address = json.loads(s3_client.get_object(Bucket=bucket_name, Key=address_key)["Body"].read())
+        address[0]["last_updated"] = "2022-11-04T14:20:49.962"
+        s3_client.put_object(Bucket=bucket_name, Key="address/24/11/21/12-10-address.json",
+                             Body=json.dumps(address))
+        lambda_handler({"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                            "object": {"key": "address/24/11/21/12-10-address.json"}}}]}, {})
+        assert "No new or changed address rows to save." in caplog.text
+        objects = s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix="dim_location/")
+        assert objects["KeyCount"] == 1
+
+    def test_lambda_handler_skips_internal_keys(self, ssm_mock, s3_setup, caplog):
+        """Test pipeline state objects do not trigger a transform"""
+        event = {"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                     "object": {"key": "_state/extract_manifest.json"}}}]}
+        assert lambda_handler(event, {}) == "Successfully ran"
+        assert "Skipping pipeline state object" in caplog.text
+
+    def test_transformed_keys_follow_the_ingested_key(self):
+        ingested = "sales_order/source=north/2024/11/20/12-10-sales_order.json"
+        assert transformed_key("fact_sales_order", ingested) == (
+            "fact_sales_order/transformed/source=north/2024/11/20/12_10-fact_sales_order.parquet"
+        )
+        # Other keys are named by their hash, which is just as stable
+        other = transformed_key("dim_staff", "staff/raw_data.json")
+        assert other == transformed_key("dim_staff", "staff/raw_data.json")
+        assert other != transformed_key("dim_staff", "staff/other.json")
+
+    def test_replayed_record_replaces_its_partial_outputs(self, s3_client, s3_setup, ssm_mock):
+        """Test a record that fails after saving its facts is counted and saved once when it is replayed"""
+        sales_key = "sales_order/24/11/20/12-10-sales_order.json"
+        event = {"Records": [{"s3": {"bucket": {"name": bucket_name}, "object": {"key": sales_key}}}]}
+        failing_dates = ValueError("dates failed")
+        with patch("src.transform_lambda.lambda_handler.save_new_dates", side_effect=failing_dates):
+            assert lambda_handler(event, {}) == "Successfully ran"
+        assert len(load_dead_letters(s3_client, bucket_name)) == 1
+        assert load_ledger(s3_client, "processed_bucket_name", "processed") == {}
+
+        assert replay_dead_letters({}, {}) == "Replayed 1 of 1 dead letters"
+        facts = s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix="fact_sales_order/")
+        assert [item["Key"] for item in facts["Contents"]] == [
+            "fact_sales_order/transformed/24/11/20/12_10-fact_sales_order.parquet"
+        ]
+        sales = json.loads(s3_client.get_object(Bucket=bucket_name, Key=sales_key)["Body"].read())
+        ledger = load_ledger(s3_client, "processed_bucket_name", "processed")
+        assert sum(day[0] for day in ledger["fact_sales_order"].values()) == len(sales)
+
+    def test_lambda_handler_only_emits_new_dates(self, s3_client, s3_setup, ssm_mock, caplog):
+        """Test a sales batch whose dates the warehouse already holds saves no dim_date file"""
+        sales_key = "sales_order/24/11/20/12-10-sales_order.json"
+        lambda_handler({"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                            "object": {"key": sales_key}}}]}, {})
+        # The transform leaves the date set to the loader
+        assert load_date_set(s3_client, "processed_bucket_name") is None
+        dim_date_files = s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix="dim_date/")
+        dim_date = pd.read_parquet(io.BytesIO(s3_client.get_object(
+            Bucket="processed_bucket_name", Key=dim_date_files["Contents"][0]["Key"])["Body"].read()))
+        save_date_set(s3_client, "processed_bucket_name", np.unique(to_days(dim_date["date_id"])))
+        sales = json.loads(s3_client.get_object(Bucket=bucket_name, Key=sales_key)["Body"].read())
+        sales[0]["units_sold"] = 1
+        s3_client.put_object(Bucket=bucket_name, Key="sales_order/24/11/21/12-10-sales_order.json",
+                             Body=json.dumps(sales))
+        lambda_handler({"Records": [{"s3": {"bucket": {"name": bucket_name}, "object": {
+            "key": "sales_order/24/11/21/12-10-sales_order.json"}}}]}, {})
+        assert "No new dim_date rows to save." in caplog.text
+        objects = s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix="dim_date/")
+        assert objects["KeyCount"] == 1
+
+    def test_lambda_handler_reads_typed_parquet_extracts(self, s3_client, s3_setup, ssm_mock, caplog):
+        """Test sales data ingested as typed parquet is transformed like json data"""
+        sales = pa.Table.from_pylist([{
+            "sales_order_id": 2, "created_at": datetime(2022, 11, 3, 14, 20, 52, 186000),
+            "last_updated": datetime(2022, 11, 3, 14, 20, 52, 186000), "design_id": 3, "staff_id": 19,
+            "counterparty_id": 8, "units_sold": 42972, "unit_price": Decimal("3.94"), "currency_id": 2,
+            "agreed_delivery_date": "2022-11-07", "agreed_payment_date": "2022-11-08",
+            "agreed_delivery_location_id": 8}])
+        buffer = io.BytesIO()
+        pq.write_table(sales, buffer)
+        sales_key = "sales_order/24/11/20/12-10-sales_order.parquet"
+        s3_client.put_object(Bucket=bucket_name, Key=sales_key, Body=buffer.getvalue())
+        response = lambda_handler({"Records": [{"s3": {"bucket": {"name": bucket_name},
+                                                       "object": {"key": sales_key}}}]}, {})
+        assert response == "Successfully ran"
+        assert "Successfully processed fact_sales_order data to Parquet." in caplog.text
+        saved = s3_client.list_objects_v2(Bucket="processed_bucket_name", Prefix="fact_sales_order/")
+        fact = pq.read_table(io.BytesIO(s3_client.get_object(
+            Bucket="processed_bucket_name", Key=saved["Contents"][0]["Key"])["Body"].read())).to_pylist()
+        assert fact[0]["unit_price"] == 3.94
+        assert str(fact[0]["created_date"]) == "2022-11-03"
+
     def test_lambda_handler_payment_data_to_fact_payment(self, s3_setup, ssm_mock, caplog):
         """Test lambda handler for payment data"""
         event = {"Records": [{"s3": {"bucket": {"name": bucket_name}, "object": {
@@ -13,10 +13,13 @@ from src.transform_lambda.transform_helpers import (
     transform_dim_transaction,
     transform_dim_payment_type,
     transform_fact_payment,
-    transform_fact_purchase_order)
+    transform_fact_purchase_order,
+    raw_frame)
 from moto import mock_aws
 import boto3
+import pyarrow as pa
 import pyarrow.parquet as pq
+from unittest.mock import patch
 import io
 import os
 import datetime
@@ -234,6 +237,7 @@ class TestTransformHelpers:
         assert isinstance(df, pd.DataFrame)
         assert "sales_order_id" in df.columns
         assert df.iloc[0]["created_date"] == datetime.date(2022, 11, 3)
+        assert df.iloc[0]["currency_id"] == 2
 
     def test_transform_dim_currency(self, currency_data):
         """Test transform currency data to dim_currency format"""
@@ -392,3 +396,27 @@ class TestTransformHelpers:
         assert isinstance(df, pd.DataFrame)
         assert "purchase_order_id" in df.columns
         assert df.iloc[0]["staff_id"] == 1
+
+    def test_transform_data_sales_order_builds_raw_frame_once(self, s3_client, sales_order_data):
+        """Test the fact and dim_date outputs share one raw frame"""
+        with patch("src.transform_lambda.transform_helpers.raw_frame", wraps=raw_frame) as raw_frame_mock:
+            fact, dim_date = transform_data(sales_order_data, "sales_order")
+        raw_frame_mock.assert_called_once()
+        assert len(fact) == len(sales_order_data)
+
+    def test_transform_data_accepts_arrow_table(self, s3_client, sales_order_data):
+        """Test a typed Arrow payload gives the same output as json rows"""
+        fact, dim_date = transform_data(pa.Table.from_pylist(sales_order_data), "sales_order")
+        expected_fact, expected_dim_date = transform_data(sales_order_data, "sales_order")
+        pd.testing.assert_frame_equal(fact, expected_fact)
+        pd.testing.assert_frame_equal(dim_date, expected_dim_date)
+
+
+class TestRawFrame:
+    def test_frame_is_passed_through(self):
+        df = pd.DataFrame([{"id": 1}])
+        assert raw_frame(df) is df
+
+    def test_rows_and_arrow_tables_are_converted(self):
+        rows = [{"id": 1, "name": "a"}]
+        pd.testing.assert_frame_equal(raw_frame(rows), raw_frame(pa.Table.from_pylist(rows)))
@@ -1,10 +1,21 @@
 import pytest
-from src.extract_lambda.utils import get_data, put_object, get_parameter, put_parameter
+from src.extract_lambda.utils import (
+    get_data,
+    probe_changes,
+    put_object,
+    get_parameter,
+    put_parameter,
+    remove_unchanged_rows,
+)
 from src.extract_lambda.connection import create_conn, close_db_connection
 import datetime
 from moto import mock_aws
 import boto3
+import io
 import os
+import pyarrow.parquet as pq
+from decimal import Decimal
+from unittest.mock import patch
 
 
 @pytest.fixture()
@@ -14,6 +25,30 @@ def db():
     close_db_connection(db)
 
 
+@pytest.fixture()
+def seeded_db(monkeypatch):
+    """Points the extract connection at the local test database and seeds its currency and staff tables"""
+    for setting in ["USER", "PASSWORD", "DATABASE", "HOST", "PORT"]:
+        monkeypatch.setenv(setting, os.getenv(f"TEST_{setting}"))
+    db = create_conn()
+    db.run("DROP TABLE IF EXISTS currency, staff")
+    db.run("CREATE TABLE currency (currency_id INT PRIMARY KEY, currency_code TEXT, "
+           "created_at TIMESTAMP, last_updated TIMESTAMP)")
+    db.run("CREATE TABLE staff (staff_id INT PRIMARY KEY, first_name TEXT, last_name TEXT, "
+           "department_id INT, email_address TEXT, created_at TIMESTAMP, last_updated TIMESTAMP)")
+    # Inserted out of key order, so the tests see get_data sort them
+    for currency_id, code, updated in [(3, "EUR", "2023-03-01"), (1, "GBP", "2022-01-01"),
+                                       (2, "USD", "2022-11-01")]:
+        db.run("INSERT INTO currency VALUES (:id, :code, '2022-01-01', :updated)",
+               id=currency_id, code=code, updated=updated)
+    for staff_id, updated in [(2, "2022-11-03 10:00"), (1, "2022-06-01 09:00")]:
+        db.run("INSERT INTO staff VALUES (:id, 'Jeremie', 'Franey', 2, 'jeremie.franey@terrifictotes.com', "
+               "'2022-01-01', :updated)", id=staff_id, updated=updated)
+    yield db
+    db.run("DROP TABLE IF EXISTS currency, staff")
+    close_db_connection(db)
+
+
 @pytest.fixture(scope="function")
 def aws_credentials():
     """Mocked AWS Credentials for moto."""
@@ -67,6 +102,77 @@ class TestGetData:
         assert len(result_1) > len(result_2)
 
 
+class TestProbeChanges:
+    def test_probe_counts_match_get_data(self, db):
+        since = datetime.datetime(2022, 10, 1)
+        result = probe_changes(["currency", "staff"], {"currency": since, "staff": None})
+        assert result["currency"][0] == len(get_data("currency", since))
+        assert result["staff"][0] == len(get_data("staff", None))
+
+    @patch("src.extract_lambda.utils.close_db_connection")
+    @patch("src.extract_lambda.utils.create_conn")
+    def test_probe_issues_one_query(self, conn_mock, close_mock):
+        conn_mock.return_value.run.return_value = [["currency", 0, None], ["staff", 2, None]]
+        since = datetime.datetime(2022, 10, 1)
+        result = probe_changes(["currency", "staff"], {"currency": since, "staff": None})
+        assert result == {"currency": (0, None), "staff": (2, None)}
+        conn_mock.return_value.run.assert_called_once()
+        query = conn_mock.return_value.run.call_args.args[0]
+        assert query.count("UNION ALL") == 1
+        assert f"FROM currency WHERE last_updated > '{since}'" in query
+
+    def test_probe_with_no_tables_skips_query(self):
+        assert probe_changes([], {}) == {}
+
+    def test_probe_counts_seeded_changes(self, seeded_db):
+        since = datetime.datetime(2022, 10, 1)
+        result = probe_changes(["currency", "staff"], {"currency": since, "staff": None})
+        assert result == {
+            "currency": (2, datetime.datetime(2023, 3, 1)),
+            "staff": (2, datetime.datetime(2022, 11, 3, 10)),
+        }
+        assert result["currency"][0] == len(get_data("currency", since))
+
+    def test_probe_without_changes(self, seeded_db):
+        result = probe_changes(["currency"], {"currency": datetime.datetime(2024, 1, 1)})
+        assert result == {"currency": (0, None)}
+
+
+class TestTypedGetData:
+    def test_typed_rows_have_only_requested_columns(self, db):
+        result = get_data("currency", None, ["currency_id", "currency_code"])
+        for currency in result:
+            assert list(currency) == ["currency_id", "currency_code"]
+
+    @patch("src.extract_lambda.utils.close_db_connection")
+    @patch("src.extract_lambda.utils.create_conn")
+    def test_typed_query_selects_columns(self, conn_mock, close_mock):
+        conn_mock.return_value.run.return_value = [[1, "GBP"]]
+        result = get_data("currency", None, ["currency_id", "currency_code"])
+        assert result == [{"currency_id": 1, "currency_code": "GBP"}]
+        query = conn_mock.return_value.run.call_args.args[0]
+        assert query == "SELECT currency_id, currency_code FROM currency ORDER BY currency_id"
+
+    def test_typed_rows_are_seeded_values_in_key_order(self, seeded_db):
+        result = get_data("currency", None, ["currency_id", "currency_code", "last_updated"])
+        assert result == [
+            {"currency_id": 1, "currency_code": "GBP", "last_updated": datetime.datetime(2022, 1, 1)},
+            {"currency_id": 2, "currency_code": "USD", "last_updated": datetime.datetime(2022, 11, 1)},
+            {"currency_id": 3, "currency_code": "EUR", "last_updated": datetime.datetime(2023, 3, 1)},
+        ]
+
+    def test_typed_rows_within_window(self, seeded_db):
+        result = get_data("currency", datetime.datetime(2022, 1, 1), ["currency_id"],
+                          until=datetime.datetime(2022, 12, 31))
+        assert result == [{"currency_id": 2}]
+
+    def test_json_rows_match_typed_rows(self, seeded_db):
+        typed = get_data("staff", None, ["staff_id", "email_address"])
+        rows = get_data("staff", None)
+        assert [row["staff_id"] for row in rows] == [1, 2]
+        assert [{key: row[key] for key in ["staff_id", "email_address"]} for row in rows] == typed
+
+
 class TestPutObject:
     def test_put_object_successfully(self, s3_client):
         data = [{"test": 1}]
@@ -80,6 +186,42 @@ class TestPutObject:
         objects = s3_client.get_object(Bucket="test-bucket", Key="my_table/2024/11/12/11-52-my_table.json")
         assert objects["Body"].read().decode("utf-8") == '[{"test": 1}]'
 
+    def test_put_typed_rows_as_parquet(self, s3_client):
+        data = [{"currency_id": 1, "unit_price": Decimal("3.94"),
+                 "created_at": datetime.datetime(2022, 11, 3, 14, 20, 49, 962000)}]
+        put_object(s3_client, data, "my_table", "test-bucket",
+                   datetime.datetime(2024, 11, 12, 11, 52), "parquet")
+        key = "my_table/2024/11/12/11-52-my_table.parquet"
+        body = s3_client.get_object(Bucket="test-bucket", Key=key)["Body"].read()
+        assert pq.read_table(io.BytesIO(body)).to_pylist() == data
+
+
+class TestRemoveUnchangedRows:
+    def test_all_rows_kept_when_nothing_seen(self):
+        data = [{"id": i} for i in range(3)]
+        rows, hashes = remove_unchanged_rows(data, set())
+        assert rows == data
+        assert len(hashes) == 2
+
+    def test_identical_payload_is_skipped(self):
+        data = [{"id": i} for i in range(3)]
+        _, hashes = remove_unchanged_rows(data, set())
+        assert remove_unchanged_rows(data, set(hashes)) == ([], [])
+
+    def test_only_changed_batches_are_kept(self, monkeypatch):
+        monkeypatch.setattr("src.extract_lambda.utils.ROW_BATCH_SIZE", 2)
+        data = [{"id": i} for i in range(4)]
+        _, hashes = remove_unchanged_rows(data, set())
+        changed = data[:2] + [{"id": 2}, {"id": 30}]
+        rows, new_hashes = remove_unchanged_rows(changed, set(hashes))
+        assert rows == [{"id": 2}, {"id": 30}]
+        assert len(new_hashes) == 2
+
+    def test_typed_rows_are_hashed(self):
+        data = [{"id": 1, "created_at": datetime.datetime(2022, 11, 3), "price": Decimal("3.94")}]
+        _, hashes = remove_unchanged_rows(data, set())
+        assert remove_unchanged_rows(data, set(hashes)) == ([], [])
+
 
 @mock_aws
 class TestGetBucketName:
@@ -0,0 +1,65 @@
+from src.common.warehouse_schema import (
+    INDEXES,
+    FOREIGN_KEYS,
+    PRIMARY_KEYS,
+    create_indexes,
+    drop_indexes,
+    analyze,
+)
+from src.db.connection import connect_to_test_db
+from src.db.seed import seed_db
+import pytest
+
+
+@pytest.fixture(scope="function")
+def db():
+    seed_db()
+    db = connect_to_test_db()
+    yield db
+    db.close()
+
+
+def index_names(db, table):
+    rows = db.run("SELECT indexname FROM pg_indexes WHERE tablename = :table", table=table)
+    return {row[0] for row in rows}
+
+
+class TestWarehouseSchema:
+    def test_every_foreign_key_column_is_indexed(self):
+        for table, columns in FOREIGN_KEYS.items():
+            indexed = {column for index in INDEXES[table].values() for column in index}
+            assert set(columns) <= indexed
+
+    def test_foreign_keys_reference_primary_keys(self):
+        for columns in FOREIGN_KEYS.values():
+            for dimension, key in columns.values():
+                assert PRIMARY_KEYS[dimension] == key
+
+    def test_seed_creates_fact_indexes(self, db):
+        assert set(INDEXES["fact_sales_order"]) <= index_names(db, "fact_sales_order")
+
+    def test_drop_then_create_indexes(self, db):
+        drop_indexes(db, "fact_sales_order")
+        assert not set(INDEXES["fact_sales_order"]) & index_names(db, "fact_sales_order")
+        create_indexes(db, "fact_sales_order")
+        assert set(INDEXES["fact_sales_order"]) <= index_names(db, "fact_sales_order")
+
+    def test_drop_then_create_indexes_concurrently(self, db):
+        drop_indexes(db, "fact_sales_order", concurrently=True)
+        assert not set(INDEXES["fact_sales_order"]) & index_names(db, "fact_sales_order")
+        create_indexes(db, "fact_sales_order", concurrently=True)
+        valid = db.run("SELECT bool_and(indisvalid) FROM pg_index "
+                       "WHERE indrelid = 'fact_sales_order'::regclass")
+        assert set(INDEXES["fact_sales_order"]) <= index_names(db, "fact_sales_order")
+        assert valid[0][0] is True
+
+    def test_seed_with_foreign_keys(self, db):
+        seed_db(foreign_keys=True)
+        rows = db.run("SELECT conname FROM pg_constraint "
+                      "WHERE conrelid = 'fact_sales_order'::regclass AND contype = 'f'")
+        assert len(rows) == len(FOREIGN_KEYS["fact_sales_order"])
+
+    def test_analyze_updates_statistics(self, db):
+        analyze(db, "dim_currency")
+        rows = db.run("SELECT last_analyze FROM pg_stat_user_tables WHERE relname = 'dim_currency'")
+        assert rows[0][0] is not None